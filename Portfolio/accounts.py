@@ -0,0 +1,105 @@
+# accounts.py
+import zlib, asyncio
+from typing import Optional, Dict, Any, List, Iterator
+
+from trade_stats import TradeStats
+from trade_index import TradeIndex
+from live_stream import EventHub
+from equity_series import EquitySeries
+
+DEFAULT_ACCOUNT = "default"   # records that name no account (legacy single-terminal setups)
+
+
+def account_id(login: Any, server: Any = None) -> Optional[str]:
+    """'<login>@<server>' (or just '<login>'), the key every per-account store uses."""
+    if login is None or str(login).strip() == "":
+        return None
+    login = str(login).strip()
+    return f"{login}@{str(server).strip()}" if server else login
+
+def shard_of(account: str, shards: int) -> int:
+    """Stable across processes and restarts (unlike hash())."""
+    return zlib.crc32(account.encode("utf-8")) % shards if shards > 1 else 0
+
+
+class AccountState:
+    """Everything the backend knows about one trading account, behind its own lock."""
+
+    def __init__(self, account: str, equity_raw_max: int = 200000, equity_rollups: Optional[Dict[int, int]] = None,
+                 stream_backlog: int = 1000, stream_max_pending: int = 500):
+        self.id = account
+        self.lock = asyncio.Lock()
+        self.latest_equity: Dict[str, Any] = {"is_trade_active": False}
+        self.latest_account: Dict[str, Any] = {}
+        self.latest_account_seen_ts: Optional[float] = None
+        self.history_by_posid: Dict[str, Dict[str, Any]] = {}   # ENTRY orders, deduped by position_id
+        self.last_history_seen_ts: Optional[float] = None
+        self.trade_stats = TradeStats()     # running aggregates over history_by_posid
+        self.trade_index = TradeIndex()     # history_by_posid keys ordered by time_done + collection ETag
+        self.equity_series = EquitySeries(raw_max=equity_raw_max, rollups=equity_rollups)
+        self.event_hub = EventHub(backlog=stream_backlog, max_pending=stream_max_pending)
+
+    def summary(self) -> Dict[str, Any]:
+        acc = self.latest_account
+        return {
+            "account": self.id,
+            "login": acc.get("account_login"),
+            "server": acc.get("server"),
+            "name": acc.get("name"),
+            "currency": acc.get("currency"),
+            "trades": len(self.history_by_posid),
+            "equity_samples": len(self.equity_series),
+            "is_trade_active": bool(self.latest_equity.get("is_trade_active")),
+            "account_seen_ts": self.latest_account_seen_ts,
+            "history_seen_ts": self.last_history_seen_ts,
+        }
+
+
+class AccountRegistry:
+    """
+    AccountState per account id, created on first ingest. With `shards` > 1 each
+    backend process owns the accounts whose shard_of() equals its `shard_index`
+    (a proxy routes on the same hash); owns() tells a process to refuse the rest.
+    """
+
+    def __init__(self, shards: int = 1, shard_index: int = 0, **state_opts):
+        self.shards = max(1, shards)
+        self.shard_index = shard_index
+        self.state_opts = state_opts
+        self._accounts: Dict[str, AccountState] = {}
+        self._empty: Optional[AccountState] = None
+
+    def __len__(self) -> int:
+        return len(self._accounts)
+
+    def __iter__(self) -> Iterator[AccountState]:
+        return iter(list(self._accounts.values()))
+
+    def ids(self) -> List[str]:
+        return sorted(self._accounts)
+
+    def owns(self, account: str) -> bool:
+        return shard_of(account, self.shards) == self.shard_index
+
+    def get(self, account: str) -> Optional[AccountState]:
+        return self._accounts.get(account)
+
+    def get_or_create(self, account: str) -> AccountState:
+        st = self._accounts.get(account)
+        if st is None:
+            st = self._accounts[account] = AccountState(account, **self.state_opts)
+        return st
+
+    def find(self, ref: str) -> Optional[AccountState]:
+        """Exact account id, or a bare login when exactly one server uses it."""
+        ref = ref.strip()
+        if ref in self._accounts:
+            return self._accounts[ref]
+        hits = [st for aid, st in self._accounts.items() if aid.split("@", 1)[0] == ref]
+        return hits[0] if len(hits) == 1 else None
+
+    def empty(self) -> AccountState:
+        """Shared read-only stand-in for an account that has sent nothing yet."""
+        if self._empty is None:
+            self._empty = AccountState("", **self.state_opts)
+        return self._empty
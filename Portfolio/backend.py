@@ -1,35 +1,90 @@
 # backend.py
-import os, json, time, hashlib
-from typing import Optional, Dict, Any
+import os, sys, json, time, zlib, hashlib, asyncio, subprocess
+from typing import Optional, Dict, Any, List, Tuple
+from datetime import datetime, timezone
 from collections import deque
-from fastapi import FastAPI, Header, HTTPException, Request, Query
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request, Query, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 
+from log_writer import AsyncLogWriter
+from trade_stats import as_float
+from state_store import StateStore
+from accounts import AccountRegistry, AccountState, DEFAULT_ACCOUNT, account_id, shard_of
+from live_stream import EventHub
+
 API_KEY = os.getenv("API_KEY", "dev-key")
 ALLOW_ORIGINS = ["*"]
 LOG_JSONL = os.getenv("LOG_JSONL", "").strip()
+LOG_STDOUT = os.getenv("LOG_STDOUT", "1") == "1"                 # echo ingest rows as [INGEST] lines
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))         # rows buffered before dropping
+LOG_FLUSH_LINES = int(os.getenv("LOG_FLUSH_LINES", "500"))       # flush when a batch reaches N rows
+LOG_FLUSH_SECS = float(os.getenv("LOG_FLUSH_SECS", "1.0"))       # ... or after N seconds
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))  # rotate LOG_JSONL at this size; 0 = never
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "5"))
 
 ACCOUNT_TTL_SECS = int(os.getenv("ACCOUNT_TTL_SECS", "600"))   # account snapshot staleness window
 HISTORY_TTL_SECS = int(os.getenv("HISTORY_TTL_SECS", "0"))     # 0 = never stale; >0 = stale after N secs
-
-app = FastAPI(title="Code-to-Cash Live API")
+INGEST_MAX_BYTES = int(os.getenv("INGEST_MAX_BYTES", str(16 * 1024 * 1024)))  # /ingest/batch limit, after gunzip
+
+SHARDS = int(os.getenv("SHARDS", "1"))                 # backend processes splitting the accounts between them
+SHARD_INDEX = int(os.getenv("SHARD_INDEX", "0"))       # which of them this process is
+PORT = int(os.getenv("PORT", "8000"))                  # the shard router listens here, shard i on PORT + 1 + i
+
+STATE_DB = os.getenv("STATE_DB", "ctc_state.sqlite3").strip()  # SQLite (WAL) state file; "" = memory only
+STATE_FLUSH_SECS = float(os.getenv("STATE_FLUSH_SECS", "0.5"))  # batch window for state writes
+if STATE_DB and SHARDS > 1:
+    STATE_DB = f"{STATE_DB}.shard{SHARD_INDEX}"                 # one file per shard: no cross-process writers
+
+EQUITY_RAW_MAX = int(os.getenv("EQUITY_RAW_MAX", "200000"))      # raw equity samples kept per account (~11 days at 5 s)
+EQUITY_1M_MAX = int(os.getenv("EQUITY_1M_MAX", str(60 * 1440)))  # 1-minute bars kept (60 days)
+EQUITY_1H_MAX = int(os.getenv("EQUITY_1H_MAX", str(5 * 8760)))   # 1-hour bars kept (5 years)
+EQUITY_1D_MAX = int(os.getenv("EQUITY_1D_MAX", "36500"))         # 1-day bars kept
+
+STREAM_BACKLOG = int(os.getenv("STREAM_BACKLOG", "1000"))         # events kept for resuming clients
+STREAM_MAX_PENDING = int(os.getenv("STREAM_MAX_PENDING", "500"))  # undelivered keys per client before a reset
+STREAM_PING_SECS = float(os.getenv("STREAM_PING_SECS", "15"))     # keep-alive on idle streams
+
+log_writer = AsyncLogWriter(LOG_JSONL, queue_max=LOG_QUEUE_MAX, flush_lines=LOG_FLUSH_LINES,
+                            flush_secs=LOG_FLUSH_SECS, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                            echo=LOG_STDOUT)
+
+EQUITY_ROLLUPS = {60: EQUITY_1M_MAX, 3600: EQUITY_1H_MAX, 86400: EQUITY_1D_MAX}
+_LAUNCHER = __name__ == "__main__" and SHARDS > 1 and "SHARD_INDEX" not in os.environ   # only spawns the shards
+state_store = StateStore(STATE_DB, flush_secs=STATE_FLUSH_SECS,
+                         equity_keep={0: EQUITY_RAW_MAX, **EQUITY_ROLLUPS}) if STATE_DB and not _LAUNCHER else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if state_store:
+        _warm_start(state_store.load())
+        state_store.start()
+    log_writer.start()
+    yield
+    await log_writer.stop()
+    if state_store:
+        await state_store.stop()
+
+app = FastAPI(title="Code-to-Cash Live API", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOW_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Account", "X-Shard"],   # lets the dashboard send If-None-Match
 )
 
 # -------- Stores --------
-latest_equity: Dict[str, Any] = {"is_trade_active": False}
+# Everything per account: equity, account_info, trade history (ENTRY orders, deduped by
+# position_id), running stats, trade index, equity series and the change-event hub.
+accounts = AccountRegistry(shards=SHARDS, shard_index=SHARD_INDEX,
+                           equity_raw_max=EQUITY_RAW_MAX, equity_rollups=EQUITY_ROLLUPS,
+                           stream_backlog=STREAM_BACKLOG, stream_max_pending=STREAM_MAX_PENDING)
 
-latest_account: Dict[str, Any] = {}
-latest_account_seen_ts: Optional[float] = None
-
-# Trade history (ENTRY orders only), deduped by position_id
-history_by_posid: Dict[str, Dict[str, Any]] = {}
-last_history_seen_ts: Optional[float] = None
+# Last account each client host announced, for EAs that post without an X-Account header
+client_accounts: Dict[str, str] = {}
 
 ingest_log: deque[Dict[str, Any]] = deque(maxlen=100)
 
@@ -43,103 +98,178 @@ def _now_iso() -> str:
 
 def _log_row(row: Dict[str, Any]) -> None:
     ingest_log.append(row)
-    print("[INGEST]", json.dumps(row, ensure_ascii=False))
-    if LOG_JSONL:
-        try:
-            with open(LOG_JSONL, "a", encoding="utf-8") as f:
-                f.write(json.dumps(row, ensure_ascii=False) + "\n")
-        except Exception as e:
-            print("[LOG_FILE_ERROR]", str(e))
+    log_writer.put(row)   # stdout / LOG_JSONL are written in batches by the background writer
+    if state_store:
+        state_store.put_ingest(row)
+
+def _persist_kv(acct: AccountState, name: str, value: Any, seen_ts: Optional[float] = None) -> None:
+    if state_store:
+        state_store.put_kv(acct.id, name, value, seen_ts)
+
+def _restore_account(acct: AccountState, state: Dict[str, Any]) -> None:
+    acct.history_by_posid.update(state["trades"])
+    acct.trade_stats.reset()
+    for row in acct.history_by_posid.values():
+        acct.trade_stats.add(row)
+    acct.trade_index.rebuild(acct.history_by_posid)
+    kv = state["kv"]
+    if "account" in kv:
+        acct.latest_account, acct.latest_account_seen_ts = kv["account"][0] or {}, kv["account"][1]
+    if "equity" in kv and kv["equity"][0]:
+        acct.latest_equity.clear(); acct.latest_equity.update(kv["equity"][0])
+    if "history_seen" in kv:
+        acct.last_history_seen_ts = kv["history_seen"][1]
+    eq = state["equity"]
+    acct.equity_series.restore(eq["raw"], eq["bars"], kv["equity_first_t"][1] if "equity_first_t" in kv else None)
+
+def _warm_start(state: Dict[str, Any]) -> None:
+    """Rebuild the in-memory stores from the state DB, so a restart needs no EA resend."""
+    t0 = time.perf_counter()
+    saved = state["accounts"]
+    if "" in saved:
+        # rows from before accounts existed: file them under the login they came from
+        acc = (saved[""]["kv"].get("account") or ({}, None))[0] or {}
+        aid = account_id(acc.get("account_login"), acc.get("server")) or DEFAULT_ACCOUNT
+        state_store.rename_account("", aid)
+        saved = state_store.load()["accounts"]
+    for aid, st in saved.items():
+        if accounts.owns(aid):
+            _restore_account(accounts.get_or_create(aid), st)
+    ingest_log.extend(state["ingest"])
+    print(f"[STATE] warm start from {STATE_DB}: {len(accounts)} accounts, "
+          f"{sum(len(a.history_by_posid) for a in accounts)} trades, "
+          f"{sum(len(a.equity_series) for a in accounts)} equity samples in {(time.perf_counter() - t0) * 1e3:.1f} ms")
 
 def _round2(v):
     if v is None: return None
     try: return round(float(v), 2)
     except Exception: return None
 
+def _parse_ts(v) -> Optional[float]:
+    """Epoch seconds from a number or an ISO-8601 string (naive = UTC); None if unparseable."""
+    if v is None or isinstance(v, bool):
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    s = str(v).strip()
+    try:
+        return float(s)
+    except ValueError:
+        pass
+    try:
+        d = datetime.fromisoformat(s)
+    except ValueError:
+        return None
+    return (d if d.tzinfo else d.replace(tzinfo=timezone.utc)).timestamp()
+
+def _record_equity(acct: AccountState, eq: Dict[str, Any]) -> None:
+    """Append an equity_curve sample to the account's series (and the state DB)."""
+    v = as_float(eq.get("current_equity"))
+    if v is None:
+        return
+    t = _parse_ts(eq.get("t"))
+    t = t if t is not None else time.time()
+    first = acct.equity_series.first_t is None
+    if not acct.equity_series.append(t, v):
+        return
+    if state_store:
+        state_store.put_equity(acct.id, t, v, acct.equity_series.last_bars())
+        if first:
+            state_store.put_kv(acct.id, "equity_first_t", None, acct.equity_series.first_t)
+
 def _hash_rev(obj: Dict[str, Any]) -> str:
     """Stable revision hash so the UI can skip no-op updates."""
     blob = json.dumps(obj, sort_keys=True, ensure_ascii=False).encode("utf-8")
     return hashlib.sha1(blob).hexdigest()
 
-def _compute_basic_stats() -> Dict[str, Any]:
-    # account
-    equity  = None
-    balance = None
-    if latest_account:
-        try:
-            equity  = float(latest_account.get("equity"))   if latest_account.get("equity")   is not None else None
-        except Exception:
-            equity = None
-        try:
-            balance = float(latest_account.get("balance"))  if latest_account.get("balance")  is not None else None
-        except Exception:
-            balance = None
-
-    # trades
-    trades  = list(history_by_posid.values())
-    profits = []
-    lots_sum = 0.0
-
-    for t in trades:
-        # profit may be None if still open; skip Nones
-        p = t.get("profit")
-        if p is not None:
-            try:
-                profits.append(float(p))
-            except Exception:
-                pass
-        v = t.get("volume_initial")
-        if v is not None:
-            try:
-                lots_sum += float(v)
-            except Exception:
-                pass
-
-    wins   = [p for p in profits if p > 0]
-    losses = [p for p in profits if p < 0]
-    decisive = len(wins) + len(losses)
-
-    win_rate       = (100.0 * len(wins) / decisive) if decisive else None
-    average_profit = (sum(wins) / len(wins)) if wins else 0.0
-    # return average_loss as a NEGATIVE number (mean of losses)
-    average_loss   = (sum(losses) / len(losses)) if losses else 0.0
+def _equity_view(acct: AccountState) -> Dict[str, Any]:
+    """Payload of /api/live/equity (also pushed as the 'equity' stream event)."""
+    latest_equity = acct.latest_equity
+    data = {"is_trade_active": bool(latest_equity.get("is_trade_active"))}
 
-    # average_rrr needs a per-trade risk amount; keep None for now
-    average_rrr = None
+    # Include timestamp and a derived date (YYYY-MM-DD) when available
+    ts = latest_equity.get("ts")
+    if ts:
+        data["ts"] = ts
+        # robustly derive the date part even if ts has microseconds
+        data["trade_date"] = ts.split("T", 1)[0]
 
-    return {
-        "equity": round(equity, 2) if equity is not None else None,
-        "balance": round(balance, 2) if balance is not None else None,
-        "win_rate": round(win_rate, 2) if win_rate is not None else None,
-        "average_profit": round(average_profit, 2),
-        "average_loss": round(average_loss, 2),
-        "number_of_trades": len(trades),
-        "lots": round(lots_sum, 2),
-        "average_rrr": average_rrr,
-        # intentionally excluding: sharpe_ratio, expectancy, profit_factor
-    }
+    if data["is_trade_active"]:
+        data.update({
+            "profit": latest_equity.get("profit"),
+            "current_equity": latest_equity.get("current_equity"),
+        })
+    return data
+
+def _compute_basic_stats(acct: AccountState) -> Dict[str, Any]:
+    """O(1): account numbers plus the running trade aggregates."""
+    latest_account = acct.latest_account
+    equity = as_float(latest_account.get("equity")) if latest_account else None
+    balance = as_float(latest_account.get("balance")) if latest_account else None
+    return acct.trade_stats.snapshot(equity, balance)
+
+# -------- Account routing --------
+def _wrong_shard(account: str) -> HTTPException:
+    owner = shard_of(account, SHARDS)
+    return HTTPException(status_code=421, detail=f"account {account} belongs to shard {owner}",
+                         headers={"X-Shard": str(owner), "X-Account": account})
+
+def _ingest_account(x_account: Optional[str], records: List[Any], client: str) -> AccountState:
+    """
+    The account an ingest belongs to: the X-Account header, else the login/server of
+    an account_info record in it, else whatever account this client host last sent.
+    """
+    aid = x_account.strip() if x_account and x_account.strip() else None
+    if aid is None:
+        for rec in records:
+            acc = rec.get("account_info") if isinstance(rec, dict) else None
+            if isinstance(acc, dict):
+                aid = account_id(acc.get("account_login"), acc.get("server"))
+                if aid:
+                    client_accounts[client] = aid
+                    break
+    aid = aid or client_accounts.get(client) or DEFAULT_ACCOUNT
+    if not accounts.owns(aid):
+        raise _wrong_shard(aid)
+    return accounts.get_or_create(aid)
+
+def _read_account(account: Optional[str], x_account: Optional[str], client: Optional[str] = None) -> AccountState:
+    """
+    The account a read is scoped to: ?account= or X-Account (an id or a bare login),
+    else the client's own account (EA handshakes), else the only account there is.
+    Unknown accounts read as empty, so the handshakes answer needs=true.
+    """
+    ref = (account or x_account or "").strip()
+    if not ref and client and client in client_accounts:
+        ref = client_accounts[client]
+    if ref:
+        acct = accounts.find(ref)
+        if acct is not None:
+            return acct
+        if not accounts.owns(ref):
+            raise _wrong_shard(ref)
+        return accounts.empty()
+    if len(accounts) == 1:
+        return next(iter(accounts))
+    if not len(accounts):
+        return accounts.empty()
+    raise HTTPException(status_code=400, detail={"error": "account_required", "accounts": accounts.ids()})
+
+def _client(request: Request) -> str:
+    return request.client.host if request.client else "?"
 
 
 # -------- Ingest --------
-@app.post("/ingest/snapshot")
-async def ingest_snapshot(request: Request, x_api_key: Optional[str] = Header(None)):
-    global latest_account, latest_account_seen_ts, last_history_seen_ts  # declare once, before any assignment
-
-    _require_key(x_api_key)
-
-    raw = await request.body()
-    text = raw.decode("utf-8", errors="ignore").replace("\x00", "").strip()  # strip MT5 nulls
-    client = request.client.host if request.client else "?"
-
-    if not text:
-        _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "empty"})
-        return {"ok": False, "error": "empty_body"}
-
-    try:
-        payload = json.loads(text)
-    except json.JSONDecodeError as e:
-        _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "invalid_json", "preview": text[:300]})
-        return {"ok": False, "error": "invalid_json", "detail": str(e)}
+def _apply_record(acct: AccountState, payload: Dict[str, Any], client: str,
+                  stats_event: bool = True) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    Apply one EA record (equity_curve / account_info / history_orders_header /
+    history_order / history_orders_footer) to an account's stores. Returns (error
+    response or None, whether the stats changed); with stats_event=False the caller
+    publishes the 'stats' event itself, once per batch.
+    """
+    latest_equity, hub = acct.latest_equity, acct.event_hub
+    stats_changed = False
 
     # --- equity (minimal live)
     eq = payload.get("equity_curve")
@@ -151,8 +281,10 @@ async def ingest_snapshot(request: Request, x_api_key: Optional[str] = Header(No
                 current_equity = float(eq.get("current_equity")) if eq.get("current_equity") is not None else None
             except Exception:
                 latest_equity.clear(); latest_equity.update({"is_trade_active": False})
-                _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "malformed_numbers"})
-                return {"ok": False, "error": "malformed_numbers"}
+                _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": False, "why": "malformed_numbers"})
+                hub.publish("equity", _equity_view(acct))
+                _persist_kv(acct, "equity", dict(latest_equity))
+                return {"ok": False, "error": "malformed_numbers"}, False
             latest_equity.clear()
             latest_equity.update({
                 "profit": profit,
@@ -160,35 +292,45 @@ async def ingest_snapshot(request: Request, x_api_key: Optional[str] = Header(No
                 "is_trade_active": True,
                 "ts": eq.get("t"),
             })
-            _log_row({"ts": _now_iso(), "client": client, "ok": True, "active": True,
+            _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": True, "active": True,
                       "profit": profit, "equity": current_equity})
         else:
             latest_equity.clear(); latest_equity.update({"is_trade_active": False, "ts": eq.get("t")})
-            _log_row({"ts": _now_iso(), "client": client, "ok": True, "active": False})
+            _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": True, "active": False})
+        hub.publish("equity", _equity_view(acct))
+        _persist_kv(acct, "equity", dict(latest_equity))
+        _record_equity(acct, eq)
 
-    # --- account_info (store globally, no login keys)
+    # --- account_info (stored as-is, per account)
     acc = payload.get("account_info")
     if isinstance(acc, dict):
-        latest_account = dict(acc)  # store as-is for UI fidelity
-        latest_account_seen_ts = time.time()
-        _log_row({"ts": _now_iso(), "client": client, "ok": True, "account_info": True})
+        changed = acc != acct.latest_account
+        acct.latest_account = dict(acc)  # store as-is for UI fidelity
+        acct.latest_account_seen_ts = time.time()
+        _persist_kv(acct, "account", acct.latest_account, acct.latest_account_seen_ts)
+        if changed:
+            hub.publish("account", acct.latest_account)
+            stats_changed = True
+        _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": True, "account_info": True})
 
     # --- trade history ingestion (ENTRY orders only)
     hdr = payload.get("history_orders_header")
     if isinstance(hdr, dict):
-        last_history_seen_ts = time.time()
-        _log_row({"ts": _now_iso(), "client": client, "ok": True, "history_header": True,
+        acct.last_history_seen_ts = time.time()
+        _persist_kv(acct, "history_seen", None, acct.last_history_seen_ts)
+        _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": True, "history_header": True,
                   "from": hdr.get("from"), "to": hdr.get("to"), "count": hdr.get("count")})
 
     ho = payload.get("history_order")
     if isinstance(ho, dict):
-        last_history_seen_ts = time.time()
+        acct.last_history_seen_ts = time.time()
+        _persist_kv(acct, "history_seen", None, acct.last_history_seen_ts)
 
         # We dedupe by position_id (fallback to ticket if missing)
         pos_id = ho.get("position_id")
         ticket = ho.get("ticket")
         if pos_id is None and ticket is None:
-            _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "history_missing_ids"})
+            _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": False, "why": "history_missing_ids"})
         else:
             key = str(pos_id if pos_id is not None else ticket)
 
@@ -212,88 +354,356 @@ async def ingest_snapshot(request: Request, x_api_key: Optional[str] = Header(No
             }
             rev = _hash_rev(row_core)
 
-            existing = history_by_posid.get(key)
+            existing = acct.history_by_posid.get(key)
             if not existing or existing.get("rev") != rev:
                 row = dict(row_core)
                 row["rev"] = rev
                 row["updated_at"] = _now_iso()
-                history_by_posid[key] = row
-                _log_row({"ts": _now_iso(), "client": client, "ok": True,
+                acct.history_by_posid[key] = row
+                acct.trade_stats.replace(existing, row)   # retract the old revision, add the new one
+                acct.trade_index.upsert(key, existing, row)
+                if state_store:
+                    state_store.put_trade(acct.id, key, row)
+                hub.publish("trade", row, key)
+                stats_changed = True
+                _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": True,
                           "history_order": True, "position_id": pos_id, "rev_changed": True})
 
     ft = payload.get("history_orders_footer")
     if ft is True or isinstance(ft, dict):
-        _log_row({"ts": _now_iso(), "client": client, "ok": True, "history_footer": True})
+        _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": True, "history_footer": True})
 
-    return {"ok": True}
+    if stats_changed and stats_event:
+        hub.publish("stats", _compute_basic_stats(acct))
+    return None, stats_changed
 
-# -------- Public endpoints --------
-@app.get("/api/live/equity")
-async def get_equity():
-    data = {"is_trade_active": bool(latest_equity.get("is_trade_active"))}
+@app.post("/ingest/snapshot")
+async def ingest_snapshot(request: Request, response: Response, x_api_key: Optional[str] = Header(None),
+                          x_account: Optional[str] = Header(None)):
+    _require_key(x_api_key)
 
-    # Include timestamp and a derived date (YYYY-MM-DD) when available
-    ts = latest_equity.get("ts")
-    if ts:
-        data["ts"] = ts
-        # robustly derive the date part even if ts has microseconds
-        data["trade_date"] = ts.split("T", 1)[0]
+    raw = await request.body()
+    text = raw.decode("utf-8", errors="ignore").replace("\x00", "").strip()  # strip MT5 nulls
+    client = _client(request)
 
-    if data["is_trade_active"]:
-        data.update({
-            "profit": latest_equity.get("profit"),
-            "current_equity": latest_equity.get("current_equity"),
-        })
+    if not text:
+        _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "empty"})
+        return {"ok": False, "error": "empty_body"}
 
-    return {"ok": True, "data": data}
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "invalid_json", "preview": text[:300]})
+        return {"ok": False, "error": "invalid_json", "detail": str(e)}
+    if not isinstance(payload, dict):
+        _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "not_an_object"})
+        return {"ok": False, "error": "not_an_object"}
+
+    acct = _ingest_account(x_account, [payload], client)
+    response.headers["X-Account"] = acct.id     # lets the shard router learn bare logins
+    async with acct.lock:
+        err, _ = _apply_record(acct, payload, client)
+    return err or {"ok": True}
+
+def _batch_body(raw: bytes, content_encoding: Optional[str]) -> bytes:
+    """Request body, gunzipped when sent with Content-Encoding: gzip (or gzip magic bytes)."""
+    if (content_encoding or "").strip().lower() in ("gzip", "x-gzip") or raw[:2] == b"\x1f\x8b":
+        d = zlib.decompressobj(wbits=31)
+        try:
+            out = d.decompress(raw, INGEST_MAX_BYTES + 1)
+        except zlib.error as e:
+            raise HTTPException(status_code=400, detail=f"invalid gzip body: {e}")
+        if len(out) > INGEST_MAX_BYTES or d.unconsumed_tail:
+            raise HTTPException(status_code=413, detail=f"batch larger than {INGEST_MAX_BYTES} bytes")
+        return out
+    if len(raw) > INGEST_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"batch larger than {INGEST_MAX_BYTES} bytes")
+    return raw
+
+def _batch_records(text: str) -> List[Tuple[int, Any]]:
+    """[(line, record)] from a JSON array, a single object or NDJSON; bad lines become (line, error str)."""
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except json.JSONDecodeError as e:
+            return [(0, f"invalid_json: {e}")]
+        return list(enumerate(items, 1))
+    out = []
+    for n, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            out.append((n, json.loads(line)))
+        except json.JSONDecodeError as e:
+            out.append((n, f"invalid_json: {e}"))
+    return out
+
+def _decode_batch(raw: bytes, content_encoding: Optional[str]) -> Tuple[int, List[Tuple[int, Any]]]:
+    body = _batch_body(raw, content_encoding)
+    text = body.decode("utf-8", errors="ignore").replace("\x00", "").strip()
+    return len(body), (_batch_records(text) if text else [])
+
+@app.post("/ingest/batch")
+async def ingest_batch(request: Request, response: Response, x_api_key: Optional[str] = Header(None),
+                       x_account: Optional[str] = Header(None),
+                       content_encoding: Optional[str] = Header(None)):
+    """
+    Many EA records in one request: NDJSON (one record per line) or a JSON array,
+    optionally gzip-compressed. Records are applied in order exactly as
+    /ingest/snapshot would; the stats event is published once for the whole batch.
+    """
+    _require_key(x_api_key)
 
+    client = _client(request)
+    # gunzip + JSON parsing off the event loop, so other accounts keep being served meanwhile
+    size, records = await asyncio.to_thread(_decode_batch, await request.body(), content_encoding)
+    if not records:
+        _log_row({"ts": _now_iso(), "client": client, "ok": False, "why": "empty"})
+        return {"ok": False, "error": "empty_body"}
+
+    acct = _ingest_account(x_account, [rec for _, rec in records], client)
+    response.headers["X-Account"] = acct.id
+    applied, errors, stats_changed = 0, [], False
+    async with acct.lock:
+        for n, rec in records:
+            if isinstance(rec, str):
+                errors.append({"line": n, "error": rec})
+                continue
+            if not isinstance(rec, dict):
+                errors.append({"line": n, "error": "not_an_object"})
+                continue
+            err, changed = _apply_record(acct, rec, client, stats_event=False)
+            stats_changed |= changed
+            if err:
+                errors.append({"line": n, "error": err["error"]})
+            else:
+                applied += 1
+        if stats_changed:
+            acct.event_hub.publish("stats", _compute_basic_stats(acct))
+    _log_row({"ts": _now_iso(), "client": client, "account": acct.id, "ok": not errors, "batch": True,
+              "records": applied + len(errors), "bytes": size, "errors": len(errors)})
+    return {"ok": not errors, "account": acct.id, "records": applied + len(errors),
+            "applied": applied, "errors": errors[:20]}
+
+# -------- Public endpoints --------
+# Every /api/live/* read is scoped by ?account=<login@server or login> or an X-Account
+# header; with a single account on the backend both may be omitted.
+@app.get("/api/live/accounts")
+async def get_accounts():
+    """Accounts held by this backend (this shard, when sharded)."""
+    return {"ok": True, "shard": SHARD_INDEX, "shards": SHARDS,
+            "data": [a.summary() for a in sorted(accounts, key=lambda a: a.id)]}
+
+@app.get("/api/live/equity")
+async def get_equity(account: Optional[str] = Query(None), x_account: Optional[str] = Header(None)):
+    return {"ok": True, "data": _equity_view(_read_account(account, x_account))}
+
+@app.get("/api/live/equity/history")
+async def get_equity_history(from_: Optional[str] = Query(None, alias="from", description="epoch seconds or ISO-8601"),
+                             to: Optional[str] = Query(None, description="epoch seconds or ISO-8601"),
+                             points: int = Query(500, ge=2, le=10000),
+                             account: Optional[str] = Query(None), x_account: Optional[str] = Header(None)):
+    """
+    Equity curve between `from` and `to` (default: everything), downsampled with LTTB
+    to at most `points`. Long ranges are read from the 1m / 1h / 1d roll-ups; `t` is
+    epoch seconds, parallel to `equity`.
+    """
+    acct = _read_account(account, x_account)
+    t0, t1 = _parse_ts(from_), _parse_ts(to)
+    if (from_ is not None and t0 is None) or (to is not None and t1 is None):
+        raise HTTPException(status_code=400, detail="from/to must be epoch seconds or ISO-8601")
+    return {"ok": True, "data": acct.equity_series.query(t0, t1, points)}
 
 @app.get("/api/live/account")
-async def get_account():
-    if not latest_account:
+async def get_account(account: Optional[str] = Query(None), x_account: Optional[str] = Header(None)):
+    acct = _read_account(account, x_account)
+    if not acct.latest_account:
         return {"ok": False, "message": "no account_info yet"}
-    return {"ok": True, "data": latest_account}
+    return {"ok": True, "data": acct.latest_account}
 
 @app.get("/api/live/account/needs")
-async def needs_account():
+async def needs_account(request: Request, account: Optional[str] = Query(None),
+                        x_account: Optional[str] = Header(None)):
     """Returns True if backend doesn't have account_info or it's stale."""
-    if not latest_account or latest_account_seen_ts is None:
+    acct = _read_account(account, x_account, _client(request))
+    if not acct.latest_account or acct.latest_account_seen_ts is None:
         return {"ok": True, "needs": True, "reason": "missing"}
-    age = time.time() - latest_account_seen_ts
+    age = time.time() - acct.latest_account_seen_ts
     return {"ok": True, "needs": (age > ACCOUNT_TTL_SECS),
             "age_secs": int(age), "ttl_secs": ACCOUNT_TTL_SECS}
 
 # -------- Trades endpoints (for Lovable + EA handshake) --------
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+
 @app.get("/api/live/trades")
-async def get_trades():
-    """Normalized ENTRY orders, deduped by position_id, newest first."""
-    rows = list(history_by_posid.values())
-    rows.sort(key=lambda r: (r.get("time_done") or ""), reverse=True)
-    return {"ok": True, "count": len(rows), "data": rows}
+async def get_trades(limit: Optional[int] = Query(None, ge=1, le=1000),
+                     cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                     since: Optional[str] = Query(None, description="only rows with time_done > since"),
+                     account: Optional[str] = Query(None),
+                     if_none_match: Optional[str] = Header(None),
+                     x_account: Optional[str] = Header(None)):
+    """
+    Normalized ENTRY orders, deduped by position_id, newest first. Without parameters
+    the whole history is returned; `limit` + `cursor` page through it. Unchanged
+    polls (If-None-Match) get 304 with no body.
+    """
+    acct = _read_account(account, x_account)
+    etag = acct.trade_index.etag(acct.id, limit, cursor, since)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    try:
+        keys, next_cursor = acct.trade_index.page(limit, cursor, since)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = [acct.history_by_posid[k] for k in keys]
+    body = {"ok": True, "count": len(rows), "total": len(acct.trade_index), "data": rows, "next_cursor": next_cursor}
+    return JSONResponse(body, headers={"ETag": etag})
 
 @app.get("/api/live/trades/needs")
-async def needs_trades():
+async def needs_trades(request: Request, account: Optional[str] = Query(None),
+                       x_account: Optional[str] = Header(None)):
     """
     Ask EA to resend history when backend has none (and, optionally, when stale).
     Default: only ask when missing. Set HISTORY_TTL_SECS>0 to enable staleness.
     """
-    if not history_by_posid or last_history_seen_ts is None:
+    acct = _read_account(account, x_account, _client(request))
+    if not acct.history_by_posid or acct.last_history_seen_ts is None:
         return {"ok": True, "needs": True, "reason": "missing"}
     if HISTORY_TTL_SECS and HISTORY_TTL_SECS > 0:
-        age = time.time() - last_history_seen_ts
+        age = time.time() - acct.last_history_seen_ts
         return {"ok": True, "needs": (age > HISTORY_TTL_SECS),
                 "age_secs": int(age), "ttl_secs": HISTORY_TTL_SECS}
     return {"ok": True, "needs": False, "reason": "ok"}
 
 @app.get("/api/live/stats")
-async def get_stats():
-    return {"ok": True, "data": _compute_basic_stats()}
+async def get_stats(account: Optional[str] = Query(None), x_account: Optional[str] = Header(None)):
+    return {"ok": True, "data": _compute_basic_stats(_read_account(account, x_account))}
+
+# -------- Live stream --------
+def _sse(hub: EventHub, ev: Dict[str, Any]) -> str:
+    return f"id: {hub.event_id(ev)}\nevent: {ev['type']}\ndata: {json.dumps(ev, separators=(',', ':'))}\n\n"
+
+def _stream_account(account: Optional[str], x_account: Optional[str]) -> AccountState:
+    """Streams subscribe to an account that may not have posted yet, so it is created here."""
+    ref = (account or x_account or "").strip()
+    if ref:
+        acct = accounts.find(ref)
+        if acct is not None:
+            return acct
+        if not accounts.owns(ref):
+            raise _wrong_shard(ref)
+        return accounts.get_or_create(ref)
+    acct = _read_account(None, None)
+    return acct if acct.id else accounts.get_or_create(DEFAULT_ACCOUNT)
+
+@app.get("/api/live/stream")
+async def live_stream(since: Optional[int] = Query(None, ge=0, description="resume after this seq"),
+                      epoch: Optional[str] = Query(None, description="epoch `since` was seen in"),
+                      account: Optional[str] = Query(None),
+                      last_event_id: Optional[str] = Header(None),
+                      x_account: Optional[str] = Header(None)):
+    """
+    Server-sent events of one account: equity / account / trade / stats changes as
+    {seq, type, key, ts, data}, with `<epoch>-<seq>` event ids. EventSource resumes
+    by itself through Last-Event-ID; a `reset` event means the missed events are gone
+    (or the backend restarted) and the client should refetch the REST endpoints.
+    """
+    acct = _stream_account(account, x_account)
+    hub = acct.event_hub
+    if since is None and last_event_id:
+        since, epoch = hub.parse_event_id(last_event_id)
+    sub = hub.subscribe(since, epoch)
+
+    async def events():
+        try:
+            yield f"retry: 3000\n: epoch {hub.epoch} seq {hub.seq}\n\n"
+            while True:
+                batch = await sub.next_batch(STREAM_PING_SECS)
+                # the send below waits for a slow client; meanwhile its pending events coalesce
+                yield "".join(_sse(hub, ev) for ev in batch) if batch else ": ping\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no",
+                                      "X-Account": acct.id})
+
+@app.websocket("/api/live/ws")
+async def live_ws(ws: WebSocket, since: Optional[int] = None, epoch: Optional[str] = None,
+                  account: Optional[str] = None):
+    """
+    Same events as /api/live/stream, one JSON array per batch; `ping` frames when idle.
+    Pings carry the hub's `epoch`: resume with ?since=<seq>&epoch=<epoch>.
+    """
+    try:
+        acct = _stream_account(account, ws.headers.get("x-account"))
+    except HTTPException as e:
+        await ws.close(code=1008, reason=str(e.detail))
+        return
+    hub = acct.event_hub
+    await ws.accept()
+    sub = hub.subscribe(since, epoch)
+    try:
+        await ws.send_json([{"seq": hub.seq, "type": "ping", "epoch": hub.epoch}])
+        while True:
+            batch = await sub.next_batch(STREAM_PING_SECS)
+            await ws.send_json(batch or [{"seq": hub.seq, "type": "ping", "epoch": hub.epoch}])
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        hub.unsubscribe(sub)
 
 # -------- Debug (optional) --------
 @app.get("/debug/ingests")
 async def debug_ingests(n: int = Query(20, ge=1, le=100)):
     return {"ok": True, "data": list(ingest_log)[-n:]}
 
+@app.get("/debug/stream")
+async def debug_stream():
+    """Sequence, backlog and per-client coalescing counters of each account's live stream."""
+    return {"ok": True, "data": {a.id: a.event_hub.stats() for a in accounts}}
+
+@app.get("/debug/state")
+async def debug_state():
+    """Pending / flushed counts of the SQLite state store."""
+    return {"ok": True, "data": state_store.stats() if state_store else None}
+
+@app.get("/debug/equity")
+async def debug_equity():
+    """Sizes of each account's raw equity ring and its roll-ups."""
+    return {"ok": True, "data": {a.id: a.equity_series.stats() for a in accounts}}
+
+@app.get("/debug/log_writer")
+async def debug_log_writer():
+    """Queued / written / dropped row counts of the ingest log writer."""
+    return {"ok": True, "data": log_writer.stats()}
+
 # -------- Main --------
+def run_shards(n: int) -> None:
+    """
+    One backend process per shard on PORT+1 .. PORT+n, and the shard router on PORT
+    in this process: EAs, streamers and dashboards all use PORT.
+    """
+    from shard_router import ShardRouter
+    procs = [subprocess.Popen([sys.executable, __file__], env={**os.environ, "SHARDS": str(n), "SHARD_INDEX": str(i)})
+             for i in range(n)]
+    try:
+        asyncio.run(ShardRouter([("127.0.0.1", PORT + 1 + i) for i in range(n)]).serve("0.0.0.0", PORT))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+
 if __name__ == "__main__":
-    uvicorn.run("backend:app", host="0.0.0.0", port=8000, reload=True)
+    if _LAUNCHER:
+        run_shards(SHARDS)
+    elif SHARDS > 1:
+        uvicorn.run("backend:app", host="0.0.0.0", port=PORT + 1 + SHARD_INDEX)
+    else:
+        uvicorn.run("backend:app", host="0.0.0.0", port=PORT, reload=True)
@@ -0,0 +1,192 @@
+# equity_series.py
+import numpy as np
+from typing import Optional, Dict, Any, List, Tuple
+
+RAW = np.dtype([("t", "f8"), ("v", "f8")])
+BAR = np.dtype([("t", "f8"), ("open", "f8"), ("high", "f8"), ("low", "f8"), ("close", "f8"), ("n", "i8")])
+
+RESOLUTION_NAMES = {0: "raw", 60: "1m", 3600: "1h", 86400: "1d"}
+
+
+class _Ring:
+    """
+    Bounded append-only array: rows live contiguously in buf[lo:hi] (so searchsorted
+    works on a plain view); once the 2x buffer fills, the newest `cap` rows are
+    copied back to the front, which keeps appends amortised O(1).
+    """
+
+    def __init__(self, cap: int, dtype: np.dtype):
+        self.cap = max(1, cap)
+        self.buf = np.zeros(2 * self.cap, dtype)
+        self.lo = self.hi = 0
+
+    def __len__(self) -> int:
+        return self.hi - self.lo
+
+    def view(self) -> np.ndarray:
+        return self.buf[self.lo:self.hi]
+
+    def extend(self, rows: np.ndarray) -> None:
+        rows = rows[-self.cap:]
+        if self.hi + len(rows) > len(self.buf):
+            keep = self.view()[-(self.cap - len(rows)):] if len(rows) < self.cap else self.buf[:0]
+            self.buf[:len(keep)] = keep
+            self.lo, self.hi = 0, len(keep)
+        self.buf[self.hi:self.hi + len(rows)] = rows
+        self.hi += len(rows)
+        self.lo = max(self.lo, self.hi - self.cap)
+
+
+def lttb(t: np.ndarray, v: np.ndarray, n: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of `n` points that keep the visual shape
+    of (t, v). First and last points are always kept; from each bucket in between the
+    point forming the largest triangle with the previous pick and the next bucket's mean.
+    """
+    N = len(t)
+    if n >= N:
+        return np.arange(N)
+    if n < 3:
+        return np.array([0, N - 1][:max(n, 0)], dtype=np.int64)
+    edges = (np.arange(n - 1) * ((N - 2) / (n - 2))).astype(np.int64) + 1
+    edges[-1] = N - 1
+    # mean of every bucket (plus the last point as the final "bucket") in one pass
+    starts = np.append(edges[:-1], N - 1)
+    counts = np.diff(np.append(starts, N))
+    mean_t = np.add.reduceat(t, starts) / counts
+    mean_v = np.add.reduceat(v, starts) / counts
+    out = np.empty(n, dtype=np.int64)
+    out[0], out[-1] = 0, N - 1
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        ta, va = t[a], v[a]
+        area = np.abs((ta - mean_t[i + 1]) * (v[lo:hi] - va) - (ta - t[lo:hi]) * (mean_v[i + 1] - va))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+def _bars_to_points(bars: np.ndarray, res: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Two points per OHLC bar (low then high for an up bar, high then low otherwise) so extremes survive."""
+    up = bars["close"] >= bars["open"]
+    first = np.where(up, bars["low"], bars["high"])
+    second = np.where(up, bars["high"], bars["low"])
+    t = np.stack([bars["t"] + 0.25 * res, bars["t"] + 0.75 * res], axis=1).ravel()
+    v = np.stack([first, second], axis=1).ravel()
+    return t, v
+
+
+class EquitySeries:
+    """
+    Equity samples of one account: the newest `raw_max` points as-is plus OHLC
+    roll-ups (1m / 1h / 1d by default), each a bounded ring, so long ranges are
+    answered from a coarse level instead of scanning every sample.
+    """
+
+    def __init__(self, raw_max: int = 200000, rollups: Optional[Dict[int, int]] = None):
+        self.raw = _Ring(raw_max, RAW)
+        rollups = rollups or {60: 60 * 1440, 3600: 5 * 365 * 24, 86400: 36500}
+        self.bars: Dict[int, _Ring] = {res: _Ring(cap, BAR) for res, cap in sorted(rollups.items())}
+        self.first_t: Optional[float] = None   # earliest sample ever appended (levels may have rolled it out)
+        self.appended = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.raw)
+
+    # -------- writes --------
+    def append(self, t: float, v: float) -> bool:
+        """Add one sample; samples older than the newest one are dropped (the series is append-only)."""
+        raw = self.raw.view()
+        if len(raw) and t < raw["t"][-1]:
+            self.dropped += 1
+            return False
+        self.raw.extend(np.array([(t, v)], RAW))
+        if self.first_t is None:
+            self.first_t = t
+        for res, ring in self.bars.items():
+            b = (t // res) * res
+            if len(ring) and ring.buf[ring.hi - 1]["t"] == b:
+                row = ring.buf[ring.hi - 1]
+                row["high"] = max(row["high"], v)
+                row["low"] = min(row["low"], v)
+                row["close"] = v
+                row["n"] += 1
+            else:
+                ring.extend(np.array([(b, v, v, v, v, 1)], BAR))
+        self.appended += 1
+        return True
+
+    def last_bars(self) -> List[Tuple[int, Tuple]]:
+        """(resolution, row) of the bucket each level is currently filling (what the last append touched)."""
+        return [(res, ring.buf[ring.hi - 1].tolist()) for res, ring in self.bars.items() if len(ring)]
+
+    def restore(self, raw: List[Tuple[float, float]], bars: Dict[int, List[Tuple]],
+                first_t: Optional[float] = None) -> None:
+        """Warm start from saved raw samples and roll-up bars (both oldest first)."""
+        self.first_t = first_t if first_t is not None else (raw[0][0] if raw else None)
+        if raw:
+            self.raw.extend(np.array(raw, RAW))
+        for res, rows in bars.items():
+            if res in self.bars and rows:
+                self.bars[res].extend(np.array([tuple(r) for r in rows], BAR))
+
+    # -------- reads --------
+    def span(self) -> Tuple[Optional[float], Optional[float]]:
+        raw = self.raw.view()
+        return (self.first_t, float(raw["t"][-1]) if len(raw) else None)
+
+    def _level(self, t0: float, t1: float, max_input: int) -> Tuple[int, np.ndarray, np.ndarray]:
+        """Finest level that reaches back to t0 with at most `max_input` points in [t0, t1]."""
+        levels = [(0, self.raw.view())] + [(res, r.view()) for res, r in self.bars.items()]
+        levels = [(res, arr) for res, arr in levels if len(arr)]
+        if not levels:
+            return 0, np.empty(0), np.empty(0)
+        origin = self.first_t if self.first_t is not None else -np.inf
+        for i, (res, arr) in enumerate(levels):
+            coarsest = i == len(levels) - 1
+            reach = max(t0, (origin // res) * res if res else origin)
+            if arr["t"][0] > reach and not coarsest:
+                continue                      # older samples already rolled out of this level
+            # a bar starting at b covers [b, b + res), so it overlaps the range if b > t0 - res
+            lo = np.searchsorted(arr["t"], t0 - res, side="right") if res else np.searchsorted(arr["t"], t0)
+            hi = np.searchsorted(arr["t"], t1, side="right")
+            if (hi - lo) * (2 if res else 1) <= max_input or coarsest:
+                break
+        rows = arr[lo:hi]
+        if res == 0:
+            return 0, rows["t"], rows["v"]
+        t, v = _bars_to_points(rows, res)
+        keep = (t >= t0) & (t <= t1)
+        return res, t[keep], v[keep]
+
+    def query(self, t0: Optional[float] = None, t1: Optional[float] = None, points: int = 500,
+              max_input: int = 200000) -> Dict[str, Any]:
+        """Samples in [t0, t1] reduced to at most `points` with LTTB, as parallel t / equity lists."""
+        first, last = self.span()
+        t0 = first if t0 is None else t0
+        t1 = last if t1 is None else t1
+        if first is None or t0 is None or t1 is None or t1 < t0:
+            return {"resolution": "raw", "source_points": 0, "count": 0, "t": [], "equity": []}
+        res, t, v = self._level(t0, t1, max_input)
+        idx = lttb(t, v, points)
+        return {
+            "resolution": RESOLUTION_NAMES.get(res, f"{res}s"),
+            "source_points": int(len(t)),
+            "count": int(len(idx)),
+            "t": np.round(t[idx], 3).tolist(),
+            "equity": np.round(v[idx], 2).tolist(),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        first, last = self.span()
+        return {
+            "raw": len(self.raw),
+            "raw_max": self.raw.cap,
+            "bars": {RESOLUTION_NAMES.get(r, f"{r}s"): len(ring) for r, ring in self.bars.items()},
+            "appended": self.appended,
+            "dropped": self.dropped,
+            "first_t": first,
+            "last_t": last,
+        }
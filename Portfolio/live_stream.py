@@ -0,0 +1,127 @@
+# live_stream.py
+import time, asyncio, secrets
+from collections import deque, OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+
+
+class Subscriber:
+    """
+    One connected client. Undelivered events wait in `pending`, keyed by what they
+    describe (equity, account, stats, trade:<id>), so a newer event replaces an older
+    one that was never sent. Past `max_pending` distinct keys the backlog is dropped
+    and the client gets a `reset` (refetch over REST, then keep applying events).
+    """
+
+    def __init__(self, max_pending: int):
+        self.pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.max_pending = max_pending
+        self.wake = asyncio.Event()
+        self.reset_seq: Optional[int] = None
+        self.sent = 0
+        self.coalesced = 0
+        self.resets = 0
+
+    def offer(self, ev: Dict[str, Any]) -> None:
+        ck = ev["type"] if ev.get("key") is None else f"{ev['type']}:{ev['key']}"
+        if ck in self.pending:
+            del self.pending[ck]
+            self.coalesced += 1
+        elif len(self.pending) >= self.max_pending:
+            self.force_reset(ev["seq"] - 1)
+        self.pending[ck] = ev
+        self.wake.set()
+
+    def force_reset(self, seq: int) -> None:
+        self.pending.clear()
+        self.reset_seq = seq
+        self.resets += 1
+        self.wake.set()
+
+    async def next_batch(self, timeout: float) -> List[Dict[str, Any]]:
+        """Everything pending (oldest first), or [] after `timeout` seconds of silence."""
+        if not self.pending and self.reset_seq is None:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        self.wake.clear()
+        batch = list(self.pending.values())
+        self.pending.clear()
+        if self.reset_seq is not None:
+            batch.insert(0, {"seq": self.reset_seq, "type": "reset", "ts": time.time()})
+            self.reset_seq = None
+        self.sent += len(batch)
+        return batch
+
+
+class EventHub:
+    """
+    Fan-out of change events with a global sequence number. The last `backlog`
+    events are kept so a reconnecting client can resume from the seq it last saw;
+    an older seq gets a `reset` instead. `seq` restarts at 0 with the process, so
+    event ids are `<epoch>-<seq>` with a random per-hub epoch: an id from another
+    process (or a seq this hub never reached) also gets a `reset`.
+    """
+
+    def __init__(self, backlog: int = 1000, max_pending: int = 500):
+        self.epoch = secrets.token_hex(4)
+        self.seq = 0
+        self.backlog: deque = deque(maxlen=backlog)
+        self.max_pending = max_pending
+        self.subscribers: "set[Subscriber]" = set()
+        self.published = 0
+
+    def publish(self, type_: str, data: Any, key: Optional[str] = None) -> Dict[str, Any]:
+        self.seq += 1
+        ev = {"seq": self.seq, "type": type_, "key": key, "ts": time.time(), "data": data}
+        self.backlog.append(ev)
+        self.published += 1
+        for sub in self.subscribers:
+            sub.offer(ev)
+        return ev
+
+    def event_id(self, ev: Dict[str, Any]) -> str:
+        return f"{self.epoch}-{ev['seq']}"
+
+    def parse_event_id(self, event_id: str) -> Tuple[Optional[int], Optional[str]]:
+        """(seq, epoch) of a Last-Event-ID; a bare seq has no epoch, garbage gives (None, None)."""
+        epoch, _, seq = event_id.strip().rpartition("-")
+        if not seq.isdigit():
+            return None, None
+        return int(seq), epoch or None
+
+    def subscribe(self, since: Optional[int] = None, epoch: Optional[str] = None) -> Subscriber:
+        """
+        Register a client; with `since`, replay (coalesced) what it missed first.
+        `since` from another epoch, or past the current seq, means this hub was
+        restarted under the client: it gets a `reset`.
+        """
+        sub = Subscriber(self.max_pending)
+        if since is not None and ((epoch is not None and epoch != self.epoch) or since > self.seq):
+            sub.force_reset(self.seq)
+        elif since is not None and since < self.seq:
+            oldest = self.backlog[0]["seq"] if self.backlog else self.seq + 1
+            if since < oldest - 1:
+                sub.force_reset(self.seq)
+            else:
+                for ev in self.backlog:
+                    if ev["seq"] > since:
+                        sub.offer(ev)
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber) -> None:
+        self.subscribers.discard(sub)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "published": self.published,
+            "backlog": len(self.backlog),
+            "oldest_seq": self.backlog[0]["seq"] if self.backlog else None,
+            "subscribers": len(self.subscribers),
+            "pending": sum(len(s.pending) for s in self.subscribers),
+            "coalesced": sum(s.coalesced for s in self.subscribers),
+            "resets": sum(s.resets for s in self.subscribers),
+        }
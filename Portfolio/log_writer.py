@@ -0,0 +1,140 @@
+# log_writer.py
+import os, sys, json, time, asyncio
+from typing import Optional, Dict, Any, List
+
+
+class AsyncLogWriter:
+    """
+    Ingest log off the event loop: put() only enqueues; a background task drains the
+    bounded queue in batches (flush on `flush_lines` rows or every `flush_secs`) and
+    writes each batch in a worker thread. Rows that do not fit are dropped and counted.
+    """
+
+    def __init__(self, path: str = "", queue_max: int = 10000, flush_lines: int = 500,
+                 flush_secs: float = 1.0, max_bytes: int = 0, backups: int = 5, echo: bool = True):
+        self.path = path
+        self.flush_lines = max(1, flush_lines)
+        self.flush_secs = flush_secs
+        self.max_bytes = max_bytes        # 0 = never rotate
+        self.backups = backups
+        self.echo = echo
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_max)
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._size: Optional[int] = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_ts: Optional[float] = None
+
+    # -------- producer side --------
+    def put(self, row: Dict[str, Any]) -> bool:
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path or None,
+            "running": self._task is not None and not self._task.done(),
+            "queued": self._queue.qsize(),
+            "queue_max": self._queue.maxsize,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "rotations": self.rotations,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_flush_ts": self.last_flush_ts,
+        }
+
+    # -------- lifecycle --------
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Let the drain task write everything still queued, then stop it."""
+        self._stopping = True
+        if self._task is not None:
+            await self._task
+            self._task = None
+        rows = self._take(self._queue.qsize())
+        if rows:
+            await asyncio.to_thread(self._write, rows)
+
+    # -------- consumer side --------
+    def _take(self, n: int) -> List[Dict[str, Any]]:
+        rows = []
+        while len(rows) < n:
+            try:
+                rows.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return rows
+
+    async def _run(self) -> None:
+        while True:
+            rows = self._take(self.flush_lines)
+            if not rows:
+                if self._stopping:
+                    return
+                try:
+                    rows = [await asyncio.wait_for(self._queue.get(), self.flush_secs)]
+                except asyncio.TimeoutError:
+                    continue
+            # wait for more rows up to flush_secs, but never hold a full batch back
+            deadline = time.monotonic() + self.flush_secs
+            while len(rows) < self.flush_lines and not self._stopping:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    rows.append(await asyncio.wait_for(self._queue.get(), left))
+                except asyncio.TimeoutError:
+                    break
+                rows += self._take(self.flush_lines - len(rows))
+            await asyncio.to_thread(self._write, rows)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        lines = [json.dumps(r, ensure_ascii=False) for r in rows]
+        try:
+            if self.echo:
+                sys.stdout.write("".join(f"[INGEST] {ln}\n" for ln in lines))
+                sys.stdout.flush()
+            if self.path:
+                blob = ("\n".join(lines) + "\n").encode("utf-8")
+                if self._size is None:
+                    self._size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+                if self.max_bytes and self._size and self._size + len(blob) > self.max_bytes:
+                    self._rotate()
+                with open(self.path, "ab") as f:
+                    f.write(blob)
+                self._size += len(blob)
+            self.written += len(rows)
+            self.batches += 1
+            self.last_flush_ts = time.time()
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            print("[LOG_FILE_ERROR]", str(e))
+
+    def _rotate(self) -> None:
+        """path -> path.1 -> ... -> path.<backups> (oldest removed), like RotatingFileHandler."""
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.path}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.path}.{i + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._size = 0
+        self.rotations += 1
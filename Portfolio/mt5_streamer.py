@@ -1,116 +1,242 @@
 # mt5_streamer.py
-import time, os, json, requests, datetime as dt
+import time, os, gzip, json, bisect, hashlib, requests, datetime as dt
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import MetaTrader5 as mt5
 
-BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
-API_KEY     = os.getenv("API_KEY", "dev-key")
-POLL_SECS   = int(os.getenv("POLL_SECS", "5"))
+BACKEND_URL  = os.getenv("BACKEND_URL", "http://localhost:8000")
+API_KEY      = os.getenv("API_KEY", "dev-key")
+POLL_SECS    = int(os.getenv("POLL_SECS", "5"))
+HISTORY_DAYS = int(os.getenv("HISTORY_DAYS", "365"))      # window of the first (full) history sync
+NEEDS_SECS   = int(os.getenv("NEEDS_SECS", "30"))         # how often to ask the backend if it lost state
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "10"))
+GZIP_MIN     = int(os.getenv("GZIP_MIN", "1024"))         # compress batches at least this large
+
+TRADE_DEALS = (mt5.DEAL_TYPE_BUY, mt5.DEAL_TYPE_SELL)
+
+ORDER_TYPES = {
+    mt5.ORDER_TYPE_BUY: "buy", mt5.ORDER_TYPE_SELL: "sell",
+    mt5.ORDER_TYPE_BUY_LIMIT: "buy_limit", mt5.ORDER_TYPE_SELL_LIMIT: "sell_limit",
+    mt5.ORDER_TYPE_BUY_STOP: "buy_stop", mt5.ORDER_TYPE_SELL_STOP: "sell_stop",
+    mt5.ORDER_TYPE_BUY_STOP_LIMIT: "buy_stop_limit", mt5.ORDER_TYPE_SELL_STOP_LIMIT: "sell_stop_limit",
+}
+ORDER_STATES = {
+    mt5.ORDER_STATE_STARTED: "started", mt5.ORDER_STATE_PLACED: "placed",
+    mt5.ORDER_STATE_CANCELED: "canceled", mt5.ORDER_STATE_PARTIAL: "partial",
+    mt5.ORDER_STATE_FILLED: "filled", mt5.ORDER_STATE_REJECTED: "rejected",
+    mt5.ORDER_STATE_EXPIRED: "expired",
+}
 
 def to_iso(ts):
-    # Convert MT5 datetime (seconds) to ISO string
+    # Convert MT5 datetime (seconds) to ISO string, same format as the EA
     if isinstance(ts, (int, float)):
-        return dt.datetime.utcfromtimestamp(ts).isoformat() + "Z"
+        return dt.datetime.fromtimestamp(ts, dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ") if ts > 0 else None
     return str(ts)
 
-def position_to_dict(p):
-    return {
-        "ticket": p.ticket,
-        "symbol": p.symbol,
-        "type": p.type,            # 0=buy, 1=sell
-        "volume": p.volume,
-        "price_open": p.price_open,
-        "sl": p.sl,
-        "tp": p.tp,
-        "profit": p.profit,
-        "time": to_iso(p.time),
-        "comment": p.comment
-    }
-
-def order_to_dict(o):
-    return {
-        "ticket": o.ticket,
-        "symbol": o.symbol,
-        "type": o.type,
-        "volume_current": o.volume_current,
-        "price_open": o.price_open,
-        "sl": o.sl,
-        "tp": o.tp,
-        "time_setup": to_iso(o.time_setup),
-        "state": o.state,
-        "comment": o.comment
-    }
-
-def deal_to_dict(d):
-    return {
-        "ticket": d.ticket,
-        "order": d.order,
-        "symbol": d.symbol,
-        "type": d.type,
-        "volume": d.volume,
-        "price": d.price,
-        "profit": d.profit,
-        "swap": d.swap,
-        "commission": d.commission,
-        "comment": d.comment,
-        "time": to_iso(d.time)
-    }
-
-def fetch_snapshot():
-    ai = mt5.account_info()
-    if ai is None:
-        raise RuntimeError("account_info() failed")
-
-    # Open positions / working orders
-    positions = mt5.positions_get() or []
-    orders    = mt5.orders_get()    or []
-
-    # Recent history (last 30 days)
-    now  = dt.datetime.utcnow()
-    frm  = now - dt.timedelta(days=30)
-    deals = mt5.history_deals_get(frm, now) or []
-
-    # Minimal equity curve point
-    eq_point = {"t": now.isoformat() + "Z", "equity": float(ai.equity)}
-
-    snapshot = {
-        "ts": now.isoformat() + "Z",
-        "account": {
-            "login": ai.login,
-            "name": ai.name,
-            "server": ai.server,
-            "currency": ai.currency,
-            "balance": float(ai.balance),
-            "equity": float(ai.equity),
-            "profit": float(ai.profit),
-            "margin": float(ai.margin),
-            "margin_level": float(ai.margin_level) if ai.margin_level is not None else None
-        },
-        "positions": [position_to_dict(p) for p in positions],
-        "orders":    [order_to_dict(o)    for o in orders],
-        "deals":     [deal_to_dict(d)     for d in deals],
-        "equity_point": eq_point
-    }
-    return snapshot
+def _sig(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# -------- HTTP --------
+def make_session() -> requests.Session:
+    """One keep-alive connection pool for the life of the process, with retries on 5xx / resets."""
+    s = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({"GET", "POST"}))
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=2, max_retries=retry)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    s.headers.update({"X-API-Key": API_KEY})
+    return s
+
+def post_batch(session: requests.Session, records) -> dict:
+    """POST records to /ingest/batch as NDJSON, gzipped when it pays off."""
+    body = "\n".join(json.dumps(r, separators=(",", ":")) for r in records).encode("utf-8")
+    headers = {"Content-Type": "application/x-ndjson"}
+    if len(body) >= GZIP_MIN:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    resp = session.post(f"{BACKEND_URL}/ingest/batch", data=body, headers=headers, timeout=HTTP_TIMEOUT)
+    resp.raise_for_status()
+    return resp.json()
+
+def backend_needs(session: requests.Session, what: str) -> bool:
+    try:
+        resp = session.get(f"{BACKEND_URL}/api/live/{what}/needs", timeout=HTTP_TIMEOUT)
+        return resp.ok and bool(resp.json().get("needs"))
+    except Exception:
+        return False
+
+# -------- Delta state --------
+class Streamer:
+    """
+    Keeps what was last sent so each poll only posts the difference: deals past the
+    (time, ticket) cursor, positions whose numbers moved, and account/equity records
+    when they change. The first sync (or a backend that reports needs=true) sends the
+    full HISTORY_DAYS window once.
+    """
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.cursor = (0, 0)             # (time_msc, ticket) of the newest deal seen
+        self.ledger = []                 # [(time, balance delta)] of every deal seen, time-sorted
+        self.ledger_sum = []             # running sums of ledger deltas
+        self.sent_positions = {}         # position_id -> signature of its last history_order
+        self.sent_account = None
+        self.sent_equity = None
+        self.next_needs_check = 0.0
+        self.full_resend = True
+
+    # -- deals / history --
+    def _add_deals(self, deals) -> set:
+        """Advance the cursor over deals; returns the position ids they touch."""
+        touched = set()
+        for d in sorted(deals, key=lambda d: (d.time_msc, d.ticket)):
+            if (d.time_msc, d.ticket) <= self.cursor:
+                continue
+            self.cursor = (d.time_msc, d.ticket)
+            flow = d.profit + d.swap + d.commission if d.type in TRADE_DEALS else d.profit
+            self.ledger.append((d.time, flow))
+            self.ledger_sum.append((self.ledger_sum[-1] if self.ledger_sum else 0.0) + flow)
+            if d.type in TRADE_DEALS and d.position_id:
+                touched.add(d.position_id)
+        return touched
+
+    def balance_at(self, t: int, balance: float) -> float:
+        """Account balance right after time t: current balance minus every later deal (as the EA does)."""
+        i = bisect.bisect_right(self.ledger, (t, float("inf")))
+        after = self.ledger_sum[-1] - (self.ledger_sum[i - 1] if i else 0.0) if self.ledger_sum else 0.0
+        return balance - after
+
+    def history_order(self, position_id: int, balance: float, active: bool):
+        """The EA's history_order record for one position (its filled ENTRY order), or None."""
+        deals = [d for d in (mt5.history_deals_get(position=position_id) or []) if d.type in TRADE_DEALS]
+        entries = [d for d in deals if d.entry == mt5.DEAL_ENTRY_IN]
+        if not entries:
+            return None
+        entry = min(entries, key=lambda d: d.time_msc)
+        orders = [o for o in (mt5.history_orders_get(position=position_id) or []) if o.ticket == entry.order]
+        if not orders or orders[0].state != mt5.ORDER_STATE_FILLED:
+            return None
+        o = orders[0]
+        exits = [d.time for d in deals if d.entry == mt5.DEAL_ENTRY_OUT]
+        t_exit = max(exits) if exits else 0
+        return {"history_order": {
+            "ticket": o.ticket, "symbol": o.symbol,
+            "type": ORDER_TYPES.get(o.type, "unknown"), "state": ORDER_STATES.get(o.state, "unknown"),
+            "volume_initial": round(o.volume_initial, 2), "volume_current": round(o.volume_current, 2),
+            "price_open": round(o.price_open or entry.price, 6), "sl": round(o.sl, 6), "tp": round(o.tp, 6),
+            "position_id": position_id,
+            "time_setup": to_iso(o.time_setup), "time_done": to_iso(o.time_done),
+            "opening_balance": round(self.balance_at(entry.time, balance), 2),
+            "closing_balance": round(self.balance_at(t_exit, balance), 2) if t_exit else None,
+            "profit": round(sum(d.profit for d in deals), 2),
+            "is_trade_active": active,
+        }}
+
+    # -- one poll --
+    def collect(self):
+        ai = mt5.account_info()
+        if ai is None:
+            raise RuntimeError("account_info() failed")
+        positions = mt5.positions_get() or []
+        active = len(positions) > 0
+        now = int(time.time())
+        records = []
+        self.session.headers["X-Account"] = f"{ai.login}@{ai.server}"   # backend keys every store by it
+
+        if time.monotonic() >= self.next_needs_check:
+            self.next_needs_check = time.monotonic() + NEEDS_SECS
+            if backend_needs(self.session, "trades"):
+                self.full_resend = True
+            if backend_needs(self.session, "account"):
+                self.sent_account = None
+
+        # account_info: only when something in it moved
+        acc = {
+            "account_login": ai.login, "name": ai.name, "server": ai.server, "currency": ai.currency,
+            "leverage": ai.leverage, "balance": round(ai.balance, 2), "equity": round(ai.equity, 2),
+            "margin": round(ai.margin, 2), "margin_level": round(ai.margin_level or 0.0, 2),
+            "positions_snapshot": {
+                "count": len(positions),
+                "position_ids": [p.identifier for p in positions],
+                "symbols": [p.symbol for p in positions],
+                "lots_open": round(sum(p.volume for p in positions), 2),
+            },
+            "is_trade_active": active,
+        }
+        if _sig(acc) != self.sent_account:
+            self.sent_account = _sig(acc)
+            records.append({"account_info": dict(acc, t=to_iso(now))})
+
+        # equity_curve: first open position, like the EA
+        if active:
+            p = positions[0]
+            eq = {"position_id": p.identifier, "position_ticket": p.ticket, "symbol": p.symbol,
+                  "profit": round(p.profit, 2), "current_equity": round(ai.equity, 2), "is_trade_active": True}
+        else:
+            eq = {"position_id": None, "position_ticket": None, "symbol": None, "profit": None,
+                  "current_equity": round(ai.equity, 2), "is_trade_active": False}
+        if _sig(eq) != self.sent_equity:
+            self.sent_equity = _sig(eq)
+            records.append({"equity_curve": dict(eq, t=to_iso(now))})
+
+        # history: deals past the cursor, plus open positions (their profit moves without new deals)
+        if self.full_resend:
+            self.cursor, self.ledger, self.ledger_sum, self.sent_positions = (0, 0), [], [], {}
+        # re-read the cursor's own second; _add_deals skips what was already seen
+        frm = self.cursor[0] // 1000 if self.cursor[0] else now - HISTORY_DAYS * 86400
+        touched = self._add_deals(mt5.history_deals_get(frm, now + 86400) or [])
+        touched |= {p.identifier for p in positions}
+        if self.full_resend:
+            records.append({"history_orders_header": {"from": to_iso(frm), "to": to_iso(now),
+                                                      "count": len(touched), "is_trade_active": active}})
+        for pid in sorted(touched):
+            rec = self.history_order(pid, ai.balance, active)
+            if rec is None:
+                continue
+            sig = _sig({k: v for k, v in rec["history_order"].items() if k != "is_trade_active"})
+            if self.sent_positions.get(pid) != sig:
+                self.sent_positions[pid] = sig
+                records.append(rec)
+        if self.full_resend:
+            records.append({"history_orders_footer": True, "is_trade_active": active})
+        return records
+
+    def poll(self) -> int:
+        saved = (self.cursor, len(self.ledger), dict(self.sent_positions),
+                 self.sent_account, self.sent_equity, self.full_resend)
+        records = self.collect()
+        if records:
+            try:
+                post_batch(self.session, records)
+            except Exception:
+                # nothing was acknowledged: rewind so the same delta goes out next poll
+                cursor, n, self.sent_positions, self.sent_account, self.sent_equity, full = saved
+                if full:
+                    self.full_resend = True
+                else:
+                    self.cursor = cursor
+                    del self.ledger[n:], self.ledger_sum[n:]
+                raise
+        self.full_resend = False
+        return len(records)
 
 def main():
     if not mt5.initialize():
         raise RuntimeError("Failed to initialize MT5. Is MetaTrader 5 running and logged in?")
 
+    streamer = Streamer(make_session())
     try:
         while True:
             try:
-                snap = fetch_snapshot()
-                resp = requests.post(
-                    f"{BACKEND_URL}/ingest/snapshot",
-                    data=json.dumps(snap),
-                    headers={"Content-Type": "application/json", "X-API-Key": API_KEY},
-                    timeout=5,
-                )
-                resp.raise_for_status()
+                n = streamer.poll()
+                if n:
+                    print(f"[POST ok] {n} records")
             except Exception as e:
                 print("POST error:", e)
             time.sleep(POLL_SECS)
     finally:
+        streamer.session.close()
         mt5.shutdown()
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+# shard_router.py
+import asyncio
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from accounts import shard_of
+
+MAX_HEAD = 64 * 1024                      # request / response head limit
+HOP_HEADERS = {"connection", "keep-alive", "proxy-connection"}
+DROP_HEADERS = HOP_HEADERS | {"x-forwarded-for", "expect"}    # the router answers Expect: 100-continue itself
+NO_BODY = (204, 304)
+
+Headers = List[Tuple[str, str]]
+
+
+def _header(headers: Headers, name: str) -> Optional[str]:
+    for k, v in headers:
+        if k.lower() == name:
+            return v
+    return None
+
+def _parse_head(head: bytes) -> Tuple[str, Headers]:
+    lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines[1:]:
+        if line:
+            k, _, v = line.partition(":")
+            headers.append((k.strip(), v.strip()))
+    return lines[0], headers
+
+def _build_head(start: str, headers: Headers) -> bytes:
+    return ("\r\n".join([start] + [f"{k}: {v}" for k, v in headers]) + "\r\n\r\n").encode("latin-1")
+
+async def _read_head(reader: asyncio.StreamReader) -> Optional[bytes]:
+    """One head up to the blank line; None on a clean EOF between requests."""
+    try:
+        return await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise
+
+async def _read_body(reader: asyncio.StreamReader, headers: Headers) -> bytes:
+    """The raw request body (chunked bodies stay chunked, with the same header)."""
+    if "chunked" in (_header(headers, "transfer-encoding") or "").lower():
+        out = bytearray()
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            out += line
+            if int(line.split(b";", 1)[0], 16) == 0:
+                while True:                 # trailers, then the blank line
+                    line = await reader.readuntil(b"\r\n")
+                    out += line
+                    if line == b"\r\n":
+                        return bytes(out)
+            out += await reader.readexactly(int(line.split(b";", 1)[0], 16) + 2)
+    n = int(_header(headers, "content-length") or 0)
+    return await reader.readexactly(n) if n else b""
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        writer.write(data)
+        await writer.drain()
+
+
+class ShardRouter:
+    """
+    Front door of a sharded backend: one address for every EA, streamer and dashboard,
+    forwarding each request to the shard that owns its account.
+
+    The shard is chosen from X-Account or ?account= (crc32, as accounts.shard_of);
+    a bare login goes where that login was last ingested. Requests without an
+    account (EAs that only send account_info records) go to the shard this client
+    host last ingested into, else shard 0; if that shard answers 421, the request
+    is re-sent once to the one named in its X-Shard header. Server-sent events and
+    WebSocket upgrades are streamed through. Each request opens its own connection
+    to the shard (loopback), with X-Forwarded-For so the shard still sees the
+    client's address.
+    """
+
+    def __init__(self, upstreams: List[Tuple[str, int]]):
+        self.upstreams = upstreams
+        self.shards = len(upstreams)
+        self.client_shard: Dict[str, int] = {}     # client host -> shard of its last ingest
+        self.login_shard: Dict[str, int] = {}      # bare login -> shard
+
+    def route(self, client: str, target: str, headers: Headers) -> int:
+        ref = (_header(headers, "x-account") or "").strip()
+        if not ref:
+            ref = (parse_qs(urlsplit(target).query).get("account") or [""])[0].strip()
+        if ref and "@" in ref:
+            return shard_of(ref, self.shards)
+        if ref and ref in self.login_shard:
+            return self.login_shard[ref]
+        return self.client_shard.get(client, 0)
+
+    def _learn(self, client: str, target: str, shard: int, account: Optional[str]) -> None:
+        if urlsplit(target).path.startswith("/ingest"):
+            self.client_shard[client] = shard
+            if account and "@" in account:
+                self.login_shard[account.split("@", 1)[0]] = shard
+
+    async def _send(self, shard: int, head: bytes, body: bytes):
+        host, port = self.upstreams[shard]
+        reader, writer = await asyncio.open_connection(host, port, limit=MAX_HEAD)
+        writer.write(head + body)
+        await writer.drain()
+        status_line, headers = _parse_head(await reader.readuntil(b"\r\n\r\n"))
+        return int(status_line.split(" ", 2)[1]), status_line, headers, reader, writer
+
+    async def _forward(self, client: str, start: str, headers: Headers, body: bytes,
+                       cwriter: asyncio.StreamWriter, creader: asyncio.StreamReader) -> bool:
+        """Forward one request and relay the answer; returns whether the client connection stays open."""
+        method, target, version = start.split(" ", 2)
+        upgrade = _header(headers, "upgrade") is not None
+        keep = version == "HTTP/1.1" and "close" not in (_header(headers, "connection") or "").lower()
+        fwd = [(k, v) for k, v in headers if k.lower() not in DROP_HEADERS]
+        prior = _header(headers, "x-forwarded-for")
+        fwd.append(("X-Forwarded-For", f"{prior}, {client}" if prior else client))
+        fwd.append(("Connection", "Upgrade" if upgrade else "close"))
+        head = _build_head(start, fwd)
+
+        shard = self.route(client, target, headers)
+        account = _header(headers, "x-account")
+        try:
+            status, status_line, rheaders, ureader, uwriter = await self._send(shard, head, body)
+            if status == 421 and (_header(rheaders, "x-shard") or "").isdigit():
+                uwriter.close()
+                account = account or _header(rheaders, "x-account")
+                shard = int(_header(rheaders, "x-shard")) % self.shards
+                status, status_line, rheaders, ureader, uwriter = await self._send(shard, head, body)
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError, IndexError):
+            msg = b'{"ok":false,"error":"shard_unavailable"}'
+            cwriter.write(_build_head("HTTP/1.1 502 Bad Gateway", [
+                ("Content-Type", "application/json"), ("Content-Length", str(len(msg))), ("Connection", "close")]) + msg)
+            await cwriter.drain()
+            return False
+        if status < 400:
+            self._learn(client, target, shard, account or _header(rheaders, "x-account"))
+
+        try:
+            if status == 101:
+                cwriter.write(_build_head(status_line, rheaders))
+                await cwriter.drain()
+                pipes = [asyncio.ensure_future(_pipe(creader, uwriter)), asyncio.ensure_future(_pipe(ureader, cwriter))]
+                _, pending = await asyncio.wait(pipes, return_when=asyncio.FIRST_COMPLETED)
+                for task in pending:        # one side closed: the WebSocket is over
+                    task.cancel()
+                return False
+            framed = (_header(rheaders, "content-length") is not None
+                      or "chunked" in (_header(rheaders, "transfer-encoding") or "").lower()
+                      or status in NO_BODY or method == "HEAD")
+            keep = keep and framed
+            out = [(k, v) for k, v in rheaders if k.lower() not in HOP_HEADERS]
+            if not keep:
+                out.append(("Connection", "close"))
+            cwriter.write(_build_head(status_line, out))
+            await _pipe(ureader, cwriter)       # the shard closes after this one response
+        finally:
+            uwriter.close()
+        return keep
+
+    async def _client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if peer else "?"
+        try:
+            while True:
+                raw = await _read_head(reader)
+                if raw is None:
+                    break
+                start, headers = _parse_head(raw)
+                if (_header(headers, "expect") or "").lower() == "100-continue":
+                    writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                body = await _read_body(reader, headers)
+                if not await self._forward(client, start, headers, body, writer, reader):
+                    break
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self._client, host, port, limit=MAX_HEAD)
+        print(f"[ROUTER] {host}:{port} -> " + ", ".join(f"{h}:{p}" for h, p in self.upstreams))
+        async with server:
+            await server.serve_forever()
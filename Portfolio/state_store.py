@@ -0,0 +1,272 @@
+# state_store.py
+import json, time, sqlite3, asyncio
+from typing import Optional, Dict, Any, List, Tuple
+
+SCHEMA_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    account    TEXT NOT NULL,
+    pos_key    TEXT NOT NULL,
+    rev        TEXT NOT NULL,
+    time_done  TEXT,
+    row        TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (account, pos_key)
+);
+CREATE TABLE IF NOT EXISTS kv (
+    account TEXT NOT NULL,
+    name    TEXT NOT NULL,
+    value   TEXT,
+    seen_ts REAL,
+    PRIMARY KEY (account, name)
+);
+CREATE TABLE IF NOT EXISTS ingest_log (
+    id  INTEGER PRIMARY KEY AUTOINCREMENT,
+    row TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS equity_raw (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    account TEXT NOT NULL DEFAULT '',
+    t       REAL NOT NULL,
+    v       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS equity_raw_account ON equity_raw(account, id);
+CREATE TABLE IF NOT EXISTS equity_bars (
+    account TEXT NOT NULL,
+    res     INTEGER NOT NULL,
+    t       REAL NOT NULL,
+    open    REAL, high REAL, low REAL, close REAL,
+    n       INTEGER,
+    PRIMARY KEY (account, res, t)
+);
+"""
+
+# v1 (single account) -> v2: every keyed table gains an `account` column; old rows get account ''
+MIGRATE_V1 = """
+ALTER TABLE trades RENAME TO trades_v1;
+ALTER TABLE kv RENAME TO kv_v1;
+ALTER TABLE equity_bars RENAME TO equity_bars_v1;
+ALTER TABLE equity_raw ADD COLUMN account TEXT NOT NULL DEFAULT '';
+"""
+COPY_V1 = """
+INSERT INTO trades SELECT '', pos_key, rev, time_done, row, updated_at FROM trades_v1;
+INSERT INTO kv SELECT '', name, value, seen_ts FROM kv_v1;
+INSERT INTO equity_bars SELECT '', res, t, open, high, low, close, n FROM equity_bars_v1;
+DROP TABLE trades_v1;
+DROP TABLE kv_v1;
+DROP TABLE equity_bars_v1;
+"""
+
+
+class StateStore:
+    """
+    Durable copy of the backend's in-memory state in SQLite (WAL), one row set per
+    account. Request handlers only record what changed (put_*); repeated changes to
+    the same trade or key collapse into one pending write, and a background task
+    commits each batch in one transaction from a worker thread. load() returns
+    everything for a warm start.
+    """
+
+    def __init__(self, path: str, flush_secs: float = 0.5, ingest_keep: int = 100,
+                 equity_keep: Optional[Dict[int, int]] = None):
+        self.path = path
+        self.flush_secs = flush_secs
+        self.ingest_keep = ingest_keep
+        self.equity_keep = equity_keep or {}     # resolution (0 = raw) -> rows kept per account
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")   # durable at WAL checkpoints, no fsync per commit
+        self._migrate()
+        self._trades: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._kv: Dict[Tuple[str, str], Tuple[Any, Optional[float]]] = {}
+        self._ingest: List[Dict[str, Any]] = []
+        self._equity: List[Tuple[str, float, float]] = []
+        self._bars: Dict[Tuple[str, int, float], Tuple] = {}
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_flush_ms: Optional[float] = None
+
+    def _migrate(self) -> None:
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        has_trades = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'trades'").fetchone()
+        if version < SCHEMA_VERSION and has_trades:
+            # one script = one transaction (executescript commits anything pending first)
+            self._db.executescript(
+                "BEGIN;"
+                "CREATE TABLE IF NOT EXISTS equity_raw (id INTEGER PRIMARY KEY AUTOINCREMENT, t REAL NOT NULL, v REAL NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS equity_bars (res INTEGER NOT NULL, t REAL NOT NULL, open REAL, high REAL,"
+                " low REAL, close REAL, n INTEGER, PRIMARY KEY (res, t));"
+                + MIGRATE_V1 + SCHEMA + COPY_V1 + "COMMIT;")
+        else:
+            self._db.executescript(SCHEMA)
+        self._db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    # -------- warm start --------
+    def load(self) -> Dict[str, Any]:
+        """
+        {"accounts": {account: {"trades": {pos_key: row}, "kv": {name: (value, seen_ts)},
+                                "equity": {"raw": [(t, v)], "bars": {res: [(t, open, high, low, close, n)]}}}},
+         "ingest": [rows]}
+        """
+        accounts: Dict[str, Dict[str, Any]] = {}
+
+        def acct(a: str) -> Dict[str, Any]:
+            return accounts.setdefault(a, {"trades": {}, "kv": {}, "equity": {"raw": [], "bars": {}}})
+
+        for a, k, r in self._db.execute("SELECT account, pos_key, row FROM trades"):
+            acct(a)["trades"][k] = json.loads(r)
+        for a, n, v, ts in self._db.execute("SELECT account, name, value, seen_ts FROM kv"):
+            acct(a)["kv"][n] = (json.loads(v) if v is not None else None, ts)
+        for a, t, v in self._db.execute("SELECT account, t, v FROM equity_raw ORDER BY id"):
+            acct(a)["equity"]["raw"].append((t, v))
+        for a, res, *row in self._db.execute(
+                "SELECT account, res, t, open, high, low, close, n FROM equity_bars ORDER BY account, res, t"):
+            acct(a)["equity"]["bars"].setdefault(res, []).append(tuple(row))
+        ingest = [json.loads(r) for (r,) in self._db.execute(
+            "SELECT row FROM (SELECT id, row FROM ingest_log ORDER BY id DESC LIMIT ?) ORDER BY id",
+            (self.ingest_keep,))]
+        return {"accounts": accounts, "ingest": ingest}
+
+    def rename_account(self, old: str, new: str) -> None:
+        """Move every row of `old` to `new` (used once, for rows written before accounts existed)."""
+        self._db.execute("BEGIN")
+        for table in ("trades", "kv", "equity_raw", "equity_bars"):
+            self._db.execute(f"UPDATE OR REPLACE {table} SET account = ? WHERE account = ?", (new, old))
+        self._db.execute("COMMIT")
+
+    # -------- producer side (event loop) --------
+    def put_trade(self, account: str, key: str, row: Dict[str, Any]) -> None:
+        self._trades[(account, key)] = row
+        self._wake.set()
+
+    def put_kv(self, account: str, name: str, value: Any, seen_ts: Optional[float] = None) -> None:
+        self._kv[(account, name)] = (value, seen_ts)
+        self._wake.set()
+
+    def put_ingest(self, row: Dict[str, Any]) -> None:
+        self._ingest.append(row)
+        if len(self._ingest) > self.ingest_keep:
+            del self._ingest[:-self.ingest_keep]   # only the newest rows are ever read back
+        self._wake.set()
+
+    def put_equity(self, account: str, t: float, v: float, bars: List[Tuple[int, Tuple]]) -> None:
+        """One equity sample plus the roll-up bars it updated ((res, row) pairs; later rows win)."""
+        self._equity.append((account, t, v))
+        for res, row in bars:
+            self._bars[(account, res, row[0])] = tuple(row)
+        self._wake.set()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": self.path,
+            "running": self._task is not None and not self._task.done(),
+            "pending": len(self._trades) + len(self._kv) + len(self._ingest) + len(self._equity) + len(self._bars),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+    # -------- lifecycle --------
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Commit whatever is pending, then close the database."""
+        self._stopping = True
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+        await asyncio.to_thread(self._flush, *self._swap())
+        self._db.close()
+
+    # -------- consumer side --------
+    def _swap(self):
+        batch = (self._trades, self._kv, self._ingest, self._equity, self._bars)
+        self._trades, self._kv, self._ingest, self._equity, self._bars = {}, {}, [], [], {}
+        return batch
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self._wake.wait()
+            self._wake.clear()
+            await asyncio.sleep(self.flush_secs)     # let a burst of ingests collapse into one commit
+            await asyncio.to_thread(self._flush, *self._swap())
+
+    def _flush(self, trades: Dict[Tuple[str, str], Dict[str, Any]],
+               kv: Dict[Tuple[str, str], Tuple[Any, Optional[float]]],
+               ingest: List[Dict[str, Any]], equity: List[Tuple[str, float, float]],
+               bars: Dict[Tuple[str, int, float], Tuple]) -> None:
+        if not (trades or kv or ingest or equity or bars):
+            return
+        t0 = time.perf_counter()
+        now = time.time()
+        try:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO trades(account, pos_key, rev, time_done, row, updated_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(account, pos_key) DO UPDATE SET rev=excluded.rev, time_done=excluded.time_done, "
+                "row=excluded.row, updated_at=excluded.updated_at WHERE trades.rev != excluded.rev",
+                [(a, k, r.get("rev", ""), r.get("time_done"), json.dumps(r, ensure_ascii=False), now)
+                 for (a, k), r in trades.items()])
+            self._db.executemany(
+                "INSERT INTO kv(account, name, value, seen_ts) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(account, name) DO UPDATE SET value=excluded.value, seen_ts=excluded.seen_ts",
+                [(a, n, json.dumps(v, ensure_ascii=False) if v is not None else None, ts)
+                 for (a, n), (v, ts) in kv.items()])
+            if ingest:
+                self._db.executemany("INSERT INTO ingest_log(row) VALUES (?)",
+                                     [(json.dumps(r, ensure_ascii=False),) for r in ingest])
+                self._db.execute("DELETE FROM ingest_log WHERE id <= (SELECT MAX(id) FROM ingest_log) - ?",
+                                 (self.ingest_keep,))
+            if equity:
+                self._db.executemany("INSERT INTO equity_raw(account, t, v) VALUES (?, ?, ?)", equity)
+                if self.equity_keep.get(0):
+                    for a in {a for a, _, _ in equity}:
+                        self._db.execute(
+                            "DELETE FROM equity_raw WHERE account = ? AND id <= (SELECT id FROM equity_raw "
+                            "WHERE account = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                            (a, a, self.equity_keep[0]))
+            if bars:
+                self._db.executemany(
+                    "INSERT INTO equity_bars(account, res, t, open, high, low, close, n) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(account, res, t) DO UPDATE SET open=excluded.open, high=excluded.high, "
+                    "low=excluded.low, close=excluded.close, n=excluded.n",
+                    [(a, res, *row) for (a, res, _), row in bars.items()])
+                for a, res in {(a, res) for a, res, _ in bars}:
+                    if self.equity_keep.get(res):
+                        self._db.execute(
+                            "DELETE FROM equity_bars WHERE account = ? AND res = ? AND t <= (SELECT t FROM equity_bars "
+                            "WHERE account = ? AND res = ? ORDER BY t DESC LIMIT 1 OFFSET ?)",
+                            (a, res, a, res, self.equity_keep[res]))
+            self._db.execute("COMMIT")
+            self.flushes += 1
+            self.rows_written += len(trades) + len(kv) + len(ingest) + len(equity) + len(bars)
+            self.last_flush_ms = (time.perf_counter() - t0) * 1e3
+        except Exception as e:
+            try:
+                self._db.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            # keep the batch for the next flush rather than losing it
+            for k, r in trades.items():
+                self._trades.setdefault(k, r)
+            for n, v in kv.items():
+                self._kv.setdefault(n, v)
+            self._ingest[:0] = ingest
+            self._equity[:0] = equity
+            for k, row in bars.items():
+                self._bars.setdefault(k, row)
+            self.errors += 1
+            self.last_error = str(e)
+            print("[STATE_DB_ERROR]", str(e))
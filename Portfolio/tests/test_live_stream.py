@@ -0,0 +1,54 @@
+import asyncio
+
+from live_stream import EventHub
+
+
+def _batch(sub):
+    return asyncio.run(sub.next_batch(0.01))
+
+def _publish(hub, n):
+    for i in range(n):
+        hub.publish("trade", {"i": i}, key=str(i))
+
+
+def test_resume_replays_missed_events():
+    hub = EventHub()
+    _publish(hub, 5)
+    seq, epoch = hub.parse_event_id(hub.event_id({"seq": 3}))
+    batch = _batch(hub.subscribe(seq, epoch))
+    assert [ev["seq"] for ev in batch] == [4, 5]
+
+def test_resume_after_restart_resets():
+    old = EventHub()
+    _publish(old, 500)
+    last_id = old.event_id(old.backlog[-1])
+
+    new = EventHub()                        # the backend restarted: seq is back at 0
+    _publish(new, 3)
+    seq, epoch = new.parse_event_id(last_id)
+    batch = _batch(new.subscribe(seq, epoch))
+    assert batch[0]["type"] == "reset" and batch[0]["seq"] == 3
+    assert len(batch) == 1
+
+def test_resume_past_current_seq_resets_without_epoch():
+    hub = EventHub()
+    sub = hub.subscribe(500)                # bare ?since= from before a restart
+    hub.publish("equity", {"e": 1})
+    batch = _batch(sub)
+    assert [ev["type"] for ev in batch] == ["reset", "equity"]
+    assert batch[0]["seq"] == 0 and batch[1]["seq"] == 1
+
+def test_resume_from_a_newer_epoch_after_the_old_seq_was_passed():
+    old = EventHub()
+    _publish(old, 2)
+    new = EventHub()
+    _publish(new, 10)
+    seq, epoch = new.parse_event_id(old.event_id(old.backlog[-1]))
+    assert seq == 2 and epoch == old.epoch
+    assert _batch(new.subscribe(seq, epoch))[0]["type"] == "reset"
+
+def test_parse_event_id():
+    hub = EventHub()
+    assert hub.parse_event_id("17") == (17, None)
+    assert hub.parse_event_id("ab12cd34-17") == (17, "ab12cd34")
+    assert hub.parse_event_id("garbage") == (None, None)
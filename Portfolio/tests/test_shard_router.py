@@ -0,0 +1,121 @@
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from accounts import shard_of
+
+PORTFOLIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARDS = 2
+
+
+def _free_port_block(n: int) -> int:
+    """A base port with base .. base+n free (router + shards)."""
+    for _ in range(50):
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            base = s.getsockname()[1]
+        if base + n > 65535:
+            continue
+        try:
+            for p in range(base, base + n + 1):
+                with socket.socket() as s:
+                    s.bind(("127.0.0.1", p))
+            return base
+        except OSError:
+            continue
+    raise RuntimeError("no free port block")
+
+def _wait(port: int, secs: float = 20.0) -> None:
+    deadline = time.time() + secs
+    while time.time() < deadline:
+        try:
+            c = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            c.request("GET", "/api/live/accounts")
+            c.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"port {port} did not come up")
+
+@pytest.fixture(scope="module")
+def backend():
+    port = _free_port_block(SHARDS)
+    env = {**os.environ, "SHARDS": str(SHARDS), "PORT": str(port), "STATE_DB": "", "LOG_STDOUT": "0"}
+    env.pop("SHARD_INDEX", None)
+    proc = subprocess.Popen([sys.executable, "backend.py"], cwd=PORTFOLIO, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for p in range(port, port + SHARDS + 1):
+            _wait(p)
+        yield port
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+def _request(port, method, path, body=None, headers=None):
+    c = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    c.request(method, path, body=json.dumps(body) if body is not None else None,
+              headers={"X-API-Key": "dev-key", "Content-Type": "application/json", **(headers or {})})
+    r = c.getresponse()
+    return r.status, json.loads(r.read() or b"null"), r
+
+def _accounts_on(port, shard):
+    _, body, _ = _request(port + 1 + shard, "GET", "/api/live/accounts")
+    return {a["account"] for a in body["data"]}
+
+def _accounts(n, shard):
+    return [a for a in (f"{i}@RouterDemo" for i in range(1, 100)) if shard_of(a, SHARDS) == shard][:n]
+
+
+def test_shard_answers_421_for_foreign_account(backend):
+    acct = _accounts(1, 1)[0]
+    status, _, resp = _request(backend + 1, "POST", "/ingest/snapshot", {"equity_curve": {"current_equity": 1}},
+                               {"X-Account": acct})
+    assert status == 421 and resp.getheader("X-Shard") == "1"
+
+def test_router_forwards_by_x_account(backend):
+    for shard in range(SHARDS):
+        acct = _accounts(1, shard)[0]
+        login, server = acct.split("@")
+        status, body, _ = _request(backend, "POST", "/ingest/snapshot",
+                                   {"account_info": {"account_login": int(login), "server": server, "equity": 5}},
+                                   {"X-Account": acct})
+        assert status == 200 and body["ok"]
+        assert acct in _accounts_on(backend, shard)
+        _, body, _ = _request(backend, "GET", f"/api/live/account?account={acct}")
+        assert body["data"]["account_login"] == int(login)
+
+def test_ingest_without_header_on_wrong_shard_is_redirected(backend):
+    # this host last ingested into shard 1, so an EA post without X-Account goes there first;
+    # its account_info record belongs to shard 0, which makes shard 1 answer 421 and the router re-send
+    first = _accounts(3, 1)[2]
+    _request(backend, "POST", "/ingest/snapshot", {"equity_curve": {"current_equity": 1}}, {"X-Account": first})
+    acct = _accounts(3, 0)[2]
+    login, server = acct.split("@")
+    status, body, _ = _request(backend, "POST", "/ingest/batch",
+                               [{"account_info": {"account_login": int(login), "server": server, "equity": 7}}])
+    assert status == 200 and body["ok"] and body["account"] == acct
+    assert acct in _accounts_on(backend, 0) and acct not in _accounts_on(backend, 1)
+    # later records without an account follow this host to the same shard, bare logins resolve too
+    status, body, _ = _request(backend, "POST", "/ingest/snapshot",
+                               {"equity_curve": {"current_equity": 8, "is_trade_active": False}})
+    assert status == 200 and body["ok"]
+    _, body, _ = _request(backend, "GET", f"/api/live/account?account={login}")
+    assert body["data"]["account_login"] == int(login)
+
+def test_stream_through_router(backend):
+    acct = _accounts(1, 1)[0]
+    c = http.client.HTTPConnection("127.0.0.1", backend, timeout=10)
+    c.request("GET", f"/api/live/stream?account={acct}&since=999999")
+    r = c.getresponse()
+    assert r.status == 200 and r.getheader("X-Account") == acct
+    seen = b""
+    while b"event: reset" not in seen:
+        seen += r.fp.readline()
+    c.close()
@@ -0,0 +1,79 @@
+# trade_index.py
+import json, base64, bisect, hashlib
+from typing import Optional, Dict, Any, List, Tuple
+
+_MAX_KEY = "\U0010ffff"   # sorts after every real key with the same time_done
+
+
+def _sort_key(key: str, row: Dict[str, Any]) -> Tuple[str, str]:
+    return (row.get("time_done") or "", key)
+
+def _row_hash(key: str, rev: str) -> int:
+    return int(hashlib.sha1(f"{key}:{rev}".encode("utf-8")).hexdigest(), 16)
+
+
+def encode_cursor(sort_key: Tuple[str, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(sort_key)).encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Inverse of encode_cursor; raises ValueError on anything else."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        t, key = json.loads(raw)
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(t, str) or not isinstance(key, str):
+        raise ValueError("invalid cursor")
+    return (t, key)
+
+
+class TradeIndex:
+    """
+    Trade keys ordered by (time_done, key), kept sorted as rows arrive, plus a
+    collection digest: the XOR of sha1(key:rev) over all rows, updated in O(1) per
+    revision, so an ETag never needs a pass over the history.
+    """
+
+    def __init__(self):
+        self._keys: List[Tuple[str, str]] = []
+        self._digest = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def rebuild(self, rows: Dict[str, Dict[str, Any]]) -> None:
+        """Index a whole key -> row mapping at once (warm start): one sort instead of n inserts."""
+        self._keys = sorted(_sort_key(k, r) for k, r in rows.items())
+        self._digest = 0
+        for k, r in rows.items():
+            self._digest ^= _row_hash(k, r.get("rev", ""))
+
+    def upsert(self, key: str, old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> None:
+        """Apply a new revision of ``key`` (``old`` = the row it replaces, if any)."""
+        if old is not None:
+            self._digest ^= _row_hash(key, old.get("rev", ""))
+            sk = _sort_key(key, old)
+            i = bisect.bisect_left(self._keys, sk)
+            if i < len(self._keys) and self._keys[i] == sk:
+                del self._keys[i]
+        self._digest ^= _row_hash(key, new.get("rev", ""))
+        bisect.insort(self._keys, _sort_key(key, new))
+
+    def etag(self, *query: Any) -> str:
+        """Strong ETag of the collection state plus the query that shapes the response."""
+        blob = json.dumps([len(self._keys), f"{self._digest:040x}", *query], default=str)
+        return '"' + hashlib.sha1(blob.encode("utf-8")).hexdigest() + '"'
+
+    def page(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+             since: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """
+        Keys newest first. ``cursor`` continues after the last row of the previous page,
+        ``since`` keeps only rows with time_done > since. Returns (keys, next_cursor).
+        """
+        lo = bisect.bisect_right(self._keys, (since, _MAX_KEY)) if since else 0
+        hi = bisect.bisect_left(self._keys, decode_cursor(cursor)) if cursor else len(self._keys)
+        if hi <= lo:
+            return [], None
+        stop = max(lo, hi - limit) if limit else lo
+        keys = [self._keys[i][1] for i in range(hi - 1, stop - 1, -1)]
+        return keys, (encode_cursor(self._keys[stop]) if stop > lo else None)
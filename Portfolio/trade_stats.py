@@ -0,0 +1,114 @@
+# trade_stats.py
+import math
+from typing import Optional, Dict, Any
+
+LOT_UNITS = 10**8     # volumes kept as integer 1e-8 lots
+
+
+def as_float(v) -> Optional[float]:
+    if v is None: return None
+    try:
+        f = float(v)
+    except Exception:
+        return None
+    return f if math.isfinite(f) else None
+
+
+def _rrr(row: Dict[str, Any]) -> Optional[float]:
+    """Planned reward:risk of an entry order, |tp - open| / |open - sl| (None without both levels)."""
+    price, sl, tp = as_float(row.get("price_open")), as_float(row.get("sl")), as_float(row.get("tp"))
+    if not price or not sl or not tp:
+        return None
+    risk = abs(price - sl)
+    return abs(tp - price) / risk if risk > 0 else None
+
+
+class TradeStats:
+    """
+    Running aggregates over the stored trade rows. add()/remove() are O(1), so a
+    changed revision is applied as remove(old) + add(new). Money is summed in integer
+    cents and lots in integer 1e-8 units, so retractions never drift.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.trades = 0
+        self.lot_units = 0
+        self.closed = 0               # rows with a profit
+        self.sum_cents = 0
+        self.sum_sq_cents = 0
+        self.wins = 0
+        self.win_cents = 0
+        self.losses = 0
+        self.loss_cents = 0           # negative
+        self.rrr_count = 0
+        self.rrr_sum = 0.0
+
+    def _apply(self, row: Dict[str, Any], sign: int) -> None:
+        self.trades += sign
+        v = as_float(row.get("volume_initial"))
+        if v is not None:
+            self.lot_units += sign * int(round(v * LOT_UNITS))
+        p = as_float(row.get("profit"))
+        if p is not None:
+            c = int(round(p * 100))
+            self.closed += sign
+            self.sum_cents += sign * c
+            self.sum_sq_cents += sign * c * c
+            if c > 0:
+                self.wins += sign
+                self.win_cents += sign * c
+            elif c < 0:
+                self.losses += sign
+                self.loss_cents += sign * c
+        r = _rrr(row)
+        if r is not None:
+            self.rrr_count += sign
+            self.rrr_sum += sign * r
+            if self.rrr_count == 0:
+                self.rrr_sum = 0.0    # drop float residue once nothing is left
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self._apply(row, +1)
+
+    def remove(self, row: Dict[str, Any]) -> None:
+        self._apply(row, -1)
+
+    def replace(self, old: Optional[Dict[str, Any]], new: Dict[str, Any]) -> None:
+        if old is not None:
+            self.remove(old)
+        self.add(new)
+
+    def snapshot(self, equity: Optional[float] = None, balance: Optional[float] = None) -> Dict[str, Any]:
+        decisive = self.wins + self.losses
+        win_rate = (100.0 * self.wins / decisive) if decisive else None
+        average_profit = (self.win_cents / self.wins / 100.0) if self.wins else 0.0
+        # average_loss is a NEGATIVE number (mean of losses)
+        average_loss = (self.loss_cents / self.losses / 100.0) if self.losses else 0.0
+
+        expectancy = sharpe = None
+        if self.closed:
+            mean = self.sum_cents / self.closed
+            expectancy = mean / 100.0
+            if self.closed > 1:
+                # exact integer variance numerator: n*sum(x^2) - sum(x)^2
+                var = (self.closed * self.sum_sq_cents - self.sum_cents ** 2) / (self.closed * (self.closed - 1))
+                sharpe = (mean / math.sqrt(var)) if var > 0 else None    # per trade, not annualised
+        profit_factor = (self.win_cents / -self.loss_cents) if self.loss_cents else None
+        average_rrr = (self.rrr_sum / self.rrr_count) if self.rrr_count else None
+
+        return {
+            "equity": round(equity, 2) if equity is not None else None,
+            "balance": round(balance, 2) if balance is not None else None,
+            "win_rate": round(win_rate, 2) if win_rate is not None else None,
+            "average_profit": round(average_profit, 2),
+            "average_loss": round(average_loss, 2),
+            "number_of_trades": self.trades,
+            "lots": round(self.lot_units / LOT_UNITS, 2),
+            "average_rrr": round(average_rrr, 2) if average_rrr is not None else None,
+            "sharpe_ratio": round(sharpe, 4) if sharpe is not None else None,
+            "expectancy": round(expectancy, 2) if expectancy is not None else None,
+            "profit_factor": round(profit_factor, 2) if profit_factor is not None else None,
+        }
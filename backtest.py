@@ -0,0 +1,338 @@
+# Vectorized Python port of usdjpy_breakout_backtest.mq5
+#   python backtest.py                       USDJPY H4 testing/ CSV + the 2022-2025 predictions
+#   python backtest.py --out trades.csv --equity equity.csv
+import argparse
+import sys
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+
+class Settings(NamedTuple):
+    """EA inputs (same names, snake_case) plus the symbol/account properties the tester supplies."""
+    use_money_management: bool = True
+    risk_percent: float = 2.0
+    fixed_volume: float = 0.1
+    high_low_bars: int = 8
+    risk_to_reward: float = 3.0
+    use_break_even: bool = False
+    break_even_ratio: int = 0
+    lock_profit: int = 0
+    start_hour: int = 8
+    start_minute: int = 0
+    end_hour: int = 20
+    end_minute: int = 0
+    # symbol / account
+    point: float = 0.001
+    contract_size: float = 100_000.0
+    volume_min: float = 0.01
+    volume_max: float = 100.0
+    volume_step: float = 0.01
+    stops_level: int = 0          # SYMBOL_TRADE_STOPS_LEVEL, points
+    adjust_points: int = 10       # AdjustAbove/BelowStopLevel margin, points
+    use_spread: bool = True       # bars are bid prices; ask = bid + spread * point
+    account_is_base: bool = True  # USD account on USDJPY: quote-currency P&L is divided by the price
+    initial_balance: float = 10_000.0
+
+
+MAX_PERCENT = 10   # MoneyManagement.mqh caps the risked balance %
+
+LABELS = {"buy": 1, "sell": -1}
+
+
+class Simulation(NamedTuple):
+    """Raw arrays of one run: per filled order, plus per-bar balance/equity."""
+    session_start: np.ndarray   # epoch seconds
+    direction: np.ndarray       # +1 buy, -1 sell
+    order_price: np.ndarray
+    sl: np.ndarray
+    tp: np.ndarray
+    entry_time: np.ndarray
+    entry_price: np.ndarray
+    exit_time: np.ndarray
+    exit_price: np.ndarray
+    exit_reason: np.ndarray
+    volume: np.ndarray
+    profit: np.ndarray
+    bar_time: np.ndarray
+    balance: np.ndarray         # closed trades only
+    equity: np.ndarray          # balance + floating P&L at each bar close
+
+
+class BacktestResult(NamedTuple):
+    trades: pd.DataFrame    # one row per filled order
+    equity: pd.DataFrame    # per bar: balance (closed trades) and equity (incl. floating P&L)
+
+
+# ===========================
+# Inputs
+# ===========================
+def load_predictions(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Predictions CSV (timestamp,prediction[,true_label]) -> (sorted epoch seconds, +1/-1/0 direction)."""
+    df = pd.read_csv(path)
+    times = pd.to_datetime(df['timestamp']).values.astype('datetime64[s]').astype(np.int64)
+    dirs = df['prediction'].map(LABELS).fillna(0).to_numpy(np.int8)
+    order = np.argsort(times, kind='stable')
+    return times[order], dirs[order]
+
+def load_bars(csv_path: str) -> Dict[str, np.ndarray]:
+    """OHLC + spread columns of one MT5 CSV export (via the bar_store cache)."""
+    from bar_store import load_columns
+    return load_columns(csv_path, ['time', 'open', 'high', 'low', 'close', 'spread'])
+
+
+# ===========================
+# Engine
+# ===========================
+def _verify_volume(volume: float, s: Settings) -> float:
+    """VerifyVolume() from MoneyManagement.mqh."""
+    if volume < s.volume_min:
+        size = s.volume_min
+    elif volume > s.volume_max:
+        size = s.volume_max
+    else:
+        size = round(volume / s.volume_step) * s.volume_step
+    return round(size, 1 if s.volume_step >= 0.1 else 2)
+
+def _sessions(times: np.ndarray, s: Settings) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs of consecutive bars whose open time lies in [start, end) of the day
+    (CTimer.DailyTimer). Returns (first bar, first bar after the run) per session.
+    """
+    tod = times % 86400
+    start = s.start_hour * 3600 + s.start_minute * 60
+    end = s.end_hour * 3600 + s.end_minute * 60
+    in_win = (tod >= start) & (tod < end) if start <= end else (tod >= start) | (tod < end)
+    edge = np.diff(np.concatenate([[0], in_win.astype(np.int8), [0]]))
+    return np.flatnonzero(edge == 1), np.flatnonzero(edge == -1)
+
+def _first(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(any, index of first True) along axis 1."""
+    return mask.any(axis=1), mask.argmax(axis=1)
+
+def simulate(bars: Dict[str, np.ndarray], pred_times: np.ndarray, pred_dirs: np.ndarray,
+             s: Settings = Settings(), start_time: Optional[int] = None) -> Simulation:
+    """
+    Bar-level replay of the EA's OnTick logic:
+      - at the first bar of each StartHour-EndHour session take the latest prediction
+        at or before that bar and place one BuyStop (buy) or SellStop (sell) at the
+        HighLowBars high/low, SL on the opposite side, TP = RiskToRewardRatio x SL distance
+      - when the window closes, open positions are closed and pendings deleted
+      - optional break-even moves the SL to entry + LockProfit once price has run
+        BreakEvenRatio x the SL distance
+    Within a bar the order of high and low is unknown, so an SL and TP (or BE trigger)
+    reached in the same bar count as SL first. Commission and swap are not modelled.
+    Sessions opening before ``start_time`` are skipped (earlier bars still feed HighLowBars).
+    """
+    t = np.asarray(bars['time'], np.int64)
+    o, h, l, c = (np.asarray(bars[k], float) for k in ('open', 'high', 'low', 'close'))
+    n = len(t)
+    spr = (np.asarray(bars['spread'], float) * s.point if s.use_spread and 'spread' in bars
+           else np.zeros(n))
+    pt = s.point
+
+    # ---- sessions with a usable prediction and enough history ----
+    starts, ends = _sessions(t, s)
+    hl = s.high_low_bars
+    pos = np.searchsorted(pred_times, t[starts], side='right') - 1
+    d = np.where(pos >= 0, pred_dirs[np.maximum(pos, 0)], 0).astype(np.int8)
+    keep = (d != 0) & (starts >= hl - 1)
+    if start_time is not None:
+        keep &= t[starts] >= start_time
+    starts, ends, d = starts[keep], ends[keep], d[keep].astype(float)
+
+    # HighestHigh/LowestLow(HighLowBars) at the session's first tick: the previous
+    # HighLowBars-1 closed bars plus the forming bar, which is still only its open
+    hh, ll = o[starts].copy(), o[starts].copy()
+    if hl > 1:
+        hw = np.lib.stride_tricks.sliding_window_view(h, hl - 1).max(axis=1)
+        lw = np.lib.stride_tricks.sliding_window_view(l, hl - 1).min(axis=1)
+        hh = np.maximum(hh, hw[starts - hl + 1])
+        ll = np.minimum(ll, lw[starts - hl + 1])
+
+    # AdjustAbove/BelowStopLevel against ask/bid at the session open
+    margin = (s.stops_level + s.adjust_points) * pt
+    buy = d > 0
+    price = np.where(buy, np.maximum(hh, o[starts] + spr[starts] + margin),
+                     np.minimum(ll, o[starts] - margin))
+    sl = np.where(buy, ll, hh)
+    tp = price + (price - sl) * s.risk_to_reward
+
+    # ---- sessions x bars matrices, mirrored so that every order behaves like a buy ----
+    width = int((ends - starts).max()) if len(starts) else 0
+    col = np.arange(width)
+    J = starts[:, None] + col
+    valid = J < ends[:, None]
+    J = np.minimum(J, n - 1)
+    D = d[:, None]
+    S = spr[J]
+    # entry side: a buy stop fills on the ask, a sell stop on the bid
+    ent_up = np.where(D > 0, h[J] + S, -l[J])
+    ent_open = np.where(D > 0, o[J] + S, -o[J])
+    # exit side: a long closes on the bid, a short on the ask
+    ex_up = np.where(D > 0, h[J], -(l[J] + S))
+    ex_down = np.where(D > 0, l[J], -(h[J] + S))
+    ex_open = np.where(D > 0, o[J], -(o[J] + S))
+    ex_close = np.where(D > 0, c[J], -(c[J] + S))
+    price_m, sl_m, tp_m = d * price, d * sl, d * tp
+
+    filled, k = _first(valid & (ent_up >= price_m[:, None]))
+    rows = np.arange(len(starts))
+    entry_m = np.maximum(price_m, ent_open[rows, k])     # a gap through the stop fills at the open
+    active = valid & (col >= k[:, None]) & filled[:, None]
+
+    sl_eff = np.broadcast_to(sl_m[:, None], active.shape)
+    if s.use_break_even and s.break_even_ratio > 0:
+        be_points = np.trunc(s.break_even_ratio * (entry_m - sl_m) / pt)
+        be_hit, be_col = _first(active & (ex_up - entry_m[:, None] >= be_points[:, None] * pt))
+        be_sl = np.maximum(sl_m, entry_m + s.lock_profit * pt)
+        moved = be_hit[:, None] & (col > be_col[:, None])   # the new SL applies from the next bar
+        sl_eff = np.where(moved, be_sl[:, None], sl_m[:, None])
+
+    hit_sl = active & (ex_down <= sl_eff)
+    hit_tp = active & (ex_up >= tp_m[:, None])
+    exited, e = _first(hit_sl | hit_tp)
+    by_sl = hit_sl[rows, e]
+    gap = e > k
+    sl_px = np.where(gap, np.minimum(sl_eff[rows, e], ex_open[rows, e]), sl_eff[rows, e])
+    tp_px = np.where(gap, np.maximum(tp_m, ex_open[rows, e]), np.maximum(tp_m, entry_m))
+    # not stopped out: closed at the first tick outside the window (or the last bar in the data)
+    end_bar = np.minimum(ends, n - 1)
+    end_px = np.where(ends < n, np.where(d > 0, o[end_bar], -(o[end_bar] + spr[end_bar])),
+                      np.where(d > 0, c[end_bar], -(c[end_bar] + spr[end_bar])))
+    exit_m = np.where(exited, np.where(by_sl, sl_px, tp_px), end_px)
+    exit_bar = np.where(exited, J[rows, e], end_bar)
+    reason = np.where(exited, np.where(by_sl, "sl", "tp"), "session_end")
+    if s.use_break_even:
+        reason = np.where(exited & by_sl & (sl_eff[rows, e] != sl_m), "break_even", reason)
+
+    # ---- sizing + balance: sequential only over the filled orders ----
+    f = np.flatnonzero(filled)
+    entry_px, exit_px = d[f] * entry_m[f], d[f] * exit_m[f]
+    stop_points = np.trunc((hh[f] - ll[f]) / pt)
+    quote_ref = o[starts[f]]
+    volumes = np.empty(len(f))
+    profits = np.empty(len(f))
+    balance = s.initial_balance
+    for i in range(len(f)):
+        tick_value = s.contract_size * pt / (quote_ref[i] if s.account_is_base else 1.0)
+        if s.use_money_management and s.risk_percent > 0 and stop_points[i] > 0:
+            risk = balance * min(s.risk_percent, MAX_PERCENT) / 100
+            vol = _verify_volume(risk / stop_points[i] / tick_value, s)
+        else:
+            vol = _verify_volume(s.fixed_volume, s)
+        pnl = (exit_m[f[i]] - entry_m[f[i]]) * vol * s.contract_size
+        if s.account_is_base:
+            pnl /= exit_px[i]
+        volumes[i], profits[i] = vol, pnl
+        balance += pnl
+
+    # ---- equity curve: realized at the exit bar + floating P&L at each bar close ----
+    realized = np.zeros(n)
+    np.add.at(realized, exit_bar[f], profits)
+    bal_curve = s.initial_balance + np.cumsum(realized)
+    open_at_close = active & (col < np.where(exited, e, width)[:, None])
+    floating = np.zeros(n)
+    if len(f):
+        vol_of = np.zeros(len(starts))
+        vol_of[f] = volumes
+        fl = (ex_close - entry_m[:, None]) * vol_of[:, None] * s.contract_size
+        if s.account_is_base:
+            fl = fl / np.abs(ex_close)
+        np.add.at(floating, J[open_at_close], fl[open_at_close])
+    return Simulation(t[starts[f]], d[f].astype(np.int8), price[f], sl[f], tp[f],
+                      t[J[f, k[f]]], entry_px, t[exit_bar[f]], exit_px, reason[f], volumes, profits,
+                      t, bal_curve, bal_curve + floating)
+
+
+def run_backtest(bars: Dict[str, np.ndarray], pred_times: np.ndarray, pred_dirs: np.ndarray,
+                 s: Settings = Settings(), start_time: Optional[int] = None) -> BacktestResult:
+    """simulate() as a trade list and an equity-curve frame."""
+    sim = simulate(bars, pred_times, pred_dirs, s, start_time)
+    trades = pd.DataFrame({
+        'session_start': pd.to_datetime(sim.session_start, unit='s'),
+        'direction': np.where(sim.direction > 0, 'buy', 'sell'),
+        'order_price': sim.order_price, 'sl': sim.sl, 'tp': sim.tp,
+        'entry_time': pd.to_datetime(sim.entry_time, unit='s'), 'entry_price': sim.entry_price,
+        'exit_time': pd.to_datetime(sim.exit_time, unit='s'), 'exit_price': sim.exit_price,
+        'exit_reason': sim.exit_reason, 'volume': sim.volume, 'profit': sim.profit,
+        'balance': s.initial_balance + np.cumsum(sim.profit),
+    })
+    equity = pd.DataFrame({'balance': sim.balance, 'equity': sim.equity},
+                          index=pd.DatetimeIndex(sim.bar_time.astype('datetime64[s]'), name='time'))
+    return BacktestResult(trades, equity)
+
+
+def metrics(profit: np.ndarray, equity: np.ndarray, initial_balance: float) -> Dict[str, float]:
+    """Headline statistics from per-trade profits and the per-bar equity curve."""
+    wins = profit > 0
+    gross_win, gross_loss = profit[wins].sum(), -profit[~wins].sum()
+    if len(equity):
+        peak = np.maximum.accumulate(equity)
+        max_dd = float(((peak - equity) / peak).max() * 100)
+    else:
+        max_dd = 0.0
+    return {
+        'trades': int(len(profit)),
+        'win_rate': float(wins.mean()) if len(profit) else float('nan'),
+        'net_profit': float(profit.sum()),
+        'profit_factor': float(gross_win / gross_loss) if gross_loss > 0 else float('inf'),
+        'final_balance': float(initial_balance + profit.sum()),
+        'max_drawdown_pct': max_dd,
+    }
+
+def summarize(result: BacktestResult, s: Settings = Settings()) -> Dict[str, float]:
+    return metrics(result.trades['profit'].to_numpy(), result.equity['equity'].to_numpy(), s.initial_balance)
+
+
+# ===========================
+# Reference check
+# ===========================
+def main():
+    defaults = Settings()
+    ap = argparse.ArgumentParser(description="Vectorized backtest of usdjpy_breakout_backtest.mq5")
+    ap.add_argument("--csv", default=None, help="MT5 CSV export (default: testing/USDJPY_H4_*.csv)")
+    ap.add_argument("--predictions", default="code_to_cash_usdjpy_h4_2022-2025_predictions.csv")
+    ap.add_argument("--risk-percent", type=float, default=defaults.risk_percent)
+    ap.add_argument("--high-low-bars", type=int, default=defaults.high_low_bars)
+    ap.add_argument("--rr", type=float, default=defaults.risk_to_reward)
+    ap.add_argument("--break-even-ratio", type=int, default=0, help="> 0 enables break-even")
+    ap.add_argument("--lock-profit", type=int, default=0)
+    ap.add_argument("--balance", type=float, default=defaults.initial_balance)
+    ap.add_argument("--out", default=None, help="trade list CSV")
+    ap.add_argument("--equity", default=None, help="equity curve CSV")
+    args = ap.parse_args()
+
+    csv_path: Optional[str] = args.csv
+    if csv_path is None:
+        from bar_store import find_csvs
+        found = find_csvs("USDJPY", "H4", ["testing"])
+        if not found:
+            sys.exit("No testing/USDJPY_H4_*.csv found")
+        csv_path = found[-1]
+
+    s = Settings(risk_percent=args.risk_percent, high_low_bars=args.high_low_bars, risk_to_reward=args.rr,
+                 use_break_even=args.break_even_ratio > 0, break_even_ratio=args.break_even_ratio,
+                 lock_profit=args.lock_profit, initial_balance=args.balance)
+    bars = load_bars(csv_path)
+    pred_t, pred_d = load_predictions(args.predictions)
+
+    t0 = time.perf_counter()
+    result = run_backtest(bars, pred_t, pred_d, s)
+    elapsed = time.perf_counter() - t0
+
+    print(f"[Backtest] {csv_path}: {len(bars['time'])} bars in {elapsed * 1e3:.1f} ms")
+    for key, val in summarize(result, s).items():
+        print(f"  {key:<17} {val:,.2f}" if isinstance(val, float) else f"  {key:<17} {val}")
+    if args.out:
+        result.trades.to_csv(args.out, index=False)
+        print(f"[Backtest] Wrote {args.out}")
+    if args.equity:
+        result.equity.to_csv(args.equity)
+        print(f"[Backtest] Wrote {args.equity}")
+
+
+if __name__ == "__main__":
+    main()
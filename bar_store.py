@@ -0,0 +1,164 @@
+# Columnar, memory-mapped cache for the MT5-exported OHLC CSVs
+#   python bar_store.py [training testing]   converts every CSV once (and re-converts stale ones)
+import glob
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Layout of MetaTrader5.copy_rates_* results; one .npy file per field in the cache
+RATES_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+    ('tick_volume', '<u8'), ('spread', '<i4'), ('real_volume', '<u8'),
+])
+
+CACHE_DIR     = os.getenv("CTC_BAR_CACHE", ".bar_cache")
+CACHE_VERSION = 1
+
+
+def read_mt5_csv(path: str) -> np.ndarray:
+    """MT5-exported tab-separated bars (<DATE> <TIME> <OPEN> ...) as a RATES_DTYPE array."""
+    raw = pd.read_csv(path, sep='\t')
+    raw.columns = raw.columns.str.replace('<', '').str.replace('>', '').str.lower()
+    out = np.zeros(len(raw), RATES_DTYPE)
+    times = pd.to_datetime(raw['date'] + ' ' + raw['time'], format='%Y.%m.%d %H:%M:%S')
+    out['time'] = times.values.astype('datetime64[s]').astype(np.int64)
+    for col in ('open', 'high', 'low', 'close'):
+        out[col] = raw[col].to_numpy(float)
+    out['tick_volume'] = raw['tickvol'].to_numpy()
+    if 'spread' in raw:
+        out['spread'] = raw['spread'].to_numpy()
+    if 'vol' in raw:
+        out['real_volume'] = raw['vol'].to_numpy()
+    return out
+
+
+# ===========================
+# Conversion
+# ===========================
+def cache_path(csv_path: str, cache_dir: str = CACHE_DIR) -> str:
+    """Cache directory of one CSV: <cache_dir>/<split>/<csv stem>/ (split = parent folder)."""
+    split = os.path.basename(os.path.dirname(os.path.abspath(csv_path)))
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, split, stem)
+
+def _source_stamp(csv_path: str) -> Dict[str, int]:
+    st = os.stat(csv_path)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def is_fresh(csv_path: str, cache_dir: str = CACHE_DIR) -> bool:
+    """True if the cached columns were converted from the CSV as it is now."""
+    try:
+        with open(os.path.join(cache_path(csv_path, cache_dir), "meta.json")) as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("version") == CACHE_VERSION and meta.get("source") == _source_stamp(csv_path)
+
+def convert(csv_path: str, cache_dir: str = CACHE_DIR, force: bool = False) -> str:
+    """
+    Parse ``csv_path`` once and store each field as <field>.npy. meta.json is written
+    last, so an interrupted conversion is simply redone on the next load.
+    Returns the cache directory.
+    """
+    out_dir = cache_path(csv_path, cache_dir)
+    if not force and is_fresh(csv_path, cache_dir):
+        return out_dir
+    stamp = _source_stamp(csv_path)
+    rates = read_mt5_csv(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
+    for name in RATES_DTYPE.names:
+        tmp = os.path.join(out_dir, f"{name}.tmp.npy")
+        np.save(tmp, np.ascontiguousarray(rates[name]))
+        os.replace(tmp, os.path.join(out_dir, f"{name}.npy"))
+    meta = {"version": CACHE_VERSION, "source": stamp, "rows": int(len(rates)),
+            "csv": os.path.basename(csv_path)}
+    tmp = os.path.join(out_dir, "meta.json.tmp")
+    with open(tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(out_dir, "meta.json"))
+    return out_dir
+
+
+# ===========================
+# Loading
+# ===========================
+def load_columns(csv_path: str, fields: Optional[Iterable[str]] = None,
+                 cache_dir: str = CACHE_DIR) -> Dict[str, np.ndarray]:
+    """
+    Read-only memory-mapped columns of one CSV, converting it first if the cache is
+    missing or stale. Nothing is read from disk until a column is touched.
+    """
+    out_dir = convert(csv_path, cache_dir)
+    names = list(fields) if fields is not None else list(RATES_DTYPE.names)
+    return {name: np.load(os.path.join(out_dir, f"{name}.npy"), mmap_mode='r') for name in names}
+
+def load_rates(csv_path: str, cache_dir: str = CACHE_DIR) -> np.ndarray:
+    """Cached equivalent of read_mt5_csv (a RATES_DTYPE array in memory)."""
+    cols = load_columns(csv_path, cache_dir=cache_dir)
+    out = np.empty(len(cols['time']), RATES_DTYPE)
+    for name, arr in cols.items():
+        out[name] = arr
+    return out
+
+def load_frame(csv_path: str, fields: Iterable[str] = ('open', 'high', 'low', 'close', 'tick_volume'),
+               cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """Columns as a frame indexed by bar open time; the value columns stay memory-mapped."""
+    cols = load_columns(csv_path, ['time', *fields], cache_dir)
+    index = pd.DatetimeIndex(cols.pop('time').astype('datetime64[s]'), name='datetime')
+    return pd.DataFrame(cols, index=index, copy=False)
+
+def find_csvs(symbol: str, period: str = "H4", dirs: Iterable[str] = ("training", "testing"),
+              root: str = ".") -> List[str]:
+    """CSV exports of one symbol/period, in ``dirs`` order (e.g. training before testing)."""
+    paths: List[str] = []
+    for d in dirs:
+        paths += sorted(glob.glob(os.path.join(root, d, f"{symbol}_{period}_*.csv")))
+    return paths
+
+def load_h4_close(path: str, prefix: str) -> pd.DataFrame:
+    """Drop-in for the notebook's load_h4_close: one '<prefix>_close' column indexed by datetime."""
+    return load_frame(path, ['close']).rename(columns={'close': f'{prefix}_close'}).sort_index()
+
+def aligned_closes(symbols: List[str], period: str = "H4", split: str = "testing",
+                   root: str = ".", field: str = 'close') -> pd.DataFrame:
+    """
+    ``field`` of every symbol aligned on the first symbol's bar times (NaN where a
+    symbol has no bar). Series already on the same clock are used without copying;
+    the rest are gathered with one searchsorted each.
+    """
+    base = find_csvs(symbols[0], period, [split], root)
+    if not base:
+        raise RuntimeError(f"No {split} CSV for {symbols[0]} {period}")
+    target = np.asarray(load_columns(base[-1], ['time'])['time'])
+    cols: Dict[str, np.ndarray] = {}
+    for sym in symbols:
+        paths = find_csvs(sym, period, [split], root)
+        if not paths:
+            raise RuntimeError(f"No {split} CSV for {sym} {period}")
+        c = load_columns(paths[-1], ['time', field])
+        times, values = c['time'], c[field]
+        if len(times) == len(target) and np.array_equal(times, target):
+            cols[sym] = values
+            continue
+        pos = np.searchsorted(times, target)
+        pos_c = np.minimum(pos, len(times) - 1)
+        hit = (pos < len(times)) & (times[pos_c] == target)
+        cols[sym] = np.where(hit, values[pos_c], np.nan)
+    index = pd.DatetimeIndex(target.astype('datetime64[s]'), name='datetime')
+    return pd.DataFrame(cols, index=index, copy=False)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    dirs = sys.argv[1:] or ["training", "testing"]
+    for d in dirs:
+        for path in sorted(glob.glob(os.path.join(d, "*.csv"))):
+            fresh = is_fresh(path)
+            t0 = time.perf_counter()
+            out = convert(path)
+            print(f"{'cached   ' if fresh else 'converted'} {path} -> {out} ({time.perf_counter() - t0:.3f}s)")
@@ -0,0 +1,268 @@
+# Portfolio/backend.py under a synthetic EA load: history_order / equity snapshots and
+# gzip batches from several "terminals" while concurrent pollers read /api/live/*.
+# The backend runs in its own process (python bench/bench_backend.py --serve PORT) so
+# the load generator does not share its GIL.
+import gzip
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PORTFOLIO = os.path.join(os.path.dirname(HERE), "Portfolio")
+API_KEY = "bench-key"
+SYMBOLS = ["USDJPY", "EURUSD", "GBPUSD", "EURJPY", "XAUUSD"]
+POLL_PATHS = ["/api/live/trades", "/api/live/equity", "/api/live/stats", "/api/live/account",
+              "/api/live/equity/history?points=500"]
+
+
+class Client:
+    """One keep-alive HTTP/1.1 connection (per thread), reconnecting once on a dropped socket."""
+
+    def __init__(self, port: int, headers: Optional[Dict[str, str]] = None):
+        self.port = port
+        self.headers = dict(headers or {})
+        self.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+
+    def request(self, method: str, path: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes, http.client.HTTPResponse]:
+        hdrs = dict(self.headers, **(headers or {}))
+        for attempt in (0, 1):
+            try:
+                self.conn.request(method, path, body=body, headers=hdrs)
+                resp = self.conn.getresponse()
+                return resp.status, resp.read(), resp
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                self.conn.close()
+                self.conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+                if attempt:
+                    raise
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+# -------- synthetic EA payloads --------
+def _iso(ts: float) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+def account_info(login: int, balance: float) -> Dict[str, Any]:
+    return {"account_info": {
+        "account_login": login, "name": f"Bench {login}", "server": "BenchBroker-Demo", "currency": "USD",
+        "leverage": 100, "balance": balance, "equity": balance, "margin": 0.0, "margin_level": 0.0,
+        "positions_snapshot": {"count": 0, "position_ids": [], "symbols": [], "lots_open": 0.0},
+        "is_trade_active": False, "t": _iso(time.time()),
+    }}
+
+def history_orders(login: int, n: int, t0: float, rng: random.Random) -> List[Dict[str, Any]]:
+    """`n` closed positions, oldest first, with a running balance like the EA reports."""
+    balance, out = 10000.0, []
+    for i in range(n):
+        t_open = t0 + i * 3600 + rng.randint(0, 1800)
+        profit = round(rng.gauss(5.0, 40.0), 2)
+        out.append({"history_order": {
+            "ticket": login * 1000000 + i, "position_id": login * 1000000 + i,
+            "symbol": rng.choice(SYMBOLS), "type": rng.choice(["buy", "sell"]), "state": "filled",
+            "volume_initial": 0.1, "volume_current": 0.0,
+            "price_open": round(rng.uniform(1.0, 160.0), 5), "sl": 0.0, "tp": 0.0,
+            "time_setup": _iso(t_open), "time_done": _iso(t_open + 1),
+            "opening_balance": round(balance, 2), "closing_balance": round(balance + profit, 2),
+            "profit": profit, "is_trade_active": False,
+        }})
+        balance += profit
+    return out
+
+def equity_curve(t: float, equity: float, active: bool) -> Dict[str, Any]:
+    return {"equity_curve": {
+        "position_id": 1 if active else None, "position_ticket": 1 if active else None,
+        "symbol": "USDJPY" if active else None, "profit": round(equity - 10000.0, 2) if active else None,
+        "current_equity": round(equity, 2), "is_trade_active": active, "t": _iso(t),
+    }}
+
+
+# -------- load phases --------
+def _post(client: Client, path: str, record: Any, lat: List[float], errors: List[str],
+          headers: Optional[Dict[str, str]] = None, body: Optional[bytes] = None) -> None:
+    data = body if body is not None else json.dumps(record, separators=(",", ":")).encode()
+    t0 = time.perf_counter()
+    status, raw, _ = client.request("POST", path, data, headers)
+    lat.append(time.perf_counter() - t0)
+    if status != 200 or b'"ok":true' not in raw.replace(b" ", b""):
+        errors.append(f"{path} {status} {raw[:120]!r}")
+
+def _ea_history(port: int, login: int, n: int, seed: int, lat: List[float], errors: List[str]) -> None:
+    """One terminal's full history resend over /ingest/snapshot, as the EA does after needs=true."""
+    rng = random.Random(seed)
+    c = Client(port, {"X-API-Key": API_KEY, "X-Account": f"{login}@BenchBroker-Demo",
+                      "Content-Type": "application/json"})
+    orders = history_orders(login, n, time.time() - n * 3600, rng)
+    _post(c, "/ingest/snapshot", account_info(login, 10000.0), lat, errors)
+    _post(c, "/ingest/snapshot", {"history_orders_header": {"count": n}}, lat, errors)
+    for rec in orders:
+        _post(c, "/ingest/snapshot", rec, lat, errors)
+    _post(c, "/ingest/snapshot", {"history_orders_footer": True}, lat, errors)
+    c.close()
+
+def _ea_equity(port: int, login: int, n: int, seed: int, lat: List[float], errors: List[str]) -> None:
+    rng = random.Random(seed)
+    c = Client(port, {"X-API-Key": API_KEY, "X-Account": f"{login}@BenchBroker-Demo",
+                      "Content-Type": "application/json"})
+    t, equity = time.time() - n * 5, 10000.0
+    for i in range(n):
+        equity += rng.gauss(0, 3)
+        _post(c, "/ingest/snapshot", equity_curve(t + i * 5, equity, i % 50 < 40), lat, errors)
+    c.close()
+
+def _ea_batch(port: int, login: int, n: int, chunk: int, seed: int, lat: List[float], errors: List[str]) -> None:
+    """The pooled streamer's path: gzipped NDJSON batches to /ingest/batch."""
+    rng = random.Random(seed)
+    c = Client(port, {"X-API-Key": API_KEY, "X-Account": f"{login}@BenchBroker-Demo",
+                      "Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+    records = [account_info(login, 10000.0)] + history_orders(login, n, time.time() - n * 3600, rng)
+    for i in range(0, len(records), chunk):
+        body = "\n".join(json.dumps(r, separators=(",", ":")) for r in records[i:i + chunk]).encode()
+        _post(c, "/ingest/batch", None, lat, errors, body=gzip.compress(body, 6))
+    c.close()
+
+def _poller(port: int, logins: List[int], stop: threading.Event, seed: int,
+            lat: Dict[str, List[float]], errors: List[str]) -> None:
+    """Dashboard-style reader: trades with If-None-Match, equity, stats, account, equity history."""
+    rng = random.Random(seed)
+    c = Client(port)
+    etags: Dict[int, str] = {}
+    while not stop.is_set():
+        login = rng.choice(logins)
+        path = rng.choice(POLL_PATHS)
+        sep = "&" if "?" in path else "?"
+        headers = {"If-None-Match": etags[login]} if path == "/api/live/trades" and login in etags else None
+        t0 = time.perf_counter()
+        status, _, resp = c.request("GET", f"{path}{sep}account={login}@BenchBroker-Demo", headers=headers)
+        lat.setdefault(path.split("?")[0], []).append(time.perf_counter() - t0)
+        if status == 200 and path == "/api/live/trades" and resp.getheader("ETag"):
+            etags[login] = resp.getheader("ETag")
+        elif status not in (200, 304):
+            errors.append(f"GET {path} {status}")
+    c.close()
+
+
+def _run_phase(workers: List[threading.Thread], port: int, logins: List[int], pollers: int,
+               poll_lat: Dict[str, List[float]], errors: List[str]) -> float:
+    stop = threading.Event()
+    readers = [threading.Thread(target=_poller, args=(port, logins, stop, 1000 + k, poll_lat, errors), daemon=True)
+               for k in range(pollers)]
+    t0 = time.perf_counter()
+    for th in readers + workers:
+        th.start()
+    for th in workers:
+        th.join()
+    wall = time.perf_counter() - t0
+    stop.set()
+    for th in readers:
+        th.join()
+    return wall
+
+
+# -------- server process --------
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def serve(port: int) -> None:
+    """Backend child: the real app plus one bench-only route reporting its peak RSS."""
+    sys.path.insert(0, PORTFOLIO)
+    sys.path.insert(1, HERE)
+    import uvicorn
+    import backend
+    from benchlib import peak_rss_mb
+    backend.app.add_api_route("/__bench/rss", lambda: {"peak_rss_mb": peak_rss_mb()}, methods=["GET"])
+    uvicorn.run(backend.app, host="127.0.0.1", port=port, log_level="warning", access_log=False)
+
+def _start_server(state_db: str) -> Tuple[subprocess.Popen, int]:
+    port = _free_port()
+    env = dict(os.environ, API_KEY=API_KEY, LOG_STDOUT="0", LOG_JSONL="", STATE_DB=state_db, SHARDS="1")
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", str(port)], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"backend exited with code {proc.returncode}")
+        try:
+            c = Client(port)
+            status, _, _ = c.request("GET", "/api/live/accounts")
+            c.close()
+            if status == 200:
+                return proc, port
+        except OSError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError("backend did not start within 60s")
+
+
+def run(opts: Dict[str, Any]) -> Dict[str, Any]:
+    from benchlib import summarize
+    eas, orders, ticks, pollers = opts["eas"], opts["orders"], opts["ticks"], opts["pollers"]
+    cases: Dict[str, Any] = {}
+    errors: List[str] = []
+    with tempfile.TemporaryDirectory(prefix="ctc-bench-") as tmp:
+        proc, port = _start_server(os.path.join(tmp, "state.sqlite3") if opts["state_db"] else "")
+        try:
+            logins = [100001 + k for k in range(eas)]
+            poll_lat: Dict[str, List[float]] = {}
+
+            # 1) every terminal resends its history at once while dashboards poll
+            lat: List[float] = []
+            wall = _run_phase([threading.Thread(target=_ea_history, args=(port, login, orders, login, lat, errors))
+                               for login in logins], port, logins, pollers, poll_lat, errors)
+            cases["ingest_history_order"] = summarize(lat, wall)
+            poll_wall = wall
+
+            # 2) live equity snapshots
+            lat = []
+            wall = _run_phase([threading.Thread(target=_ea_equity, args=(port, login, ticks, login, lat, errors))
+                               for login in logins], port, logins, pollers, poll_lat, errors)
+            cases["ingest_equity"] = summarize(lat, wall)
+            poll_wall += wall
+
+            for path, values in sorted(poll_lat.items()):
+                cases["poll_" + path.rsplit("/live/", 1)[1].replace("/", "_")] = summarize(values, poll_wall)
+
+            # 3) the same history volume through /ingest/batch (new accounts, no dedupe shortcut)
+            lat = []
+            batch_logins = [200001 + k for k in range(eas)]
+            wall = _run_phase([threading.Thread(target=_ea_batch, args=(port, login, orders, opts["chunk"],
+                                                                       login, lat, errors))
+                               for login in batch_logins], port, batch_logins, 0, poll_lat, errors)
+            cases["ingest_batch"] = dict(summarize(lat, wall, ops=eas * (orders + 1)), requests=len(lat))
+
+            c = Client(port)
+            _, raw, _ = c.request("GET", "/__bench/rss")
+            c.close()
+            server_rss = json.loads(raw).get("peak_rss_mb")
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return {
+        "cases": cases,
+        "server_peak_rss_mb": server_rss,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "config": {"eas": eas, "orders_per_ea": orders, "ticks_per_ea": ticks, "pollers": pollers,
+                   "batch_chunk": opts["chunk"], "state_db": bool(opts["state_db"])},
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]))
+    else:
+        sys.exit("usage: python bench/run_bench.py --suite backend   (this file only runs as the server child)")
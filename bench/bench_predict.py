@@ -0,0 +1,102 @@
+# Prediction-server hot paths on the testing/ CSVs, with bench/fake_mt5 standing in for the terminal
+import os
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _synthetic_model(path: str) -> None:
+    """Random weights with the consensus MLP's shape (CONSENSUS_FEATS -> 128 -> 64 -> 1), so the
+    bench runs in a checkout without model files or TensorFlow; timings do not depend on the values."""
+    from features import CONSENSUS_FEATS
+    from numpy_model import from_layers
+    rng = np.random.default_rng(0)
+    sizes = [len(CONSENSUS_FEATS), 128, 64, 1]
+    weights = [rng.normal(0, 1 / np.sqrt(n), (n, m)) for n, m in zip(sizes[:-1], sizes[1:])]
+    biases = [np.zeros(m) for m in sizes[1:]]
+    from_layers(weights, biases, ["relu", "relu", "sigmoid"], feature_names=CONSENSUS_FEATS).save(path)
+
+
+def _load_server():
+    os.environ["CTC_DATA_SOURCE"] = "mt5"     # the fake terminal, not the replay source: same code path as live
+    sys.path.insert(0, os.path.join(HERE, "fake_mt5"))
+    sys.path.insert(1, os.path.dirname(HERE))
+    import MetaTrader5 as mt5
+    with tempfile.TemporaryDirectory(prefix="ctc-bench-") as tmp:
+        if "CTC_WEIGHTS_PATH" not in os.environ:      # set it to time a real exported model instead
+            os.environ["CTC_WEIGHTS_PATH"] = os.path.join(tmp, "synthetic_weights.npz")
+            _synthetic_model(os.environ["CTC_WEIGHTS_PATH"])
+        os.environ["CTC_MODEL_BACKEND"] = "numpy"
+        import send_ctc_v1_predictions as server      # loads the weights at import
+    server.LOG_PREDICTIONS = False
+    server.mt5_init_once()
+    return mt5, server
+
+
+def _stepped(mt5, symbol: str, timeframe: int, bars: int, fn) -> List[float]:
+    """Move the fake clock one bar, then time fn(); the clock step itself is not timed."""
+    lat = []
+    for _ in range(bars):
+        if mt5.step(symbol, timeframe) is None:
+            break
+        t0 = time.perf_counter()
+        fn()
+        lat.append(time.perf_counter() - t0)
+    return lat
+
+
+def run(opts: Dict[str, Any]) -> Dict[str, Any]:
+    from benchlib import summarize, timed
+    mt5, server = _load_server()
+    from features import compute_features, compute_features_pandasta, compute_feature_block, rates_block
+
+    symbol, tf = opts["symbol"], server.TIMEFRAME
+    batch: List[str] = opts["batch_symbols"]
+    iters, bars = opts["iters"], opts["bars"]
+    cases: Dict[str, Any] = {}
+    skipped: Dict[str, str] = {}
+
+    # --- batch (reference) feature path, kept for the notebook / parity checks
+    mt5.seek(opts["start"])
+    df, _ = server.fetch_rates(symbol, tf, server.N_BARS)
+    df = df.iloc[:-1]
+    try:
+        import pandas_ta  # noqa: F401
+        cases["features_pandasta"] = timed(lambda i: compute_features_pandasta(df), iters)
+    except ImportError:
+        skipped["features_pandasta"] = "pandas_ta not installed"
+    cases["features_numpy"] = timed(lambda i: compute_features(df), iters)
+    # every testing/ pair in one kernel call over a (pairs x bars) block
+    pairs = [p for p in mt5.symbols_get() if mt5.copy_rates_from_pos(p.name, tf, 1, 1) is not None]
+    block, _, _ = rates_block([mt5.copy_rates_from_pos(p.name, tf, 1, server.N_BARS) for p in pairs])
+    cases["feature_block_all_pairs"] = dict(timed(lambda i: compute_feature_block(block), iters), pairs=len(pairs))
+    feat = compute_features(df)      # same columns as the pandas_ta path
+    cases["aux_closes_build_X"] = timed(
+        lambda i: server.build_X(server.attach_aux_closes(feat, server.AUX_SYMBOLS, tf, server.N_BARS)), iters)
+
+    # --- full request path: a new closed bar per call (cache miss, warm feature engine)
+    server.make_prediction(symbol, tf)   # warm the engine and bar buffers
+    lat = _stepped(mt5, symbol, tf, bars, lambda: server.make_prediction(symbol, tf))
+    cases["make_prediction"] = summarize(lat, sum(lat))
+
+    # --- repeat polls within one bar (prediction cache hit)
+    cases["make_prediction_cached"] = timed(lambda i: server.make_prediction(symbol, tf), iters * 20)
+
+    # --- batch request: one inference call for several symbols per bar
+    server.make_predictions(batch, tf)
+    lat = _stepped(mt5, symbol, tf, bars, lambda: server.make_predictions(batch, tf))
+    cases["make_predictions_batch"] = summarize(lat, sum(lat), ops=len(lat) * len(batch))
+
+    server.market_data.close()
+    return {
+        "cases": cases,
+        "skipped": skipped,
+        "config": {"symbol": symbol, "batch_symbols": batch, "iters": iters, "bars": bars,
+                   "start": opts["start"], "model": server.MODEL_KIND,
+                   "weights": os.path.basename(server.WEIGHTS_PATH), "model_id": server.MODEL_ID, "n_bars": server.N_BARS},
+    }
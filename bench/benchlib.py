@@ -0,0 +1,79 @@
+# Shared helpers for the benchmark suites: timed loops, percentiles, peak RSS, environment
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def summarize(latencies: List[float], wall: float, ops: Optional[int] = None) -> Dict[str, Any]:
+    """Per-operation latencies (seconds) + wall time -> throughput and ms percentiles."""
+    lat = np.asarray(latencies, dtype=float) * 1e3
+    ops = len(lat) if ops is None else ops
+    if not len(lat):
+        return {"ops": 0, "secs": round(wall, 4), "ops_per_sec": 0.0}
+    return {
+        "ops": ops,
+        "secs": round(wall, 4),
+        "ops_per_sec": round(ops / wall, 2) if wall > 0 else None,
+        "mean_ms": round(float(lat.mean()), 4),
+        "p50_ms": round(float(np.percentile(lat, 50)), 4),
+        "p95_ms": round(float(np.percentile(lat, 95)), 4),
+        "p99_ms": round(float(np.percentile(lat, 99)), 4),
+        "max_ms": round(float(lat.max()), 4),
+    }
+
+
+def timed(fn: Callable[[int], Any], iters: int, warmup: int = 1) -> Dict[str, Any]:
+    """Call fn(i) `warmup` times untimed, then `iters` times timed individually."""
+    for i in range(warmup):
+        fn(-1 - i)
+    lat = []
+    t_start = time.perf_counter()
+    for i in range(iters):
+        t0 = time.perf_counter()
+        fn(i)
+        lat.append(time.perf_counter() - t0)
+    return summarize(lat, time.perf_counter() - t_start)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process (None where neither resource nor psutil is available)."""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)   # bytes on macOS, KiB elsewhere
+    except ImportError:
+        pass
+    try:
+        import psutil
+        mem = psutil.Process().memory_info()
+        return round(getattr(mem, "peak_wset", mem.rss) / 2**20, 1)
+    except ImportError:
+        return None
+
+
+def environment() -> Dict[str, Any]:
+    """What a baseline was measured on, so cross-machine comparisons can be called out."""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True,
+                             text=True, timeout=10).stdout.strip() or None
+    except Exception:
+        rev = None
+    import pandas as pd
+    return {
+        "host": platform.node(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "git_rev": rev,
+        "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
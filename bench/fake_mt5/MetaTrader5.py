@@ -0,0 +1,74 @@
+# Offline stand-in for the MetaTrader5 package: serves the MT5-exported CSVs in testing/
+# through the same CsvReplaySource the replay mode uses, with a clock the caller moves.
+#   sys.path.insert(0, "bench/fake_mt5"); import MetaTrader5 as mt5; mt5.seek("2023-01-02")
+import os
+import sys
+from typing import Any, List, NamedTuple, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from market_data import CsvReplaySource, TIMEFRAMES
+
+for _name, _value in TIMEFRAMES.items():
+    globals()[f"TIMEFRAME_{_name}"] = _value
+
+DIRS = tuple(x for x in os.getenv("FAKE_MT5_DIRS", "testing").split(",") if x)
+START = os.getenv("FAKE_MT5_START", "2023-01-02")
+
+_source: Optional[CsvReplaySource] = None
+_last_error = (1, "Success")
+
+
+class SymbolInfo(NamedTuple):
+    name: str
+    visible: bool = True
+
+
+def _src() -> CsvReplaySource:
+    global _source
+    if _source is None:
+        _source = CsvReplaySource(DIRS, start=START)
+    return _source
+
+
+# ---- clock (not part of the real API) ----
+def seek(when) -> None:
+    _src().seek(when)
+
+def step(symbol: str, timeframe: int) -> Optional[int]:
+    """Advance to the next bar open of `symbol`; None when the data runs out."""
+    return _src().step(symbol, timeframe)
+
+def now() -> int:
+    return _src().clock()
+
+
+# ---- MetaTrader5 API subset used by the prediction server ----
+def initialize(*args, **kwargs) -> bool:
+    _src()
+    return True
+
+def shutdown() -> None:
+    pass
+
+def last_error():
+    return _last_error
+
+def terminal_info() -> Any:
+    return {"name": "fake_mt5", "connected": True}
+
+def account_info() -> Any:
+    return {"login": 0, "server": "fake_mt5"}
+
+def symbols_get(group: str = "*") -> List[SymbolInfo]:
+    return [SymbolInfo(s) for s in _src().symbols()]
+
+def symbol_select(symbol: str, enable: bool = True) -> bool:
+    return symbol in _src().symbols()
+
+def copy_rates_from_pos(symbol: str, timeframe: int, start_pos: int, count: int) -> Optional[np.ndarray]:
+    try:
+        return _src().copy_rates_from_pos(symbol, timeframe, start_pos, count)
+    except RuntimeError:
+        return None
@@ -0,0 +1,204 @@
+# Offline benchmark suite: prediction hot paths (fake MT5 over testing/) and the Portfolio backend
+# under a synthetic EA load. Results go to JSON and are compared with a stored baseline.
+#   python bench/run_bench.py                          # run everything, compare with bench/baseline.json
+#   python bench/run_bench.py --suite predict --quick
+#   python bench/run_bench.py --save-baseline          # accept the current numbers as the new baseline
+# No baseline is committed (numbers only mean something on the machine that measured them): save one
+# first, and only later runs are checked for regressions.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+
+from benchlib import environment, peak_rss_mb
+
+SUITES = ("predict", "backend")
+# metric -> +1 when higher is better, -1 when lower is better (p99/max are reported, not gated: too noisy)
+GATED = {"ops_per_sec": +1, "p50_ms": -1, "p95_ms": -1}
+GATED_SUITE = {"peak_rss_mb": -1, "server_peak_rss_mb": -1}
+ENV_KEYS = ("host", "machine", "cpus", "python", "numpy", "pandas")
+
+
+def suite_options(args: argparse.Namespace) -> Dict[str, Dict[str, Any]]:
+    q = args.quick
+    return {
+        "predict": {
+            "symbol": args.symbol,
+            "batch_symbols": [s for s in args.batch_symbols.split(",") if s],
+            "iters": args.iters or (10 if q else 50),
+            "bars": args.bars or (100 if q else 500),
+            "start": args.start,
+        },
+        "backend": {
+            "eas": args.eas,
+            "orders": args.orders or (250 if q else 1000),
+            "ticks": args.ticks or (200 if q else 1000),
+            "pollers": args.pollers,
+            "chunk": args.chunk,
+            "state_db": not args.no_state_db,
+        },
+    }
+
+
+def run_child(suite: str, opts: Dict[str, Any], out_path: str) -> None:
+    """Runs inside the per-suite process, so each suite gets its own imports and peak RSS."""
+    if suite == "predict":
+        import bench_predict as mod
+    else:
+        import bench_backend as mod
+    t0 = time.perf_counter()
+    result = mod.run(opts)
+    result["wall_secs"] = round(time.perf_counter() - t0, 2)
+    result["peak_rss_mb"] = peak_rss_mb()
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def run_suite(suite: str, opts: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="ctc-bench-") as tmp:
+        out_path = os.path.join(tmp, f"{suite}.json")
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", suite, "--child-opts", json.dumps(opts),
+               "--child-out", out_path]
+        proc = subprocess.run(cmd)
+        if proc.returncode != 0 or not os.path.exists(out_path):
+            return {"error": f"suite exited with code {proc.returncode}"}
+        with open(out_path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """One row per gated metric present in both runs; `regression` when worse by more than `tolerance`."""
+    rows = []
+
+    def check(name: str, metric: str, sign: int, new: Any, old: Any) -> None:
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or old <= 0:
+            return
+        change = (new - old) / old
+        worse = -change * sign
+        rows.append({"case": name, "metric": metric, "baseline": old, "current": new,
+                     "change_pct": round(change * 100, 1),
+                     "status": "regression" if worse > tolerance else "improved" if -worse > tolerance else "ok"})
+
+    for suite, res in current["suites"].items():
+        base = baseline.get("suites", {}).get(suite)
+        if not base or "error" in res or "error" in base:
+            continue
+        for metric, sign in GATED_SUITE.items():
+            check(suite, metric, sign, res.get(metric), base.get(metric))
+        for case, stats in res.get("cases", {}).items():
+            old = base.get("cases", {}).get(case)
+            if old is None:
+                continue
+            for metric, sign in GATED.items():
+                check(f"{suite}.{case}", metric, sign, stats.get(metric), old.get(metric))
+    return rows
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    for suite, res in results["suites"].items():
+        if "error" in res:
+            print(f"[Bench] {suite}: {res['error']}")
+            continue
+        rss = f"peak RSS {res.get('peak_rss_mb')} MB"
+        if res.get("server_peak_rss_mb") is not None:
+            rss += f", server {res['server_peak_rss_mb']} MB"
+        print(f"[Bench] {suite} ({res.get('wall_secs')}s, {rss}"
+              + (f", {res['errors']} errors" if res.get("errors") else "") + ")")
+        for case, s in res.get("cases", {}).items():
+            print(f"  {case:<28} {s.get('ops', 0):>7} ops {s.get('ops_per_sec') or 0:>10,.1f}/s  "
+                  f"p50 {s.get('p50_ms', 0):>9.3f}  p95 {s.get('p95_ms', 0):>9.3f}  "
+                  f"p99 {s.get('p99_ms', 0):>9.3f}  max {s.get('max_ms', 0):>9.3f} ms")
+        for case, reason in res.get("skipped", {}).items():
+            print(f"  {case:<28} skipped: {reason}")
+
+
+def print_comparison(rows: List[Dict[str, Any]], env_diff: List[Tuple[str, Any, Any]]) -> None:
+    if env_diff:
+        print("[Bench] baseline was measured elsewhere: "
+              + ", ".join(f"{k} {old} -> {new}" for k, old, new in env_diff))
+    for r in rows:
+        if r["status"] != "ok":
+            print(f"  {r['status'].upper():<10} {r['case']:<36} {r['metric']:<18} "
+                  f"{r['baseline']} -> {r['current']} ({r['change_pct']:+.1f}%)")
+    regressions = sum(r["status"] == "regression" for r in rows)
+    print(f"[Bench] {len(rows)} metrics compared, {regressions} regressions, "
+          f"{sum(r['status'] == 'improved' for r in rows)} improvements")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Prediction-server and backend benchmarks (offline)")
+    ap.add_argument("--suite", default=",".join(SUITES), help="comma-separated: predict, backend")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"))
+    ap.add_argument("--save-baseline", action="store_true", help="write this run to --baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="relative slowdown flagged as a regression")
+    ap.add_argument("--quick", action="store_true", help="smaller sizes for a smoke run")
+    # predict suite
+    ap.add_argument("--symbol", default="USDJPY")
+    ap.add_argument("--batch-symbols", default="USDJPY,EURJPY,GBPJPY,AUDJPY")
+    ap.add_argument("--iters", type=int, default=0, help="repetitions of the pandas-ta / build_X paths")
+    ap.add_argument("--bars", type=int, default=0, help="bars stepped through make_prediction")
+    ap.add_argument("--start", default="2023-01-02", help="fake MT5 clock start (testing/ begins 2022-01-03)")
+    # backend suite
+    ap.add_argument("--eas", type=int, default=4, help="concurrent synthetic terminals (one account each)")
+    ap.add_argument("--orders", type=int, default=0, help="history_order payloads per terminal")
+    ap.add_argument("--ticks", type=int, default=0, help="equity snapshots per terminal")
+    ap.add_argument("--pollers", type=int, default=8, help="concurrent /api/live/* readers")
+    ap.add_argument("--chunk", type=int, default=500, help="records per /ingest/batch request")
+    ap.add_argument("--no-state-db", action="store_true", help="run the backend without SQLite persistence")
+    # internal: one suite per process
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    ap.add_argument("--child-opts", help=argparse.SUPPRESS)
+    ap.add_argument("--child-out", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        run_child(args.child, json.loads(args.child_opts), args.child_out)
+        return
+
+    suites = [s.strip() for s in args.suite.split(",") if s.strip()]
+    unknown = [s for s in suites if s not in SUITES]
+    if unknown:
+        sys.exit(f"unknown suite(s): {', '.join(unknown)}")
+    opts = suite_options(args)
+    results: Dict[str, Any] = {"env": environment(), "options": {s: opts[s] for s in suites}, "suites": {}}
+    for suite in suites:
+        print(f"[Bench] running {suite} ...")
+        results["suites"][suite] = run_suite(suite, opts[suite])
+    print_results(results)
+
+    failed = False
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(results, baseline, args.tolerance)
+        env_diff = [(k, baseline.get("env", {}).get(k), results["env"][k]) for k in ENV_KEYS
+                    if baseline.get("env", {}).get(k) != results["env"][k]]
+        results["comparison"] = {"baseline": args.baseline, "baseline_ts": baseline.get("env", {}).get("ts"),
+                                 "tolerance": args.tolerance, "rows": rows}
+        print_comparison(rows, env_diff)
+        failed = any(r["status"] == "regression" for r in rows)
+    elif not args.save_baseline:
+        print(f"[Bench] no baseline at {args.baseline}: nothing compared, no regressions flagged "
+              f"(run once with --save-baseline on this machine first)")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1)
+    print(f"[Bench] Wrote {args.out}")
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+        print(f"[Bench] Saved baseline {args.baseline}")
+    failed = failed or any("error" in r for r in results["suites"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+# Single-pass multi-pair feature matrix for training
+#   python feature_matrix.py [training|testing]          build (or load) and summarise
+#   python feature_matrix.py testing --check USDJPY      parity vs features.compute_features_pandasta
+import hashlib
+import json
+import math
+import os
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import indicators as ind
+from indicators import shift as _shift, rolling as _rolling, wma as _wma, ema as _ema
+from bar_store import CACHE_DIR, find_csvs, load_columns
+
+
+# Everything that changes the output goes in here; it is part of the cache key
+FEATURE_SPEC = {
+    "version": 1,
+    "ma": [5, 10, 20, 50, 100, 200],
+    "ema": [6, 18, 42],
+    "sma": [50],
+    "hull": 21,
+    "adx": 10,
+    "macd": [12, 26, 9],
+    "psar": [0.02, 0.2],
+    "rsi": 14,
+    "stoch": [14, 3, 3],
+    "willr": 14,
+    "atr": 14,
+    "bbands": [20, 2.0],
+    "std": 20,
+    "candles": ["hammer", "inv_hammer", "engulfing", "morning_star", "evening_star", "doji", "three_strike"],
+}
+
+BASE_FIELDS = ['open', 'high', 'low', 'close', 'tickvol', 'spread']
+
+
+def feature_columns(spec: Dict = FEATURE_SPEC) -> List[str]:
+    """Per-pair columns in block order (aux closes are added by FeatureMatrix.frame)."""
+    cols = list(BASE_FIELDS) + ['log_return', 'trend', 'Target']
+    cols += [f"ma_{n}" for n in spec["ma"]] + [f"ema_{n}" for n in spec["ema"]] + [f"sma_{n}" for n in spec["sma"]]
+    cols += [f"hull_{spec['hull']}", "ema6_18_x", "slope_42", f"adx_{spec['adx']}",
+             "macd", "macd_signal", "macd_hist", "psar_trend", "rsi", "stoch_%k", "stoch_%d",
+             "williams_%r", "atr", "bb_upper", "bb_middle", "bb_lower", "std_dev"]
+    cols += [f"{name}_flag" for name in spec["candles"]]
+    return cols
+
+
+# ===========================
+# Kernels: 2-D (pairs x time) arrays, time along axis 1 (shared ones live in indicators.py)
+# ===========================
+def _psar_reversal(h: np.ndarray, l: np.ndarray, c: np.ndarray, lengths: np.ndarray,
+                   af0: float, max_af: float) -> np.ndarray:
+    """pandas_ta.psar 'PSARr' (1 on reversal bars); sequential in time, vectorized across pairs."""
+    P, T = h.shape
+    rows = np.arange(P)
+    rev_out = np.zeros((P, T))
+    if T < 2:
+        return rev_out
+    up, dn = h[:, 1] - h[:, 0], l[:, 0] - l[:, 1]
+    falling = (dn > up) & (dn > 0)
+    ep = np.where(falling, l[:, 0], h[:, 0])
+    sar = c[:, 0].copy()
+    af = np.full(P, af0)
+    for t in range(1, T):
+        hi, lo = h[:, t], l[:, t]
+        live = t < lengths
+        # pandas_ta reads high.iloc[row - 2], which at row 1 wraps to the last bar
+        h2 = h[rows, lengths - 1] if t == 1 else h[:, t - 2]
+        l2 = l[rows, lengths - 1] if t == 1 else l[:, t - 2]
+        cand = sar + af * (ep - sar)
+        reverse = np.where(falling, hi > cand, lo < cand)
+        new_ext = np.where(falling, lo < ep, hi > ep)
+        ep = np.where(new_ext, np.where(falling, lo, hi), ep)
+        af = np.where(new_ext, np.minimum(af + af0, max_af), af)
+        cand = np.where(falling, np.maximum.reduce([h[:, t - 1], h2, cand]),
+                        np.minimum.reduce([l[:, t - 1], l2, cand]))
+        cand = np.where(reverse, ep, cand)
+        af = np.where(reverse, af0, af)
+        falling = np.where(reverse, ~falling, falling)
+        ep = np.where(reverse, np.where(falling, lo, hi), ep)
+        sar = np.where(live, cand, sar)
+        rev_out[:, t] = np.where(live, reverse, 0)
+    return rev_out
+
+
+# ===========================
+# TA-Lib candlestick patterns (bullish > 0 flags)
+# ===========================
+# TA-Lib default candle settings: (range type, averaging period, factor)
+_CANDLE = {
+    'BodyLong': ('RealBody', 10, 1.0), 'BodyShort': ('RealBody', 10, 1.0),
+    'BodyDoji': ('HighLow', 10, 0.1), 'ShadowLong': ('RealBody', 0, 1.0),
+    'ShadowVeryShort': ('HighLow', 10, 0.1), 'Near': ('HighLow', 5, 0.2),
+}
+
+class _Candles:
+    def __init__(self, o: np.ndarray, h: np.ndarray, l: np.ndarray, c: np.ndarray):
+        self.o, self.h, self.l, self.c = o, h, l, c
+        self.body = np.abs(c - o)
+        self.top, self.bottom = np.maximum(o, c), np.minimum(o, c)
+        self.upper, self.lower = h - self.top, self.bottom - l
+        self.color = np.where(c >= o, 1, -1)
+        self.ranges = {'RealBody': self.body, 'HighLow': h - l, 'Shadows': self.upper + self.lower}
+        self._avg: Dict[str, np.ndarray] = {}
+
+    def avg(self, setting: str, shift: int = 0) -> np.ndarray:
+        """TA_CANDLEAVERAGE(setting) with bar i - shift as the reference bar."""
+        if setting not in self._avg:
+            kind, period, factor = _CANDLE[setting]
+            r = self.ranges[kind]
+            base = _shift(_rolling(r, period, np.mean), 1) if period else r
+            self._avg[setting] = factor * base / (2.0 if kind == 'Shadows' else 1.0)
+        return _shift(self._avg[setting], shift) if shift else self._avg[setting]
+
+    def prev(self, x: np.ndarray, k: int) -> np.ndarray:
+        return _shift(x, k)
+
+    def hammer(self) -> np.ndarray:
+        return ((self.body < self.avg('BodyShort')) & (self.lower > self.avg('ShadowLong'))
+                & (self.upper < self.avg('ShadowVeryShort'))
+                & (self.bottom <= self.prev(self.l, 1) + self.avg('Near', 1)))
+
+    def inv_hammer(self) -> np.ndarray:
+        return ((self.body < self.avg('BodyShort')) & (self.upper > self.avg('ShadowLong'))
+                & (self.lower < self.avg('ShadowVeryShort'))
+                & (self.top < self.prev(self.bottom, 1)))          # real-body gap down
+
+    def engulfing(self) -> np.ndarray:
+        o1, c1 = self.prev(self.o, 1), self.prev(self.c, 1)
+        return ((self.color == 1) & (self.prev(self.color, 1) == -1)
+                & (((self.c >= o1) & (self.o < c1)) | ((self.c > o1) & (self.o <= c1))))
+
+    def morning_star(self, penetration: float = 0.0) -> np.ndarray:
+        b1, b2 = self.prev(self.body, 2), self.prev(self.body, 1)
+        return ((b1 > self.avg('BodyLong', 2)) & (self.prev(self.color, 2) == -1)
+                & (b2 <= self.avg('BodyShort', 1))
+                & (self.prev(self.top, 1) < self.prev(self.bottom, 2))
+                & (self.body > self.avg('BodyShort')) & (self.color == 1)
+                & (self.c > self.prev(self.c, 2) + b1 * penetration))
+
+    def evening_star(self) -> np.ndarray:
+        # TA-Lib only ever emits -100 for this pattern, so its bullish flag is always 0
+        return np.zeros(self.o.shape, bool)
+
+    def doji(self) -> np.ndarray:
+        return self.body <= self.avg('BodyDoji')
+
+    def three_strike(self) -> np.ndarray:
+        col = [self.prev(self.color, k) for k in (3, 2, 1)]
+        o3, o2, o1 = (self.prev(self.o, k) for k in (3, 2, 1))
+        c3, c2, c1 = (self.prev(self.c, k) for k in (3, 2, 1))
+        near3, near2 = self.avg('Near', 3), self.avg('Near', 2)
+        opens_within = ((o2 >= np.minimum(o3, c3) - near3) & (o2 <= np.maximum(o3, c3) + near3)
+                        & (o1 >= np.minimum(o2, c2) - near2) & (o1 <= np.maximum(o2, c2) + near2))
+        three_white = (col[2] == 1) & (c1 > c2) & (c2 > c3) & (self.o > c1) & (self.c < o3)
+        return ((col[0] == col[1]) & (col[1] == col[2]) & (self.color == -col[2])
+                & opens_within & three_white)
+
+
+# ===========================
+# Block build
+# ===========================
+class FeatureMatrix(NamedTuple):
+    symbols: List[str]
+    lengths: np.ndarray      # valid bars per pair (rows are left-aligned, padded with NaN / -1)
+    times: np.ndarray        # (pairs, T) epoch seconds
+    values: np.ndarray       # (pairs, T, features)
+    columns: List[str]
+    key: str = ""            # content hash of the input bars + FEATURE_SPEC (cache key)
+
+    def col(self, name: str) -> np.ndarray:
+        return self.values[:, :, self.columns.index(name)]
+
+    def pair(self, symbol: str) -> Tuple[np.ndarray, np.ndarray]:
+        i = self.symbols.index(symbol)
+        n = int(self.lengths[i])
+        return self.times[i, :n], self.values[i, :n]
+
+    def aligned_closes(self, index: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """'<pair>_close' of every pair on a shared time index (default: union of all bar times)."""
+        if index is None:
+            index = np.unique(np.concatenate([self.times[i, :n] for i, n in enumerate(self.lengths)]))
+        ci = self.columns.index('close')
+        cols: Dict[str, np.ndarray] = {}
+        for i, sym in enumerate(self.symbols):
+            n = int(self.lengths[i])
+            t = self.times[i, :n]
+            pos = np.searchsorted(t, index)
+            pos_c = np.minimum(pos, n - 1)
+            hit = (pos < n) & (t[pos_c] == index)
+            cols[f"{sym.lower()}_close"] = np.where(hit, self.values[i, pos_c, ci], np.nan)
+        return pd.DataFrame(cols, index=pd.DatetimeIndex(index.astype('datetime64[s]'), name='datetime'))
+
+    def frame(self, symbol: str, aux: bool = True) -> pd.DataFrame:
+        """Notebook-shaped frame of one pair: its features plus the other pairs' closes (left join)."""
+        t, vals = self.pair(symbol)
+        df = pd.DataFrame(vals, columns=self.columns,
+                          index=pd.DatetimeIndex(t.astype('datetime64[s]'), name='datetime'))
+        if aux:
+            closes = self.aligned_closes(t)
+            others = [c for c in closes.columns if c != f"{symbol.lower()}_close"]
+            df = pd.concat([df, closes[others]], axis=1)
+        return df
+
+
+def stack_pairs(symbols: Sequence[str], split: str = "training", period: str = "H4",
+                root: str = ".") -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+    """(symbols, lengths, times (P x T), fields (P x T x BASE_FIELDS)) with every pair left-aligned."""
+    cols, found = [], []
+    for sym in symbols:
+        paths = find_csvs(sym, period, [split], root)
+        if paths:
+            cols.append(load_columns(paths[-1], ['time', 'open', 'high', 'low', 'close', 'tick_volume', 'spread']))
+            found.append(sym)
+    if not cols:
+        raise RuntimeError(f"No {split} {period} CSVs for {list(symbols)}")
+    lengths = np.array([len(c['time']) for c in cols])
+    T = int(lengths.max())
+    times = np.full((len(cols), T), -1, np.int64)
+    block = np.full((len(cols), T, len(BASE_FIELDS)), np.nan)
+    for i, c in enumerate(cols):
+        n = lengths[i]
+        times[i, :n] = c['time']
+        for j, name in enumerate(('open', 'high', 'low', 'close', 'tick_volume', 'spread')):
+            block[i, :n, j] = c[name]
+    return found, lengths, times, block
+
+def compute_block(block: np.ndarray, lengths: np.ndarray, spec: Dict = FEATURE_SPEC) -> np.ndarray:
+    """Every feature of every pair, one kernel call per indicator over the whole block."""
+    o, h, l, c = (block[:, :, j] for j in range(4))
+    f: Dict[str, np.ndarray] = {name: block[:, :, j] for j, name in enumerate(BASE_FIELDS)}
+    pc = _shift(c, 1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        f['log_return'] = np.log(c / pc)
+        nxt = _shift(f['log_return'], -1)
+        f['trend'] = np.where(np.isnan(nxt), np.nan, np.where(nxt > 0, 1.0, -1.0))
+        f['Target'] = np.where(np.isnan(nxt), np.nan, (nxt > 0).astype(float))
+
+        for n in spec["ma"]:
+            f[f"ma_{n}"] = _rolling(c, n, np.mean)
+        for n in spec["ema"]:
+            f[f"ema_{n}"] = _ema(c, n)
+        for n in spec["sma"]:
+            f[f"sma_{n}"] = _rolling(c, n, np.mean)
+        hn = spec["hull"]
+        f[f"hull_{hn}"] = _wma(2 * _wma(c, hn // 2) - _wma(c, hn), int(math.sqrt(hn)))
+        f["ema6_18_x"] = (f["ema_6"] > f["ema_18"]).astype(float)
+        e42 = f["ema_42"] if 42 in spec["ema"] else _ema(c, 42)
+        f["slope_42"] = e42 / _shift(e42, 1) - 1
+
+        # True range, ATR and ADX (pandas_ta formulas, as in features.py)
+        f["atr"] = ind.atr(h, l, c, spec["atr"])
+        n = spec["adx"]
+        f[f"adx_{n}"] = ind.adx(h, l, c, n)[0]
+
+        f["macd"], f["macd_signal"], f["macd_hist"] = ind.macd(c, *spec["macd"])
+
+        f["psar_trend"] = _psar_reversal(h, l, c, lengths, *spec["psar"])
+
+        f["rsi"] = ind.rsi(c, spec["rsi"])
+
+        sk_n, sd_n, smooth = spec["stoch"]
+        f["stoch_%k"], f["stoch_%d"] = ind.stoch(h, l, c, sk_n, sd_n, smooth)
+        f["williams_%r"] = ind.willr(h, l, c, spec["willr"])
+
+        bn, bstd = spec["bbands"]
+        mid = _rolling(c, bn, np.mean)
+        dev = _rolling(c, bn, np.std)                   # population std, as TA-Lib BBANDS
+        f["bb_upper"], f["bb_middle"], f["bb_lower"] = mid + bstd * dev, mid, mid - bstd * dev
+        f["std_dev"] = ind.rolling_std(c, spec["std"])
+
+        candles = _Candles(o, h, l, c)
+        for name in spec["candles"]:
+            f[f"{name}_flag"] = getattr(candles, name)().astype(float)
+
+    cols = feature_columns(spec)
+    out = np.stack([f[name] for name in cols], axis=2)
+    # padding beyond each pair's last bar stays NaN
+    out[np.arange(out.shape[1])[None, :] >= lengths[:, None]] = np.nan
+    return out
+
+
+# ===========================
+# Cache
+# ===========================
+def cache_key(symbols: Sequence[str], times: np.ndarray, block: np.ndarray, spec: Dict = FEATURE_SPEC) -> str:
+    """sha1 over the feature spec and the raw input arrays."""
+    digest = hashlib.sha1(json.dumps(spec, sort_keys=True).encode())
+    digest.update(",".join(symbols).encode())
+    digest.update(np.ascontiguousarray(times).tobytes())
+    digest.update(np.ascontiguousarray(block).tobytes())
+    return digest.hexdigest()[:16]
+
+def build_feature_matrix(symbols: Optional[Sequence[str]] = None, split: str = "training", period: str = "H4",
+                         root: str = ".", cache_dir: str = CACHE_DIR, spec: Dict = FEATURE_SPEC,
+                         refresh: bool = False) -> FeatureMatrix:
+    """
+    Feature block for every pair in ``split``; served from <cache_dir>/features/<key>/
+    (memory-mapped) when neither the bars nor the spec have changed.
+    """
+    if symbols is None:
+        symbols = sorted({os.path.basename(p).split("_")[0]
+                          for p in find_csvs("*", period, [split], root)})
+    found, lengths, times, block = stack_pairs(symbols, split, period, root)
+    key = cache_key(found, times, block, spec)
+    out_dir = os.path.join(cache_dir, "features", f"{split}_{period}_{key}")
+    meta_path = os.path.join(out_dir, "meta.json")
+    if not refresh and os.path.exists(meta_path):
+        with open(meta_path) as fh:
+            meta = json.load(fh)
+        values = np.load(os.path.join(out_dir, "values.npy"), mmap_mode='r')
+        return FeatureMatrix(meta["symbols"], lengths, times, values, meta["columns"], key)
+
+    values = compute_block(block, lengths, spec)
+    columns = feature_columns(spec)
+    os.makedirs(out_dir, exist_ok=True)
+    tmp = os.path.join(out_dir, "values.tmp.npy")
+    np.save(tmp, values)
+    os.replace(tmp, os.path.join(out_dir, "values.npy"))
+    with open(meta_path + ".tmp", "w") as fh:
+        json.dump({"symbols": found, "columns": columns, "spec": spec}, fh)
+    os.replace(meta_path + ".tmp", meta_path)
+    return FeatureMatrix(found, lengths, times, values, columns, key)
+
+
+def check_parity(fm: FeatureMatrix, symbol: str, warmup: int = 200) -> pd.Series:
+    """Max |block - compute_features_pandasta| per shared column after ``warmup`` bars."""
+    from features import FEATURE_COLUMNS, compute_features_pandasta
+    t, _ = fm.pair(symbol)
+    df = fm.frame(symbol, aux=False)
+    rates = pd.DataFrame({'time': df.index, 'open': df['open'].values, 'high': df['high'].values,
+                          'low': df['low'].values, 'close': df['close'].values,
+                          'tick_volume': df['tickvol'].values})
+    ref = compute_features_pandasta(rates)
+    cols = [c for c in FEATURE_COLUMNS if c in df.columns]
+    ours = df[cols].to_numpy(float)
+    theirs = ref[cols].to_numpy(float)
+    diff = np.abs(ours - theirs)
+    diff[np.isnan(ours) != np.isnan(theirs)] = np.inf
+    return pd.Series(np.nanmax(diff[warmup:], axis=0), index=cols)
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    args = sys.argv[1:]
+    split = args[0] if args and not args[0].startswith("--") else "training"
+    t0 = time.perf_counter()
+    fm = build_feature_matrix(split=split, refresh="--refresh" in args)
+    print(f"[Features] {split}: {len(fm.symbols)} pairs x {fm.values.shape[1]} bars x {len(fm.columns)} "
+          f"features in {time.perf_counter() - t0:.2f}s")
+    if "--check" in args:
+        sym = args[args.index("--check") + 1]
+        res = check_parity(fm, sym)
+        print(res.to_string())
+        ok = bool((res < 1e-6).all())
+        print("PARITY OK" if ok else "PARITY MISMATCH")
+        sys.exit(0 if ok else 1)
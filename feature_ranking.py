@@ -0,0 +1,181 @@
+# Mutual-information + RandomForest feature ranking (the notebook's consensus cells), cached per pair
+#   python feature_ranking.py --symbols USDJPY --top 20
+#   python feature_ranking.py --sample 6000 --rounds 5 --workers 4 --out consensus_feats.json
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.feature_selection import mutual_info_classif
+
+from bar_store import CACHE_DIR
+from feature_matrix import FeatureMatrix, build_feature_matrix
+
+
+RANKING_DIR   = os.path.join(CACHE_DIR, "rankings")
+LABEL_COLUMNS = ['trend', 'Target']     # never ranked as features
+RANKING_COLUMNS = ['MI', 'MI_std', 'MI_ci', 'RF', 'MI_n', 'RF_n', 'consensus']
+
+
+# ===========================
+# Dataset
+# ===========================
+def pair_dataset(fm: FeatureMatrix, symbol: str, horizon: int = 1) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    X / y as in the notebook: every numeric column except the labels, warm-up rows
+    dropped, missing aux closes filled with 0. y = 1 if close rises over the next
+    ``horizon`` bars (horizon 1 is the notebook's trend/Target label).
+    """
+    df = fm.frame(symbol)
+    close = df['close'].to_numpy()
+    fwd = np.full(len(close), np.nan)
+    fwd[:len(close) - horizon] = close[horizon:] - close[:len(close) - horizon]
+    own = [c for c in fm.columns if c not in LABEL_COLUMNS]
+    keep = ~np.isnan(fwd) & ~df[own].isna().any(axis=1).to_numpy()
+    X = df.drop(columns=LABEL_COLUMNS)[keep].fillna(0)
+    return X, (fwd[keep] > 0).astype(np.int64)
+
+def ranking_key(X: pd.DataFrame, y: np.ndarray, params: Dict) -> str:
+    """sha1 over the ranking parameters (incl. label definition), column names and the data itself."""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode())
+    digest.update("|".join(X.columns).encode())
+    digest.update(np.ascontiguousarray(X.to_numpy(float)).tobytes())
+    digest.update(np.ascontiguousarray(y).tobytes())
+    return digest.hexdigest()[:16]
+
+
+# ===========================
+# Scores
+# ===========================
+def _mi_columns(X: np.ndarray, y: np.ndarray, seeds: Sequence[int], n_neighbors: int) -> np.ndarray:
+    """Worker: MI of each column on its own, so a column's score does not depend on the chunking."""
+    return np.array([mutual_info_classif(X[:, [j]], y, discrete_features=False, n_neighbors=n_neighbors,
+                                         random_state=int(seeds[j]))[0] for j in range(X.shape[1])])
+
+def _subsample(n: int, sample: Optional[int], rng: np.random.Generator) -> np.ndarray:
+    if not sample or sample >= n:
+        return np.arange(n)
+    return np.sort(rng.choice(n, sample, replace=False))
+
+def submit_mi(pool: Executor, X: np.ndarray, y: np.ndarray, sample: Optional[int], rounds: int,
+              seed: int, chunk: int, n_neighbors: int = 3):
+    """Queue rounds x column-chunk MI jobs; returns a collector giving (mean, std over rounds)."""
+    futures = []
+    for r in range(rounds):
+        rng = np.random.default_rng(seed + r)
+        rows = _subsample(len(y), sample, rng)
+        seeds = rng.integers(0, 2**31 - 1, X.shape[1])
+        for lo in range(0, X.shape[1], chunk):
+            cols = slice(lo, lo + chunk)
+            futures.append((r, lo, pool.submit(_mi_columns, X[rows, cols], y[rows], seeds[cols], n_neighbors)))
+
+    def collect() -> Tuple[np.ndarray, np.ndarray]:
+        scores = np.zeros((rounds, X.shape[1]))
+        for r, lo, fut in futures:
+            part = fut.result()
+            scores[r, lo:lo + len(part)] = part
+        return scores.mean(axis=0), scores.std(axis=0, ddof=1) if rounds > 1 else np.zeros(X.shape[1])
+    return collect
+
+def rf_importance(X: np.ndarray, y: np.ndarray, trees: int = 200, sample: Optional[int] = None,
+                  seed: int = 42, workers: int = -1) -> np.ndarray:
+    rows = _subsample(len(y), sample, np.random.default_rng(seed))
+    rf = RandomForestClassifier(n_estimators=trees, max_depth=None, random_state=seed, n_jobs=workers)
+    rf.fit(X[rows], y[rows])
+    return rf.feature_importances_
+
+def combine(columns: Sequence[str], mi: np.ndarray, mi_std: np.ndarray, rf: np.ndarray, rounds: int) -> pd.DataFrame:
+    """The notebook's df_imp: each score over its max, summed into 'consensus'."""
+    df = pd.DataFrame({'MI': mi, 'MI_std': mi_std, 'MI_ci': 1.96 * mi_std / np.sqrt(rounds), 'RF': rf},
+                      index=pd.Index(columns, name='feature'))
+    df['MI_n'] = df['MI'] / df['MI'].abs().max()
+    df['RF_n'] = df['RF'] / df['RF'].abs().max()
+    df['consensus'] = df['MI_n'] + df['RF_n']
+    return df[RANKING_COLUMNS].sort_values('consensus', ascending=False)
+
+def consensus_feats(ranking: pd.DataFrame, top: int = 20) -> List[str]:
+    return list(ranking.sort_values('consensus', ascending=False).index[:top])
+
+
+# ===========================
+# Cached ranking of many pairs
+# ===========================
+def rank_pairs(symbols: Optional[Sequence[str]] = None, split: str = "training", horizon: int = 1,
+               sample: Optional[int] = None, rounds: int = 1, trees: int = 200, seed: int = 42,
+               workers: int = os.cpu_count() or 1, chunk: int = 8, root: str = ".",
+               cache_dir: str = RANKING_DIR, refresh: bool = False) -> Dict[str, pd.DataFrame]:
+    """
+    Ranking of every pair, read from <cache_dir>/<split>_<pair>_<key>.csv when the
+    features, label and parameters are unchanged. MI jobs of all missing pairs share
+    one process pool; the forests use ``workers`` threads each.
+    """
+    fm = build_feature_matrix(symbols, split=split, root=root)
+    params = {"horizon": horizon, "sample": sample, "rounds": rounds, "trees": trees, "seed": seed}
+    os.makedirs(cache_dir, exist_ok=True)
+
+    out: Dict[str, pd.DataFrame] = {}
+    todo: List[Tuple[str, str, pd.DataFrame, np.ndarray]] = []
+    for sym in fm.symbols:
+        X, y = pair_dataset(fm, sym, horizon)
+        path = os.path.join(cache_dir, f"{split}_{sym}_{ranking_key(X, y, params)}.csv")
+        if not refresh and os.path.exists(path):
+            out[sym] = pd.read_csv(path, index_col='feature')
+        else:
+            todo.append((sym, path, X, y))
+    if not todo:
+        return out
+
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as pool:
+        pending = [(sym, path, X, y, submit_mi(pool, X.to_numpy(float), y, sample, rounds, seed, chunk))
+                   for sym, path, X, y in todo]
+        for sym, path, X, y, collect in pending:
+            rf = rf_importance(X.to_numpy(float), y, trees, sample, seed, workers)
+            mi, mi_std = collect()
+            ranking = combine(X.columns, mi, mi_std, rf, rounds)
+            ranking.to_csv(path + ".tmp")
+            os.replace(path + ".tmp", path)
+            out[sym] = ranking
+    return {sym: out[sym] for sym in fm.symbols}
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Rank features per pair by MI + RandomForest consensus")
+    ap.add_argument("--symbols", default=None, help="comma-separated pairs (default: every pair in the split)")
+    ap.add_argument("--split", default="training")
+    ap.add_argument("--horizon", type=int, default=1, help="label: close higher after N bars")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--sample", type=int, default=None, help="rows per MI/RF subsample (default: all)")
+    ap.add_argument("--rounds", type=int, default=1, help="MI subsamples; >1 reports MI_std / MI_ci")
+    ap.add_argument("--trees", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--refresh", action="store_true", help="ignore cached rankings")
+    ap.add_argument("--out", default=None, help="JSON {pair: CONSENSUS_FEATS}")
+    args = ap.parse_args()
+
+    symbols = [s for s in args.symbols.split(",") if s] if args.symbols else None
+    t0 = time.perf_counter()
+    rankings = rank_pairs(symbols, args.split, args.horizon, args.sample, args.rounds, args.trees,
+                          args.seed, args.workers, refresh=args.refresh)
+    print(f"[Ranking] {len(rankings)} pairs in {time.perf_counter() - t0:.2f}s")
+
+    feats = {sym: consensus_feats(r, args.top) for sym, r in rankings.items()}
+    for sym, r in rankings.items():
+        print(f"\n{sym} top {args.top} by consensus:")
+        print(r.head(args.top)[['MI', 'MI_ci', 'RF', 'consensus']].to_string(float_format=lambda v: f"{v:.4f}"))
+        print(f"CONSENSUS_FEATS = {feats[sym]!r}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(feats, f, indent=2)
+        print(f"[Ranking] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,495 @@
+# Feature engines for the prediction server
+import math
+import os
+from collections import deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+import indicators as ind
+
+
+# Columns produced by compute_features_pandasta (and by compute_features and the streaming engine)
+FEATURE_COLUMNS = [
+    'open', 'high', 'low', 'close', 'tickvol',
+    'log_return', 'williams_%r', 'stoch_%k', 'stoch_%d', 'rsi',
+    'macd', 'macd_signal', 'macd_hist', 'adx_10', 'ema_6', 'slope_42',
+    'atr', 'std_dev',
+]
+
+# Aux-pair close columns of the consensus model -> the pair they come from
+AUX_SYMBOLS = {
+    "gbpusd_close": "GBPUSD",
+    "nzdusd_close": "NZDUSD",
+    "eurusd_close": "EURUSD",
+    "gbpjpy_close": "GBPJPY",
+}
+
+# The consensus model's input columns, in order
+CONSENSUS_FEATS = [
+    'williams_%r','log_return','stoch_%k','gbpusd_close','slope_42','close',
+    'nzdusd_close','macd_signal','macd_hist','stoch_%d','ema_6','adx_10',
+    'rsi','low','eurusd_close','tickvol','std_dev','macd','gbpjpy_close','atr'
+]
+# ... of which the streaming engine computes these (the rest are aux closes)
+ENGINE_FEATS = [c for c in CONSENSUS_FEATS if c not in AUX_SYMBOLS]
+
+
+# ===========================
+# Batch (reference) path
+# ===========================
+def compute_features_pandasta(df: pd.DataFrame) -> pd.DataFrame:
+    import pandas_ta as ta   # reference only: slow to import, and nothing on the request path needs it
+    out = df.copy()
+    out = out.rename(columns={'tick_volume': 'tickvol'})
+    out = out[['time', 'open', 'high', 'low', 'close', 'tickvol']]
+    out.set_index('time', inplace=True)
+    out.sort_index(inplace=True)
+
+    out['log_return'] = np.log(out['close'] / out['close'].shift(1))
+    out['williams_%r'] = ta.willr(high=out['high'], low=out['low'], close=out['close'], length=14)
+
+    stoch = ta.stoch(high=out['high'], low=out['low'], close=out['close'], k=14, d=3)
+    out['stoch_%k'] = stoch['STOCHk_14_3_3']
+    out['stoch_%d'] = stoch['STOCHd_14_3_3']
+
+    out['rsi'] = ta.rsi(close=out['close'], length=14)
+
+    macd = ta.macd(close=out['close'], fast=12, slow=26, signal=9)
+    out['macd']        = macd['MACD_12_26_9']
+    out['macd_signal'] = macd['MACDs_12_26_9']
+    out['macd_hist']   = macd['MACDh_12_26_9']
+
+    adx = ta.adx(high=out['high'], low=out['low'], close=out['close'], length=10)
+    out['adx_10'] = adx['ADX_10']
+
+    out['ema_6'] = ta.ema(close=out['close'], length=6)
+    ema42 = ta.ema(close=out['close'], length=42)
+    out['slope_42'] = ema42.pct_change(1)
+
+    out['atr'] = ta.atr(high=out['high'], low=out['low'], close=out['close'], length=14)
+    out['std_dev'] = out['close'].rolling(20).std()
+
+    return out
+
+
+# ===========================
+# Vectorized path (indicators.py kernels)
+# ===========================
+def compute_feature_block(block: np.ndarray) -> np.ndarray:
+    """
+    (pairs, T, 5) or (T, 5) open/high/low/close/tickvol -> (..., T, len(FEATURE_COLUMNS)).
+    One kernel call per indicator covers every pair; shorter pairs are left-aligned and
+    NaN-padded (see rates_block), and their padding stays NaN.
+    """
+    block = np.asarray(block, dtype=np.float64)
+    o, h, l, c, v = (block[..., j] for j in range(5))
+    f: Dict[str, np.ndarray] = {'open': o, 'high': h, 'low': l, 'close': c, 'tickvol': v}
+    f['log_return'] = ind.log_return(c)
+    f['williams_%r'] = ind.willr(h, l, c, 14)
+    f['stoch_%k'], f['stoch_%d'] = ind.stoch(h, l, c, 14, 3, 3)
+    f['rsi'] = ind.rsi(c, 14)
+    f['macd'], f['macd_signal'], f['macd_hist'] = ind.macd(c, 12, 26, 9)
+    f['adx_10'] = ind.adx(h, l, c, 10)[0]
+    f['ema_6'] = ind.ema(c, 6)
+    f['slope_42'] = ind.slope(ind.ema(c, 42))
+    f['atr'] = ind.atr(h, l, c, 14)
+    f['std_dev'] = ind.rolling_std(c, 20)
+    out = np.stack([f[name] for name in FEATURE_COLUMNS], axis=-1)
+    out[np.isnan(c)] = np.nan
+    return out
+
+def rates_block(rates_list: Sequence) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Stack MT5 rates (structured arrays or frames with a 'time' column), oldest first,
+    into (block (pairs, T, 5), times (pairs, T) epoch seconds, lengths); rows are
+    left-aligned and padded with NaN / -1.
+    """
+    lengths = np.array([len(r) for r in rates_list])
+    T = int(lengths.max()) if len(lengths) else 0
+    block = np.full((len(rates_list), T, 5), np.nan)
+    times = np.full((len(rates_list), T), -1, np.int64)
+    for i, r in enumerate(rates_list):
+        n = lengths[i]
+        vol = 'tick_volume' if 'tick_volume' in _names(r) else 'tickvol'
+        times[i, :n] = _epoch_seconds(r)
+        for j, name in enumerate(('open', 'high', 'low', 'close', vol)):
+            block[i, :n, j] = np.asarray(r[name], float)
+    return block, times, lengths
+
+def compute_features(df: pd.DataFrame) -> pd.DataFrame:
+    """compute_features_pandasta's output (same index and columns) from the NumPy kernels."""
+    ordered = df.sort_values('time')
+    block, _, _ = rates_block([ordered])
+    values = compute_feature_block(block[0])
+    return pd.DataFrame(values, columns=FEATURE_COLUMNS, index=pd.Index(ordered['time'].values, name='time'))
+
+def align_closes(times: np.ndarray, other_times: np.ndarray, other_close: np.ndarray) -> np.ndarray:
+    """Closes of another pair on ``times`` (exact bar-time match, NaN where it has no bar)."""
+    pos = np.searchsorted(other_times, times)
+    pos_c = np.minimum(pos, len(other_times) - 1)
+    hit = (pos < len(other_times)) & (other_times[pos_c] == times)
+    return np.where(hit, other_close[pos_c], np.nan)
+
+
+# ===========================
+# Streaming (incremental) path
+# ===========================
+_NAN = float('nan')
+
+def _isnan(x: float) -> bool:
+    return x != x
+
+class _Ewm:
+    """
+    One step of pandas' ``Series.ewm(alpha=..., adjust=..., min_periods=...).mean()``.
+    Mirrors pandas' recursion (ignore_na=False) so values match the batch path.
+    """
+    __slots__ = ('old_wt_factor', 'new_wt', 'adjust', 'min_periods', 'weighted', 'old_wt', 'nobs')
+
+    def __init__(self, alpha: float, adjust: bool = True, min_periods: int = 0):
+        self.old_wt_factor = 1.0 - alpha
+        self.new_wt = 1.0 if adjust else alpha
+        self.adjust = adjust
+        self.min_periods = max(min_periods, 1)
+        self.weighted = _NAN
+        self.old_wt = 1.0
+        self.nobs = 0
+
+    def update(self, x: float) -> float:
+        is_obs = not _isnan(x)
+        self.nobs += is_obs
+        if not _isnan(self.weighted):
+            self.old_wt *= self.old_wt_factor
+            if is_obs:
+                if self.weighted != x:
+                    self.weighted = (self.old_wt * self.weighted + self.new_wt * x) / (self.old_wt + self.new_wt)
+                self.old_wt = self.old_wt + self.new_wt if self.adjust else 1.0
+        elif is_obs:
+            self.weighted = x
+        return self.weighted if self.nobs >= self.min_periods else _NAN
+
+def _rma(length: int) -> _Ewm:
+    """pandas_ta.rma: Wilder smoothing as ewm(alpha=1/length, min_periods=length)."""
+    return _Ewm(alpha=1.0 / length, adjust=True, min_periods=length)
+
+class _Ema:
+    """pandas_ta.ema: SMA seed over the first ``length`` values, then ewm(span, adjust=False)."""
+    __slots__ = ('length', 'seed', 'ewm')
+
+    def __init__(self, length: int):
+        self.length = length
+        self.seed: List[float] = []
+        self.ewm = _Ewm(alpha=2.0 / (length + 1), adjust=False)
+
+    def update(self, x: float) -> float:
+        if self.seed is not None:
+            self.seed.append(x)
+            if len(self.seed) < self.length:
+                return _NAN
+            x = float(np.mean(self.seed))
+            self.seed = None
+        return self.ewm.update(x)
+
+class _Sma:
+    __slots__ = ('win',)
+
+    def __init__(self, length: int):
+        self.win: deque = deque(maxlen=length)
+
+    def update(self, x: float) -> float:
+        self.win.append(x)
+        if len(self.win) < self.win.maxlen or any(_isnan(v) for v in self.win):
+            return _NAN
+        return sum(self.win) / len(self.win)
+
+class StreamingFeatureEngine:
+    """
+    Incremental twin of compute_features_pandasta for one (symbol, timeframe).
+    Keeps the recursive state of every indicator (EMA/MACD/RSI/ADX/ATR smoothing
+    and the rolling windows) and advances it in O(1) per closed bar.
+    """
+
+    def __init__(self):
+        self.last_time: Optional[int] = None        # open time of the last fed bar, epoch seconds
+        self.bars = 0
+        self.row: Dict[str, float] = {}
+
+        self._prev_close = _NAN
+        self._prev_high = _NAN
+        self._prev_low = _NAN
+        self._highs: deque = deque(maxlen=14)
+        self._lows: deque = deque(maxlen=14)
+        self._closes20: deque = deque(maxlen=20)
+
+        self._stoch_k = _Sma(3)
+        self._stoch_d = _Sma(3)
+        self._stoch_started = False
+
+        self._rsi_pos = _rma(14)
+        self._rsi_neg = _rma(14)
+
+        self._ema12 = _Ema(12)
+        self._ema26 = _Ema(26)
+        self._macd_signal = _Ema(9)
+
+        self._atr14 = _rma(14)
+        self._atr10 = _rma(10)
+        self._dmp = _rma(10)
+        self._dmn = _rma(10)
+        self._adx = _rma(10)
+
+        self._ema6 = _Ema(6)
+        self._ema42 = _Ema(42)
+        self._prev_ema42 = _NAN
+
+    # ---- feeding ----
+    def update(self, time: int, open_: float, high: float, low: float, close: float, tickvol: float) -> Dict[str, float]:
+        """Advance every indicator by one closed bar and return the new feature row."""
+        pc, ph, pl = self._prev_close, self._prev_high, self._prev_low
+        row: Dict[str, float] = {
+            'open': open_, 'high': high, 'low': low, 'close': close, 'tickvol': tickvol,
+        }
+
+        row['log_return'] = math.log(close / pc) if not _isnan(pc) else _NAN
+
+        # Williams %R / Stochastic share the 14-bar high/low window
+        self._highs.append(high)
+        self._lows.append(low)
+        if len(self._highs) == 14:
+            hh, ll = max(self._highs), min(self._lows)
+            rng = hh - ll
+            row['williams_%r'] = 100 * ((close - ll) / rng - 1) if rng else _NAN
+            raw = 100 * (close - ll) / rng if rng else 0.0
+            self._stoch_started = True
+        else:
+            row['williams_%r'] = _NAN
+            raw = _NAN
+        if self._stoch_started:
+            k = self._stoch_k.update(raw)
+            row['stoch_%k'] = k
+            row['stoch_%d'] = self._stoch_d.update(k) if not _isnan(k) else _NAN
+        else:
+            row['stoch_%k'] = row['stoch_%d'] = _NAN
+
+        # RSI (Wilder)
+        diff = close - pc
+        pos_avg = self._rsi_pos.update(diff if _isnan(diff) or diff > 0 else 0.0)
+        neg_avg = self._rsi_neg.update(diff if _isnan(diff) or diff < 0 else 0.0)
+        denom = pos_avg + abs(neg_avg)
+        row['rsi'] = 100 * pos_avg / denom if denom else _NAN
+
+        # MACD 12/26/9 (signal seeded from the first valid MACD values)
+        e12 = self._ema12.update(close)
+        e26 = self._ema26.update(close)
+        macd = e12 - e26
+        if not _isnan(macd):
+            sig = self._macd_signal.update(macd)
+        else:
+            sig = _NAN
+        row['macd'] = macd
+        row['macd_signal'] = sig
+        row['macd_hist'] = macd - sig
+
+        # True range -> ATR(14) and the ATR(10) inside ADX
+        if _isnan(pc):
+            tr = _NAN
+        else:
+            tr = max(abs(high - low), abs(high - pc), abs(pc - low))
+        row['atr'] = self._atr14.update(tr)
+        atr10 = self._atr10.update(tr)
+
+        # ADX(10)
+        up = high - ph
+        dn = pl - low
+        if _isnan(up) or _isnan(dn):
+            pos = neg = _NAN
+        else:
+            pos = up if (up > dn and up > 0) else 0.0
+            neg = dn if (dn > up and dn > 0) else 0.0
+        k = 100 / atr10 if atr10 else _NAN
+        dmp = k * self._dmp.update(pos)
+        dmn = k * self._dmn.update(neg)
+        dx = 100 * abs(dmp - dmn) / (dmp + dmn) if (dmp + dmn) else _NAN
+        row['adx_10'] = self._adx.update(dx)
+
+        # EMA(6) and slope of EMA(42)
+        row['ema_6'] = self._ema6.update(close)
+        e42 = self._ema42.update(close)
+        row['slope_42'] = e42 / self._prev_ema42 - 1 if not _isnan(self._prev_ema42) else _NAN
+        self._prev_ema42 = e42
+
+        # 20-bar sample standard deviation of close
+        self._closes20.append(close)
+        row['std_dev'] = float(np.std(self._closes20, ddof=1)) if len(self._closes20) == 20 else _NAN
+
+        self._prev_close, self._prev_high, self._prev_low = close, high, low
+        self.last_time = time
+        self.bars += 1
+        self.row = row
+        return row
+
+    def covers(self, rates) -> bool:
+        """True if ``rates`` (MT5 array or frame) continues this engine without a gap."""
+        if self.last_time is None or len(rates) == 0:
+            return False
+        times = _epoch_seconds(rates)
+        return times[0] <= self.last_time <= times[-1]
+
+    def extend(self, rates) -> int:
+        """
+        Feed bars newer than ``last_time`` from MT5 rates (the raw structured array
+        or a frame with a datetime 'time' column); returns bars consumed.
+        """
+        times = _epoch_seconds(rates)
+        start = 0 if self.last_time is None else int(np.searchsorted(times, self.last_time, side='right'))
+        if start >= len(times):
+            return 0
+        vol = rates['tick_volume'] if 'tick_volume' in _names(rates) else rates['tickvol']
+        cols = zip(times[start:].tolist(),
+                   np.asarray(rates['open'], float)[start:].tolist(),
+                   np.asarray(rates['high'], float)[start:].tolist(),
+                   np.asarray(rates['low'], float)[start:].tolist(),
+                   np.asarray(rates['close'], float)[start:].tolist(),
+                   np.asarray(vol, float)[start:].tolist())
+        for t, o, h, l, c, v in cols:
+            self.update(t, o, h, l, c, v)
+        return len(times) - start
+
+    def values(self, columns: List[str]) -> List[float]:
+        """Latest feature row restricted to ``columns``, in that order."""
+        row = self.row
+        return [row[c] for c in columns]
+
+    def frame(self) -> pd.DataFrame:
+        """Latest feature row as a one-row frame shaped like compute_features_pandasta's output."""
+        return pd.DataFrame([self.row], columns=FEATURE_COLUMNS,
+                            index=pd.Index([pd.Timestamp(self.last_time, unit='s')], name='time'))
+
+
+def _names(rates) -> Tuple[str, ...]:
+    return rates.dtype.names if isinstance(rates, np.ndarray) else tuple(rates.columns)
+
+
+def _epoch_seconds(rates) -> np.ndarray:
+    """Bar open times of MT5 rates (structured array or frame) as int64 epoch seconds."""
+    times = rates['time']
+    if isinstance(rates, np.ndarray):
+        return times.astype(np.int64)
+    return np.asarray(times.values.astype('datetime64[s]').astype(np.int64))
+
+
+def read_rates_csv(path: str) -> pd.DataFrame:
+    """MT5-exported tab-separated bars as a rates frame (time, open, high, low, close, tick_volume)."""
+    raw = pd.read_csv(path, sep='\t')
+    raw.columns = raw.columns.str.replace('<', '').str.replace('>', '').str.lower()
+    return pd.DataFrame({
+        'time': pd.to_datetime(raw['date'] + ' ' + raw['time']),
+        'open': raw['open'], 'high': raw['high'], 'low': raw['low'], 'close': raw['close'],
+        'tick_volume': raw['tickvol'],
+    })
+
+
+def check_parity(rates: pd.DataFrame, columns: Optional[List[str]] = None, warmup: int = 200) -> pd.Series:
+    """
+    Run both feature paths over ``rates`` and return the max absolute difference
+    per column after ``warmup`` bars (TA-Lib-backed pandas_ta seeds its smoothers
+    differently, so only the converged part is compared).
+    """
+    batch = compute_features_pandasta(rates)
+    engine = StreamingFeatureEngine()
+    rows: List[Dict[str, Any]] = []
+    ordered = rates.sort_values('time')
+    for t, r in zip(_epoch_seconds(ordered).tolist(), ordered.itertuples(index=False)):
+        rows.append(engine.update(t, r.open, r.high, r.low, r.close, r.tick_volume))
+    stream = pd.DataFrame(rows, index=batch.index, columns=FEATURE_COLUMNS)
+    cols = columns or FEATURE_COLUMNS
+    diff = (batch[cols].astype(float) - stream[cols]).abs()
+    # NaN warm-up must line up exactly as well
+    mismatch = batch[cols].isna() != stream[cols].isna()
+    diff[mismatch] = np.inf
+    return diff.iloc[warmup:].max()
+
+
+def check_kernel_parity(rates: pd.DataFrame, columns: Optional[List[str]] = None, warmup: int = 200) -> pd.Series:
+    """
+    Max absolute difference per column between compute_features and compute_features_pandasta,
+    plus 'paths:<smoother>' rows: the SciPy and loop (Numba) smoothers against each other on
+    the closes NaN-padded at the end and with gaps in the middle.
+    """
+    batch = compute_features_pandasta(rates)
+    ours = compute_features(rates)
+    cols = columns or FEATURE_COLUMNS
+    a, b = batch[cols].to_numpy(float), ours[cols].to_numpy(float)
+    diff = np.abs(a - b)
+    diff[np.isnan(a) != np.isnan(b)] = np.inf
+    out = pd.Series(np.nanmax(diff[warmup:], axis=0), index=cols)
+    close = rates.sort_values('time')['close'].to_numpy(float)
+    T = len(close)
+    rows = np.vstack([close, close, close])
+    rows[1, -min(50, T // 4):] = np.nan                     # trailing padding, as in a stacked block
+    rows[2, T // 3:T // 3 + 5] = rows[2, T // 2] = np.nan  # gaps mid-series
+    for name, d in ind.path_parity(rows).items():
+        out[f"paths:{name}"] = d
+    return out
+
+
+def check_pairs_parity(split: str = "testing", main: str = "USDJPY", warmup: int = 200) -> pd.Series:
+    """
+    Every pair of ``split`` through compute_feature_block in one call, compared with
+    compute_features_pandasta pair by pair (worst pair per column), plus each
+    '<pair>_close' aux column aligned on ``main`` against a pandas reindex.
+    """
+    from bar_store import find_csvs
+    from feature_matrix import stack_pairs
+    symbols = sorted({os.path.basename(p).split("_")[0] for p in find_csvs("*", "H4", [split])})
+    found, lengths, times, base = stack_pairs(symbols, split)
+    values = compute_feature_block(base[:, :, :5])
+    worst = np.zeros(len(FEATURE_COLUMNS))
+    for i, sym in enumerate(found):
+        n = int(lengths[i])
+        rates = pd.DataFrame({'time': pd.to_datetime(times[i, :n], unit='s'), 'open': base[i, :n, 0],
+                              'high': base[i, :n, 1], 'low': base[i, :n, 2], 'close': base[i, :n, 3],
+                              'tick_volume': base[i, :n, 4]})
+        ref = compute_features_pandasta(rates)[FEATURE_COLUMNS].to_numpy(float)
+        diff = np.abs(values[i, :n] - ref)
+        diff[np.isnan(values[i, :n]) != np.isnan(ref)] = np.inf
+        worst = np.fmax(worst, np.nanmax(diff[warmup:], axis=0))
+    out = pd.Series(worst, index=FEATURE_COLUMNS)
+    m = found.index(main)
+    t_main = times[m, :lengths[m]]
+    for i, sym in enumerate(found):
+        if i == m:
+            continue
+        n = int(lengths[i])
+        ours = align_closes(t_main, times[i, :n], base[i, :n, 3])
+        ref = pd.Series(base[i, :n, 3], index=times[i, :n]).reindex(t_main).to_numpy()
+        d = np.where(np.isnan(ours) & np.isnan(ref), 0.0, np.abs(ours - ref))   # no bar on either side is a match
+        d[np.isnan(ours) != np.isnan(ref)] = np.inf
+        out[f"{sym.lower()}_close"] = float(d.max()) if len(d) else 0.0
+    return out
+
+
+if __name__ == "__main__":
+    # Parity checks on an MT5-exported CSV (streaming engine and NumPy kernels vs pandas_ta), e.g.:
+    #   python features.py testing/USDJPY_H4_202201030000_202505270800.csv
+    # or every pair of a split through compute_feature_block in one call (plus the aux closes):
+    #   python features.py --pairs testing
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "--pairs":
+        res = check_pairs_parity(sys.argv[2] if len(sys.argv) > 2 else "testing")
+        print(res.to_string())
+        ok = bool((res < 1e-8).all())
+        print("PARITY OK" if ok else "PARITY FAILED")
+        sys.exit(0 if ok else 1)
+    path = sys.argv[1] if len(sys.argv) > 1 else "testing/USDJPY_H4_202201030000_202505270800.csv"
+    rates = read_rates_csv(path)
+    kernels = check_kernel_parity(rates)
+    paths = kernels[kernels.index.str.startswith("paths:")]
+    worst = pd.DataFrame({"stream": check_parity(rates), "kernels": kernels.drop(paths.index)})
+    print(worst.to_string())
+    print(paths.to_string())
+    ok = bool((worst < 1e-8).all().all() and (paths < 1e-8).all())
+    print("PARITY OK" if ok else "PARITY FAILED")
+    sys.exit(0 if ok else 1)
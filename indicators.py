@@ -0,0 +1,306 @@
+# Array-in / array-out technical indicators with pandas_ta's formulas
+#   every kernel takes float arrays shaped (..., time): one series, or a (pairs x time) block
+#   python indicators.py        time each kernel on a 13 x 5000 block (NumPy vs Numba when installed)
+import os
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+from scipy.signal import lfilter
+
+try:
+    import numba
+except ImportError:         # optional: JIT loops for the recursive smoothers
+    numba = None
+
+# "1" = use the Numba loops for ewm / ema when numba is installed, "0" = always the NumPy/SciPy filters
+USE_NUMBA = numba is not None and os.getenv("CTC_NUMBA", "1") == "1"
+
+
+def _rows(x: np.ndarray) -> np.ndarray:
+    """Contiguous float64 2-D view (rows, time) of an (..., time) array."""
+    a = np.ascontiguousarray(x, dtype=np.float64)
+    return a.reshape(-1, a.shape[-1]) if a.ndim != 2 else a
+
+
+# ===========================
+# Building blocks
+# ===========================
+def shift(x: np.ndarray, k: int = 1) -> np.ndarray:
+    """Series.shift(k) along the last axis (NaN fill)."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    T = x.shape[-1]
+    if k >= 0:
+        out[..., k:] = x[..., :T - k]
+    else:
+        out[..., :k] = x[..., -k:]
+    return out
+
+def rolling(x: np.ndarray, n: int, fn: Callable, **kwargs) -> np.ndarray:
+    """rolling(n) with min_periods = n (a NaN in the window gives NaN) for a numpy reducer."""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.full(x.shape, np.nan)
+    if n > 0 and x.shape[-1] >= n:
+        out[..., n - 1:] = fn(np.lib.stride_tricks.sliding_window_view(x, n, axis=-1), axis=-1, **kwargs)
+    return out
+
+def sma(x: np.ndarray, n: int) -> np.ndarray:
+    return rolling(x, n, np.mean)
+
+def rolling_std(x: np.ndarray, n: int = 20, ddof: int = 1) -> np.ndarray:
+    """rolling(n).std(ddof) (sample std by default, like pandas)."""
+    return rolling(x, n, np.std, ddof=ddof)
+
+def wma(x: np.ndarray, n: int) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float64)
+    w = np.arange(1, n + 1, dtype=float)
+    out = np.full(x.shape, np.nan)
+    if x.shape[-1] >= n:
+        out[..., n - 1:] = np.lib.stride_tricks.sliding_window_view(x, n, axis=-1) @ (w / w.sum())
+    return out
+
+
+# ===========================
+# Recursive smoothers
+# ===========================
+def _ewm_loop(x, alpha, adjust, min_periods, out):
+    """pandas' ewm().mean() recursion (ignore_na=False), row by row; compiled with Numba when available."""
+    old_wt_factor = 1.0 - alpha
+    new_wt = 1.0 if adjust else alpha
+    minp = max(min_periods, 1)
+    for r in range(x.shape[0]):
+        weighted = np.nan
+        old_wt = 1.0
+        nobs = 0
+        for t in range(x.shape[1]):
+            v = x[r, t]
+            is_obs = v == v
+            if is_obs:
+                nobs += 1
+            if weighted == weighted:
+                old_wt *= old_wt_factor
+                if is_obs:
+                    if weighted != v:
+                        weighted = (old_wt * weighted + new_wt * v) / (old_wt + new_wt)
+                    old_wt = old_wt + new_wt if adjust else 1.0
+            elif is_obs:
+                weighted = v
+            out[r, t] = weighted if nobs >= minp else np.nan
+
+def _ema_loop(x, n, out):
+    """pandas_ta.ema per row: mean of the first n values from the first valid one, then ewm(span=n, adjust=False)."""
+    alpha = 2.0 / (n + 1)
+    for r in range(x.shape[0]):
+        T = x.shape[1]
+        f = 0
+        while f < T and x[r, f] != x[r, f]:
+            f += 1
+        for t in range(T):
+            out[r, t] = np.nan
+        s = f + n - 1
+        if s >= T:
+            continue
+        acc = 0.0
+        for t in range(f, s + 1):
+            acc += x[r, t]
+        weighted = acc / n
+        out[r, s] = weighted
+        old_wt = 1.0
+        for t in range(s + 1, T):
+            v = x[r, t]
+            if weighted == weighted:
+                old_wt *= 1.0 - alpha
+                if v == v:
+                    if weighted != v:
+                        weighted = (old_wt * weighted + alpha * v) / (old_wt + alpha)
+                    old_wt = 1.0
+            elif v == v:
+                weighted = v
+            out[r, t] = weighted
+
+def _ewm_filter(x, alpha, min_periods, out):
+    """_ewm_loop with adjust=True as two first-order IIR filters: weighted sum / weight sum."""
+    obs = ~np.isnan(x)
+    den_coef = [1.0, -(1.0 - alpha)]
+    num = lfilter([1.0], den_coef, np.where(obs, x, 0.0), axis=1)
+    den = lfilter([1.0], den_coef, obs.astype(float), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out[:] = num / den
+    out[np.cumsum(obs, axis=1) < max(min_periods, 1)] = np.nan
+
+def _ema_tail(x, w, a, out):
+    """
+    One row after its seed `w` (NaN when the seed window had a gap), as _ema_loop:
+    a NaN carries the last value, and the first value after a gap of k bars is
+    weighted against (1 - a)**(k + 1). lfilter runs over each gap-free segment.
+    """
+    b = 1.0 - a
+    valid = ~np.isnan(x)
+    starts = np.flatnonzero(valid & ~np.r_[False, valid[:-1]])
+    ends = np.flatnonzero(valid & ~np.r_[valid[1:], False]) + 1
+    last, prev = -1, 0      # index of the last observation (the seed sits at -1), end of the last segment
+    for t0, t1 in zip(starts, ends):
+        out[prev:t0] = w
+        if w != w:
+            w = x[t0]
+        else:
+            old = b ** (t0 - last)
+            w = (old * w + a * x[t0]) / (old + a)
+        out[t0] = w
+        if t1 > t0 + 1:
+            out[t0 + 1:t1] = lfilter([a], [1.0, -b], x[t0 + 1:t1], zi=[b * w])[0]
+            w = out[t1 - 1]
+        last, prev = t1 - 1, t1
+    out[prev:] = w
+
+def _ema_filter(x, n, out):
+    """_ema_loop with SciPy: rows sharing a first valid index are seeded and filtered together."""
+    T = x.shape[1]
+    valid = ~np.isnan(x)
+    first = np.where(valid.any(axis=1), valid.argmax(axis=1), T)
+    a = 2.0 / (n + 1)
+    out[:] = np.nan
+    for f in np.unique(first):          # rows are left-aligned, so this is normally one group
+        idx = np.flatnonzero(first == f)
+        s = f + n - 1
+        if s >= T:
+            continue
+        seed = x[idx, f:s + 1].mean(axis=1)
+        out[idx, s] = seed
+        if s + 1 == T:
+            continue
+        tail = x[idx, s + 1:]
+        clean = ~np.isnan(seed) & ~np.isnan(tail).any(axis=1)
+        if clean.any():
+            out[idx[clean], s + 1:] = lfilter([a], [1.0, -(1.0 - a)], tail[clean], axis=1,
+                                              zi=((1.0 - a) * seed[clean])[:, None])[0]
+        for r in np.flatnonzero(~clean):    # padded or gapped rows
+            _ema_tail(tail[r], seed[r], a, out[idx[r], s + 1:])
+
+if USE_NUMBA:
+    _ewm_loop = numba.njit(cache=True, nogil=True)(_ewm_loop)
+    _ema_loop = numba.njit(cache=True, nogil=True)(_ema_loop)
+
+
+def ewm_mean(x: np.ndarray, alpha: float, min_periods: int = 0) -> np.ndarray:
+    """Series.ewm(alpha, adjust=True, ignore_na=False).mean() along the last axis."""
+    rows = _rows(x)
+    out = np.empty_like(rows)
+    if USE_NUMBA:
+        _ewm_loop(rows, alpha, True, min_periods, out)
+    else:
+        _ewm_filter(rows, alpha, min_periods, out)
+    return out.reshape(np.shape(x))
+
+def rma(x: np.ndarray, n: int) -> np.ndarray:
+    """pandas_ta.rma: Wilder smoothing, ewm(alpha=1/n, min_periods=n)."""
+    return ewm_mean(x, 1.0 / n, n)
+
+def ema(x: np.ndarray, n: int) -> np.ndarray:
+    """pandas_ta.ema: SMA of the first n values (from each row's first valid one) as seed, then ewm(span=n, adjust=False)."""
+    rows = _rows(x)
+    out = np.empty_like(rows)
+    (_ema_loop if USE_NUMBA else _ema_filter)(rows, n, out)
+    return out.reshape(np.shape(x))
+
+def path_parity(x: np.ndarray) -> Dict[str, float]:
+    """
+    Max |SciPy filter - loop| of each recursive smoother on `x`, whose rows may be
+    NaN-padded or gapped (a NaN on one path only counts as inf). The loops run
+    compiled when Numba is in use, as plain Python otherwise.
+    """
+    rows = _rows(x)
+    cases = {f"ema({n})": (lambda f, o, n=n: f(rows, n, o), _ema_filter, _ema_loop) for n in (6, 12, 26, 42)}
+    cases["rma(14)"] = (lambda f, o: f(rows, 1.0 / 14, 14, o), _ewm_filter,
+                        lambda r, al, mp, o: _ewm_loop(r, al, True, mp, o))
+    worst = {}
+    for name, (call, filt, loop) in cases.items():
+        a, b = np.empty_like(rows), np.empty_like(rows)
+        call(filt, a)
+        call(loop, b)
+        d = np.where(np.isnan(a) & np.isnan(b), 0.0, np.abs(a - b))
+        d[np.isnan(a) != np.isnan(b)] = np.inf
+        worst[name] = float(d.max()) if d.size else 0.0
+    return worst
+
+
+# ===========================
+# Indicators (pandas_ta defaults, non-TA-Lib code path)
+# ===========================
+def log_return(close: np.ndarray) -> np.ndarray:
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.log(close / shift(close, 1))
+
+def slope(x: np.ndarray) -> np.ndarray:
+    """x / x.shift(1) - 1 (pct_change of an already-smoothed series)."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return x / shift(x, 1) - 1
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray) -> np.ndarray:
+    pc = shift(close, 1)
+    tr = np.fmax(np.fmax(np.abs(high - low), np.abs(high - pc)), np.abs(pc - low))
+    tr[..., 0] = np.nan
+    return tr
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> np.ndarray:
+    return rma(true_range(high, low, close), n)
+
+def willr(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int = 14) -> np.ndarray:
+    ll, hh = rolling(low, n, np.min), rolling(high, n, np.max)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * ((close - ll) / (hh - ll) - 1)
+
+def stoch(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+          k: int = 14, d: int = 3, smooth_k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """(%K, %D): raw stochastic over k bars, smoothed by an SMA(smooth_k), %D = SMA(d) of %K."""
+    ll, hh = rolling(low, k, np.min), rolling(high, k, np.max)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        raw = 100 * (close - ll) / (hh - ll)
+    stoch_k = sma(raw, smooth_k)
+    return stoch_k, sma(stoch_k, d)
+
+def rsi(close: np.ndarray, n: int = 14) -> np.ndarray:
+    diff = close - shift(close, 1)
+    nan = np.isnan(diff)
+    pos = rma(np.where(diff > 0, diff, np.where(nan, np.nan, 0.0)), n)
+    neg = rma(np.where(diff < 0, diff, np.where(nan, np.nan, 0.0)), n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return 100 * pos / (pos + np.abs(neg))
+
+def macd(close: np.ndarray, fast: int = 12, slow: int = 26,
+         signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(MACD, signal, histogram); the signal EMA is seeded from the first valid MACD values."""
+    line = ema(close, fast) - ema(close, slow)
+    sig = ema(line, signal)
+    return line, sig, line - sig
+
+def adx(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+        n: int = 14) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(ADX, DMP, DMN)."""
+    up, dn = high - shift(high, 1), shift(low, 1) - low
+    pos = np.where((up > dn) & (up > 0), up, 0.0)
+    neg = np.where((dn > up) & (dn > 0), dn, 0.0)
+    pos[np.isnan(up)] = neg[np.isnan(up)] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        k = 100 / atr(high, low, close, n)
+        dmp, dmn = k * rma(pos, n), k * rma(neg, n)
+        return rma(100 * np.abs(dmp - dmn) / (dmp + dmn), n), dmp, dmn
+
+
+if __name__ == "__main__":
+    import time
+    rng = np.random.default_rng(0)
+    c = 100 + np.cumsum(rng.normal(0, 0.1, (13, 5000)), axis=1)
+    h, l = c + rng.uniform(0, 0.2, c.shape), c - rng.uniform(0, 0.2, c.shape)
+    kernels = {
+        "ema(42)": lambda: ema(c, 42), "rma(14)": lambda: rma(c, 14), "rsi": lambda: rsi(c),
+        "macd": lambda: macd(c), "adx(10)": lambda: adx(h, l, c, 10), "atr": lambda: atr(h, l, c),
+        "stoch": lambda: stoch(h, l, c), "willr": lambda: willr(h, l, c), "std(20)": lambda: rolling_std(c, 20),
+    }
+    print(f"[Indicators] 13 x 5000 block, {'Numba' if USE_NUMBA else 'NumPy/SciPy'} smoothers")
+    for name, fn in kernels.items():
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(10):
+            fn()
+        print(f"  {name:<9} {(time.perf_counter() - t0) * 100:8.3f} ms")
@@ -0,0 +1,256 @@
+# Multi-symbol market-data layer for the prediction server
+import glob
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from bar_store import load_rates
+
+
+# MetaTrader5.TIMEFRAME_* values, so timeframes work without the MT5 package
+TIMEFRAMES: Dict[str, int] = {
+    "M1": 1, "M5": 5, "M15": 15, "M30": 30,
+    "H1": 0x4000 | 1, "H4": 0x4000 | 4, "D1": 0x4000 | 24,
+    "W1": 0x8000 | 1, "MN1": 0xC000 | 1,
+}
+PERIODS: Dict[int, str] = {v: k for k, v in TIMEFRAMES.items()}
+
+
+# ===========================
+# Sources
+# ===========================
+class MarketDataSource:
+    """What MarketData needs from a feed: symbol resolution and MT5-style bar copies."""
+
+    def resolve(self, base: str) -> str:
+        raise NotImplementedError
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> Optional[np.ndarray]:
+        """Bars [start_pos, start_pos+count) counted back from the newest (forming) bar, oldest first."""
+        raise NotImplementedError
+
+
+class MT5Source(MarketDataSource):
+    """Live terminal via the MetaTrader5 package."""
+
+    def __init__(self, mt5_api: Any, resolver: Callable[[str], str]):
+        self.mt5 = mt5_api
+        self.resolver = resolver
+
+    def resolve(self, base: str) -> str:
+        return self.resolver(base)
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> Optional[np.ndarray]:
+        return self.mt5.copy_rates_from_pos(symbol, timeframe, start_pos, count)
+
+
+class CsvReplaySource(MarketDataSource):
+    """
+    Replays the MT5-exported CSVs in training/ and testing/ as if they were a live feed
+    (read through the bar_store cache, so each CSV is only parsed once).
+
+    The replay clock ``now`` decides which bars exist: the bar whose open time is
+    the latest <= now is the "forming" bar at position 0. With ``speed`` > 0 the
+    clock runs at ``speed`` simulated seconds per wall second from ``start``;
+    with speed == 0 it only moves via step()/seek(), i.e. as fast as the caller goes.
+    """
+
+    def __init__(self, dirs: Iterable[str] = ("training", "testing"), start: Optional[str] = None,
+                 speed: float = 0.0, root: str = "."):
+        self.files: Dict[Tuple[str, str], List[str]] = {}
+        for d in dirs:
+            for path in sorted(glob.glob(os.path.join(root, d, "*.csv"))):
+                parts = os.path.basename(path).split("_")
+                if len(parts) >= 3 and parts[1] in TIMEFRAMES:
+                    self.files.setdefault((parts[0], parts[1]), []).append(path)
+        if not self.files:
+            raise RuntimeError(f"No MT5 CSV exports found under {list(dirs)}")
+        self._arrays: Dict[Tuple[str, int], np.ndarray] = {}
+        self._times: Dict[Tuple[str, int], np.ndarray] = {}   # contiguous copy of arr['time'] for searchsorted
+        self._lock = threading.Lock()
+        self.speed = speed
+        self._t0 = time.monotonic()
+        self._start = int(pd.Timestamp(start).value // 10**9) if start else 0
+        self.now = self._start
+
+    # ---- clock ----
+    def clock(self) -> int:
+        if self.speed > 0:
+            return self._start + int((time.monotonic() - self._t0) * self.speed)
+        return self.now
+
+    def seek(self, when) -> None:
+        self.now = self._start = int(pd.Timestamp(when).value // 10**9)
+        self._t0 = time.monotonic()
+
+    def step(self, symbol: str, timeframe: int) -> Optional[int]:
+        """Advance the clock to the next bar open of ``symbol``; None when the data runs out."""
+        self.load(symbol, timeframe)
+        times = self._times[(symbol, timeframe)]
+        i = np.searchsorted(times, self.clock(), side='right')
+        if i >= len(times):
+            return None
+        self.seek(pd.Timestamp(int(times[i]), unit='s'))
+        return self.now
+
+    # ---- data ----
+    def load(self, symbol: str, timeframe: int) -> np.ndarray:
+        key = (symbol, timeframe)
+        arr = self._arrays.get(key)
+        if arr is None:
+            with self._lock:
+                arr = self._arrays.get(key)
+                if arr is None:
+                    paths = self.files.get((symbol, PERIODS.get(timeframe, "")))
+                    if not paths:
+                        raise RuntimeError(f"No replay data for {symbol} {PERIODS.get(timeframe, timeframe)}")
+                    arr = np.concatenate([load_rates(p) for p in paths])
+                    arr = arr[np.argsort(arr['time'], kind='stable')]
+                    keep = np.ones(len(arr), bool)
+                    keep[:-1] = arr['time'][1:] != arr['time'][:-1]   # last copy of a duplicated bar wins
+                    arr = arr[keep]
+                    self._times[key] = np.ascontiguousarray(arr['time'])
+                    self._arrays[key] = arr
+        return arr
+
+    def symbols(self) -> List[str]:
+        return sorted({sym for sym, _ in self.files})
+
+    def resolve(self, base: str) -> str:
+        if not base:
+            raise RuntimeError("Empty symbol")
+        names = self.symbols()
+        if base in names:
+            return base
+        candidates = sorted((n for n in names if base in n), key=len)
+        if candidates:
+            return candidates[0]
+        raise RuntimeError(f"Failed to select symbol variant for {base}")
+
+    def copy_rates_from_pos(self, symbol: str, timeframe: int, start_pos: int, count: int) -> Optional[np.ndarray]:
+        arr = self.load(symbol, timeframe)
+        end = int(np.searchsorted(self._times[(symbol, timeframe)], self.clock(), side='right')) - start_pos
+        if end <= 0:
+            return None
+        return arr[max(0, end - count):end].copy()
+
+
+# ===========================
+# Buffered multi-symbol access
+# ===========================
+class MarketData:
+    """
+    Rolling per-(symbol, timeframe) bar buffers on top of a MarketDataSource.
+
+    - symbol resolutions are cached (resolve_symbol may scan symbols_get())
+    - once a buffer is warm only the newest ``incremental_bars`` are pulled and
+      merged in; the still-forming bar is always replaced by the fresh copy
+    - aux closes for several symbols are fetched together on a thread pool and
+      aligned on the main time index in one pass (inline when ``workers`` <= 1,
+      e.g. for an in-memory replay source where a thread hop costs more than the copy)
+    """
+
+    def __init__(self, source: MarketDataSource,
+                 max_bars: int = 600, incremental_bars: int = 8, workers: int = 4):
+        self.source = source
+        self.max_bars = max_bars
+        self.incremental_bars = incremental_bars
+        self._resolved: Dict[str, str] = {}
+        self._buffers: Dict[Tuple[str, int], np.ndarray] = {}
+        self._lock = threading.Lock()
+        self._pool = (ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mt5-fetch")
+                      if workers > 1 else None)
+
+    # ---- symbols ----
+    def resolve(self, base: str) -> str:
+        sym = self._resolved.get(base)
+        if sym is None:
+            sym = self.source.resolve(base)
+            self._resolved[base] = sym
+        return sym
+
+    def forget(self, base: str) -> None:
+        """Drop a cached resolution (and its buffers), e.g. after the broker renames a symbol."""
+        with self._lock:
+            sym = self._resolved.pop(base, None)
+            for key in [k for k in self._buffers if k[0] == sym]:
+                del self._buffers[key]
+
+    # ---- bars ----
+    def _copy_rates(self, sym: str, timeframe: int, count: int) -> np.ndarray:
+        rates = self.source.copy_rates_from_pos(sym, timeframe, 0, count)
+        if rates is None or len(rates) == 0:
+            raise RuntimeError(f"Failed to get OHLC for {sym}")
+        return rates
+
+    def bars(self, base: str, timeframe: int, count: int) -> Tuple[np.ndarray, str]:
+        """
+        Last ``count`` bars (including the forming one) as the raw MT5 structured array.
+        Returns (rates, resolved_symbol).
+        """
+        try:
+            sym = self.resolve(base)
+            key = (sym, timeframe)
+            with self._lock:
+                buf = self._buffers.get(key)
+
+            if buf is None or len(buf) < count:
+                merged = self._copy_rates(sym, timeframe, max(count, self.max_bars))
+            else:
+                fresh = self._copy_rates(sym, timeframe, self.incremental_bars)
+                # The fresh slice must overlap the buffer, otherwise bars were missed
+                if fresh['time'][0] > buf['time'][-1]:
+                    merged = self._copy_rates(sym, timeframe, max(count, self.max_bars))
+                else:
+                    keep = np.searchsorted(buf['time'], fresh['time'][0])
+                    merged = np.concatenate([buf[:keep], fresh])
+            merged = merged[-max(count, self.max_bars):]
+            with self._lock:
+                self._buffers[key] = merged
+        except RuntimeError:
+            self.forget(base)
+            raise
+        return merged[-count:], sym
+
+    def rates(self, base: str, timeframe: int, count: int) -> Tuple[pd.DataFrame, str]:
+        """Same contract as fetch_rates: (df with datetime 'time' column, resolved_symbol)."""
+        rates, sym = self.bars(base, timeframe, count)
+        df = pd.DataFrame(rates)
+        df['time'] = pd.to_datetime(df['time'], unit='s')
+        return df, sym
+
+    def aux_close_values(self, times: np.ndarray, aux_map: Dict[str, str],
+                         timeframe: int, count: int) -> Dict[str, np.ndarray]:
+        """
+        Closes of every aux symbol aligned on ``times`` (bar open times, epoch seconds),
+        NaN where an aux symbol has no bar. All fetches are issued together.
+        """
+        if self._pool is not None:
+            futures = {col: self._pool.submit(self.bars, base, timeframe, count)
+                       for col, base in aux_map.items()}
+            fetched = {col: fut.result() for col, fut in futures.items()}
+        else:
+            fetched = {col: self.bars(base, timeframe, count) for col, base in aux_map.items()}
+        target = np.asarray(times, np.int64)
+        cols: Dict[str, np.ndarray] = {}
+        for col, (rates, _) in fetched.items():
+            bar_times = rates['time'].astype(np.int64)
+            pos = np.searchsorted(bar_times, target)
+            pos_c = np.minimum(pos, len(bar_times) - 1)
+            hit = (pos < len(bar_times)) & (bar_times[pos_c] == target)
+            cols[col] = np.where(hit, rates['close'][pos_c], np.nan)
+        return cols
+
+    def aux_closes(self, index: pd.Index, aux_map: Dict[str, str], timeframe: int, count: int) -> pd.DataFrame:
+        """aux_close_values aligned on a datetime index, as a frame."""
+        target = pd.DatetimeIndex(index).values.astype('datetime64[s]').astype(np.int64)
+        return pd.DataFrame(self.aux_close_values(target, aux_map, timeframe, count), index=index)
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
@@ -0,0 +1,261 @@
+# Latency histograms, counters and a Prometheus endpoint for the prediction server
+import bisect
+import json
+import math
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Bucket upper bounds in seconds: 1 us .. ~67 s, four buckets per doubling (~19% wide),
+# so an interpolated quantile is within a few percent of the exact one.
+BOUNDS: List[float] = [1e-6 * 2 ** (k / 4) for k in range(105)]
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt_labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"'.replace("\n", " ") for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Histogram:
+    """Fixed log-spaced buckets: observe() is a bisect and two adds; quantiles come from the counts."""
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(BOUNDS) + 1)   # last bucket = above BOUNDS[-1]
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, secs: float) -> None:
+        self.counts[bisect.bisect_left(BOUNDS, secs)] += 1
+        self.count += 1
+        self.total += secs
+        if secs > self.max:
+            self.max = secs
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Linear interpolation inside the bucket that holds the q-th observation."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c and seen + c >= rank:
+                lo = BOUNDS[i - 1] if i > 0 else 0.0
+                hi = BOUNDS[i] if i < len(BOUNDS) else self.max
+                return min(lo + (hi - lo) * max(0.0, rank - seen) / c, self.max)
+            seen += c
+        return self.max
+
+    def summary(self) -> Dict[str, Any]:
+        ms = lambda v: round(v * 1e3, 4) if v is not None else None
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else None,
+            "p50_ms": ms(self.quantile(0.50)),
+            "p95_ms": ms(self.quantile(0.95)),
+            "p99_ms": ms(self.quantile(0.99)),
+            "max_ms": ms(self.max) if self.count else None,
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "stage", "labels", "t0")
+
+    def __init__(self, metrics: "Metrics", stage: str, labels: Dict[str, Any]):
+        self.metrics, self.stage, self.labels = metrics, stage, labels
+
+    def __enter__(self) -> None:
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.metrics.observe(self.stage, time.perf_counter() - self.t0, **self.labels)
+
+
+class Metrics:
+    """
+    Per-stage latency histograms, labelled counters and gauges, all behind one lock
+    (held for a few additions per observation). Optionally keeps a per-request trace:
+    with tracing on, every stage timed on a thread between begin_trace() and
+    end_trace() is written as one JSON line.
+    """
+
+    def __init__(self, prefix: str = "ctc", trace_path: str = "", trace: bool = False):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._hist: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[str, Callable[[], Any]] = {}
+        self._local = threading.local()
+        self.trace_path = trace_path
+        self.tracing = trace
+        self.traced = 0
+        self.started = time.time()
+
+    # ---- recording ----
+    def observe(self, stage: str, secs: float, **labels: Any) -> None:
+        key = (stage, _labels(labels))
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = Histogram()
+            h.observe(secs)
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace["stages"][stage] = round(trace["stages"].get(stage, 0.0) + secs * 1e3, 4)
+
+    def timer(self, stage: str, **labels: Any) -> "_Timer":
+        """`with metrics.timer("stage"):` observes the block's wall time, also when it raises."""
+        return _Timer(self, stage, labels)
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name: str, fn: Callable[[], Any]) -> None:
+        """Register a value read at scrape time (queue depth, cache size, ...)."""
+        self._gauges[name] = fn
+
+    # ---- per-request trace ----
+    def set_tracing(self, on: bool) -> None:
+        self.tracing = on
+
+    def begin_trace(self, **fields: Any) -> None:
+        self._local.trace = {"ts": round(time.time(), 6), **fields, "stages": {}} if self.tracing else None
+        self._local.t0 = time.perf_counter()
+
+    def end_trace(self, **fields: Any) -> None:
+        trace = getattr(self._local, "trace", None)
+        self._local.trace = None
+        if trace is None:
+            return
+        trace.update(fields)
+        trace["total_ms"] = round((time.perf_counter() - self._local.t0) * 1e3, 4)
+        line = json.dumps(trace, default=str)
+        try:
+            if self.trace_path:
+                with self._lock, open(self.trace_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            else:
+                print(f"[TRACE] {line}", file=sys.stderr)
+            self.traced += 1
+        except Exception as e:
+            print(f"[TRACE] write failed: {e}", file=sys.stderr)
+
+    # ---- export ----
+    def _gauge_values(self) -> Dict[str, Any]:
+        out = {}
+        for name, fn in self._gauges.items():
+            try:
+                out[name] = fn()
+            except Exception:
+                out[name] = None
+        return out
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view: stage -> {count, mean/p50/p95/p99/max ms}, counters, gauges."""
+        with self._lock:
+            hists = {(s, l): h.summary() for (s, l), h in self._hist.items()}
+            counters = dict(self._counters)
+        stages: Dict[str, Any] = {}
+        for (stage, labels), summary in sorted(hists.items()):
+            stages[stage + _fmt_labels(labels)] = summary
+        counts: Dict[str, Any] = {}
+        for (name, labels), v in sorted(counters.items()):
+            counts[name + _fmt_labels(labels)] = v
+        return {
+            "uptime_secs": round(time.time() - self.started, 1),
+            "tracing": self.tracing,
+            "traced": self.traced,
+            "stages": stages,
+            "counters": counts,
+            "gauges": self._gauge_values(),
+        }
+
+    def prometheus(self) -> str:
+        """Text exposition format 0.0.4."""
+        p = self.prefix
+        with self._lock:
+            hists = [(s, l, list(h.counts), h.count, h.total) for (s, l), h in sorted(self._hist.items())]
+            counters = sorted(self._counters.items())
+        lines = [f"# TYPE {p}_stage_seconds histogram"]
+        for stage, labels, counts, count, total in hists:
+            lab = (("stage", stage),) + labels
+            cum = 0
+            for bound, c in zip(BOUNDS, counts):
+                cum += c
+                if c:   # empty buckets are implied by the next cumulative count
+                    le = 'le="%.6g"' % bound
+                    lines.append(f"{p}_stage_seconds_bucket{_fmt_labels(lab, le)} {cum}")
+            inf = 'le="+Inf"'
+            lines.append(f"{p}_stage_seconds_bucket{_fmt_labels(lab, inf)} {count}")
+            lines.append(f"{p}_stage_seconds_sum{_fmt_labels(lab)} {total:.9f}")
+            lines.append(f"{p}_stage_seconds_count{_fmt_labels(lab)} {count}")
+        typed = set()
+        for (name, labels), v in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {p}_{name}_total counter")
+                typed.add(name)
+            lines.append(f"{p}_{name}_total{_fmt_labels(labels)} {v:g}")
+        for name, v in self._gauge_values().items():
+            if isinstance(v, bool):
+                v = int(v)
+            if isinstance(v, (int, float)) and math.isfinite(v):
+                lines.append(f"# TYPE {p}_{name} gauge")
+                lines.append(f"{p}_{name} {v:g}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer(threading.Thread):
+    """
+    Side HTTP port: GET /metrics (Prometheus text), GET /stats (JSON snapshot),
+    GET /trace?on=1|0 (toggle the per-request trace log).
+    """
+
+    def __init__(self, metrics: Metrics, host: str = "127.0.0.1", port: int = 9105):
+        super().__init__(name="metrics-http", daemon=True)
+        registry = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path, _, query = self.path.partition("?")
+                if path == "/metrics":
+                    body, ctype = registry.prometheus().encode(), "text/plain; version=0.0.4"
+                elif path == "/stats":
+                    body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+                elif path == "/trace":
+                    if "on=" in query:
+                        registry.set_tracing(query.split("on=", 1)[1][:1] in ("1", "t", "y"))
+                    body, ctype = json.dumps({"tracing": registry.tracing}).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):   # scrapes are not worth a log line each
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    def run(self) -> None:
+        self.httpd.serve_forever(poll_interval=0.5)
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -0,0 +1,181 @@
+# TensorFlow-free runtime for the consensus MLP
+import hashlib
+import json
+import pickle
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    out = np.empty_like(z)
+    pos = z >= 0
+    out[pos] = 1.0 / (1.0 + np.exp(-z[pos]))
+    ez = np.exp(z[~pos])
+    out[~pos] = ez / (1.0 + ez)
+    return out
+
+_ACTIVATIONS = {
+    'linear':  lambda z: z,
+    'relu':    lambda z: np.maximum(z, 0.0, out=z),
+    'tanh':    np.tanh,
+    'sigmoid': _sigmoid,
+}
+
+
+class NumpyMLP:
+    """
+    Dense-only forward pass with the input scaler folded into the first layer:
+        scaled = X * scale + offset
+        scaled @ W0 + b0 == X @ (scale[:, None] * W0) + (offset @ W0 + b0)
+    so a prediction is a handful of small matmuls and no per-call framework overhead.
+    """
+
+    def __init__(self, weights: List[np.ndarray], biases: List[np.ndarray],
+                 activations: List[str], meta: Optional[Dict[str, Any]] = None):
+        if not (len(weights) == len(biases) == len(activations)):
+            raise ValueError("weights, biases and activations must have the same length")
+        for act in activations:
+            if act not in _ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {act}")
+        self.weights = [np.ascontiguousarray(w, dtype=np.float64) for w in weights]
+        self.biases = [np.ascontiguousarray(b, dtype=np.float64) for b in biases]
+        self.activations = activations
+        self.meta = meta or {}
+
+    @property
+    def n_features(self) -> int:
+        return self.weights[0].shape[0]
+
+    @property
+    def model_id(self) -> str:
+        return self.meta.get("model_id", "")
+
+    def check_features(self, columns: List[str]) -> None:
+        """ValueError unless the model takes ``columns``, in that order (when its file names its features)."""
+        if self.n_features != len(columns):
+            raise ValueError(f"model takes {self.n_features} features, got {len(columns)} columns")
+        feats = self.meta.get("features")
+        if feats is not None and list(feats) != list(columns):
+            raise ValueError(f"model was trained on {feats}, got {list(columns)}")
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Raw (unscaled) feature rows in, 1-D array of output probabilities out."""
+        h = np.asarray(X, dtype=np.float64)
+        if h.ndim == 1:
+            h = h[None, :]
+        for W, b, act in zip(self.weights, self.biases, self.activations):
+            h = _ACTIVATIONS[act](h @ W + b)
+        return h.ravel()
+
+    # ---- persistence ----
+    def save(self, path: str) -> None:
+        arrays: Dict[str, np.ndarray] = {}
+        for i, (W, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"W{i}"] = W
+            arrays[f"b{i}"] = b
+        meta = dict(self.meta, activations=self.activations)
+        np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, path: str) -> "NumpyMLP":
+        with np.load(path, allow_pickle=False) as z:
+            meta = json.loads(str(z["meta"]))
+            n = len(meta["activations"])
+            weights = [z[f"W{i}"] for i in range(n)]
+            biases = [z[f"b{i}"] for i in range(n)]
+        return cls(weights, biases, meta["activations"], meta)
+
+
+def _scaler_affine(scaler: Any, n_features: int):
+    """(scale, offset) such that scaler.transform(X) == X * scale + offset."""
+    if hasattr(scaler, "min_") and hasattr(scaler, "scale_"):           # MinMaxScaler
+        if getattr(scaler, "clip", False):
+            raise ValueError("MinMaxScaler(clip=True) cannot be folded into the first layer")
+        return np.asarray(scaler.scale_, float), np.asarray(scaler.min_, float)
+    if hasattr(scaler, "mean_") and hasattr(scaler, "scale_"):          # StandardScaler
+        scale = 1.0 / np.asarray(scaler.scale_, float)
+        return scale, -np.asarray(scaler.mean_, float) * scale
+    if scaler is None:
+        return np.ones(n_features), np.zeros(n_features)
+    raise ValueError(f"Unsupported scaler: {type(scaler).__name__}")
+
+
+def from_layers(weights: List[np.ndarray], biases: List[np.ndarray], activations: List[str],
+                scaler: Any = None, feature_names: Optional[List[str]] = None) -> NumpyMLP:
+    """NumpyMLP from raw dense layers, folding ``scaler`` into the first one."""
+    weights = [np.asarray(W, np.float64) for W in weights]
+    biases = [np.asarray(b, np.float64) for b in biases]
+    scale, offset = _scaler_affine(scaler, weights[0].shape[0])
+    biases[0] = offset @ weights[0] + biases[0]
+    weights[0] = scale[:, None] * weights[0]
+
+    digest = hashlib.sha1()
+    for arr in weights + biases:
+        digest.update(np.ascontiguousarray(arr).tobytes())
+    meta = {"model_id": digest.hexdigest()[:12], "n_features": int(weights[0].shape[0])}
+    if feature_names is not None:
+        meta["features"] = list(feature_names)
+    return NumpyMLP(weights, biases, list(activations), meta)
+
+
+def keras_layers(model: Any):
+    """(weights, biases, activations) of a Keras Sequential of Dense/Dropout layers."""
+    weights, biases, acts = [], [], []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == "Dropout":           # identity at inference
+            continue
+        if kind != "Dense":
+            raise ValueError(f"Unsupported layer for NumPy export: {kind}")
+        W, b = layer.get_weights()
+        weights.append(np.asarray(W, np.float64))
+        biases.append(np.asarray(b, np.float64))
+        acts.append(layer.get_config()["activation"])
+    return weights, biases, acts
+
+
+def from_keras(model: Any, scaler: Any = None, feature_names: Optional[List[str]] = None) -> NumpyMLP:
+    """Build a NumpyMLP from an in-memory Keras Sequential of Dense/Dropout layers."""
+    return from_layers(*keras_layers(model), scaler, feature_names)
+
+
+def export_keras(model_path: str, scaler_path: str, out_path: str,
+                 feature_names: Optional[List[str]] = None, check_rows: int = 1000) -> float:
+    """
+    Export a saved .keras model + pickled scaler to a .npz weights file and return
+    the max |keras - numpy| probability difference over ``check_rows`` random rows.
+    TensorFlow is only needed here, never at serving time.
+    """
+    from tensorflow.keras.models import load_model
+
+    model = load_model(model_path)
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    mlp = from_keras(model, scaler, feature_names)
+    mlp.save(out_path)
+
+    # Random rows spanning the scaler's fitted range (plus some margin)
+    rng = np.random.default_rng(0)
+    n = mlp.n_features
+    if hasattr(scaler, "data_min_"):
+        lo, hi = np.asarray(scaler.data_min_), np.asarray(scaler.data_max_)
+    else:
+        lo, hi = -np.ones(n), np.ones(n)
+    span = hi - lo
+    X = rng.uniform(lo - 0.1 * span, hi + 0.1 * span, size=(check_rows, n))
+
+    ref = model.predict(scaler.transform(X), verbose=0).ravel()
+    got = NumpyMLP.load(out_path).predict_proba(X)
+    return float(np.max(np.abs(ref - got)))
+
+
+if __name__ == "__main__":
+    # python numpy_model.py <model.keras> <scaler.pkl> <out.npz>
+    import sys
+    if len(sys.argv) != 4:
+        print("usage: python numpy_model.py <model.keras> <scaler.pkl> <out.npz>")
+        sys.exit(2)
+    err = export_keras(sys.argv[1], sys.argv[2], sys.argv[3])
+    print(f"Wrote {sys.argv[3]}  max|keras-numpy| = {err:.2e}")
+    sys.exit(0 if err < 1e-5 else 1)
@@ -0,0 +1,107 @@
+# Per-bar prediction cache and bar-close precompute scheduler
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Set, Tuple
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions keyed by (resolved_symbol, timeframe, last_closed_bar_time).
+    A prediction cannot change until the next bar closes, so a key is never stale;
+    old bars simply fall off the end once ``max_entries`` is reached.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[Tuple[str, int, Any], Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Tuple[str, int, Any]) -> Optional[Any]:
+        with self._lock:
+            val = self._data.get(key)
+            if val is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return val
+
+    def put(self, key: Tuple[str, int, Any], value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key: Tuple[str, int, Any]) -> bool:
+        with self._lock:
+            return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / total, 4) if total else None,
+            }
+
+
+class BarCloseScheduler(threading.Thread):
+    """
+    Background thread that watches (symbol, timeframe) pairs and calls ``compute``
+    as soon as a new closed bar appears, so the first request of a bar hits the cache.
+
+    probe(symbol, timeframe)   -> time of the last closed bar (cheap)
+    compute(symbol, timeframe) -> warms the cache for that bar
+    """
+
+    def __init__(self,
+                 probe: Callable[[str, int], Any],
+                 compute: Callable[[str, int], Any],
+                 poll_secs: float = 1.0):
+        super().__init__(name="bar-close-scheduler", daemon=True)
+        self.probe = probe
+        self.compute = compute
+        self.poll_secs = poll_secs
+        self._watch: Set[Tuple[str, int]] = set()
+        self._last_bar: Dict[Tuple[str, int], Any] = {}
+        self._lock = threading.Lock()
+        self._stop_evt = threading.Event()
+        self.precomputed = 0
+        self.errors = 0
+
+    def watch(self, symbol: str, timeframe: int) -> None:
+        with self._lock:
+            self._watch.add((symbol, timeframe))
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+
+    def run(self) -> None:
+        while not self._stop_evt.wait(self.poll_secs):
+            with self._lock:
+                pairs = list(self._watch)
+            for symbol, timeframe in pairs:
+                key: Hashable = (symbol, timeframe)
+                try:
+                    bar = self.probe(symbol, timeframe)
+                    if bar is None or self._last_bar.get(key) == bar:
+                        continue
+                    self.compute(symbol, timeframe)
+                    self._last_bar[key] = bar
+                    self.precomputed += 1
+                except Exception as e:
+                    self.errors += 1
+                    print(f"[Scheduler] {symbol}/{timeframe}: {type(e).__name__}: {e}", file=sys.stderr)
@@ -0,0 +1,105 @@
+# PUB/SUB broadcast of closed-bar predictions
+import struct
+import threading
+from typing import Dict, NamedTuple, Tuple
+
+import zmq
+
+
+# Topic: b"<SYMBOL>|<TF>" e.g. b"USDJPY|H4"; subscribe to b"USDJPY|" for every timeframe.
+# Payload (little-endian, 33 bytes):
+#   int64   bar_time     open time of the closed bar, epoch seconds
+#   float64 prob         P(up); NaN for 'hold'
+#   uint8   label        0 = sell, 1 = buy, 2 = hold
+#   char12  model_id     ASCII, NUL-padded
+#   uint32  latency_us   feature + inference time for this bar
+PACKET = struct.Struct("<qdB12sI")
+
+LABEL_CODES: Dict[str, int] = {"sell": 0, "buy": 1, "hold": 2}
+LABEL_NAMES: Dict[int, str] = {v: k for k, v in LABEL_CODES.items()}
+
+
+class Packet(NamedTuple):
+    symbol: str
+    period: str
+    bar_time: int
+    prob: float
+    label: str
+    model_id: str
+    latency_us: int
+
+
+def topic(symbol: str, period: str) -> bytes:
+    return f"{symbol}|{period}".encode("ascii")
+
+def model_id_bytes(model_id: str) -> bytes:
+    """The char12 model_id field; ids longer than 12 characters are truncated."""
+    try:
+        return model_id.encode("ascii")[:12]
+    except UnicodeEncodeError:
+        raise ValueError(f"model_id must be ASCII, got {model_id!r}") from None
+
+def encode(bar_time: int, prob: float, label: str, model_id: str, latency_us: int) -> bytes:
+    return PACKET.pack(int(bar_time), float(prob), LABEL_CODES[label],
+                       model_id_bytes(model_id), min(int(latency_us), 0xFFFFFFFF))
+
+def decode(topic_frame: bytes, payload: bytes) -> Packet:
+    symbol, _, period = topic_frame.decode("ascii").partition("|")
+    bar_time, prob, label, model_id, latency_us = PACKET.unpack(payload)
+    return Packet(symbol, period, bar_time, prob, LABEL_NAMES.get(label, "hold"),
+                  model_id.rstrip(b"\0").decode("ascii"), latency_us)
+
+
+class PredictionPublisher:
+    """
+    PUB socket that broadcasts each closed-bar prediction once, as soon as it is
+    computed. Safe to call from the scheduler and worker threads.
+    """
+
+    def __init__(self, ctx: zmq.Context, endpoint: str, model_id: str, sndhwm: int = 1000):
+        model_id_bytes(model_id)        # fail at startup, not on the first publish
+        self.model_id = model_id
+        self.sock = ctx.socket(zmq.PUB)
+        self.sock.setsockopt(zmq.LINGER, 0)
+        self.sock.setsockopt(zmq.SNDHWM, sndhwm)
+        self.sock.bind(endpoint)
+        self.endpoint = endpoint
+        self._lock = threading.Lock()
+        self._last: Dict[Tuple[str, str], int] = {}
+        self.published = 0
+
+    def publish(self, symbol: str, period: str, bar_time: int, prob: float, label: str, latency_us: int) -> bool:
+        """Publish unless this (symbol, period, bar) already went out; returns True if sent."""
+        key = (symbol, period)
+        payload = encode(bar_time, prob, label, self.model_id, latency_us)
+        with self._lock:
+            if self._last.get(key) == bar_time:
+                return False
+            self.sock.send_multipart([topic(symbol, period), payload])
+            self._last[key] = bar_time
+            self.published += 1
+        return True
+
+    def close(self) -> None:
+        with self._lock:
+            self.sock.close(0)
+
+
+if __name__ == "__main__":
+    # Minimal subscriber: python prediction_pub.py tcp://127.0.0.1:5556 [USDJPY ...]
+    import sys
+    import time
+    endpoint = sys.argv[1] if len(sys.argv) > 1 else "tcp://127.0.0.1:5556"
+    prefixes = sys.argv[2:] or [""]
+    ctx = zmq.Context()
+    sub = ctx.socket(zmq.SUB)
+    sub.connect(endpoint)
+    for p in prefixes:
+        sub.setsockopt(zmq.SUBSCRIBE, (p + "|" if p else "").encode("ascii"))
+    print(f"[SUB] {endpoint} topics={prefixes}")
+    while True:
+        t, payload = sub.recv_multipart()
+        pkt = decode(t, payload)
+        when = time.strftime("%Y.%m.%d %H:%M:%S", time.gmtime(pkt.bar_time))
+        print(f"[{when}] {pkt.symbol} {pkt.period}: {pkt.label} p={pkt.prob:.3f} "
+              f"model={pkt.model_id} latency={pkt.latency_us}us")
@@ -0,0 +1,63 @@
+# Drive the prediction pipeline over the CSV archive (no terminal needed)
+#   python replay_predictions.py --symbols USDJPY --start 2022-01-03 --end 2025-05-27 --out replay.csv
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("CTC_DATA_SOURCE", "replay")
+
+import numpy as np
+import pandas as pd
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay training/ + testing/ CSVs through make_predictions")
+    ap.add_argument("--symbols", default="USDJPY", help="comma-separated base symbols (first one drives the clock)")
+    ap.add_argument("--period", default="H4")
+    ap.add_argument("--start", default="2022-01-03")
+    ap.add_argument("--end", default=None)
+    ap.add_argument("--out", default=None, help="optional CSV of timestamp,symbol,prediction,prob")
+    args = ap.parse_args()
+
+    os.environ["CTC_REPLAY_START"] = args.start
+    import send_ctc_v1_predictions as server
+    if server.DATA_SOURCE != "replay":
+        sys.exit("CTC_DATA_SOURCE must be 'replay' for this script")
+    server.LOG_PREDICTIONS = False
+
+    src = server.data_source
+    symbols = [s for s in args.symbols.split(",") if s]
+    timeframe = server.timeframe_from_period(args.period)
+    end = int(pd.Timestamp(args.end).value // 10**9) if args.end else None
+
+    latencies, rows, errors = [], [], 0
+    t_start = time.perf_counter()
+    while src.step(symbols[0], timeframe) is not None:
+        if end is not None and src.now > end:
+            break
+        t0 = time.perf_counter()
+        preds, errs = server.make_predictions(symbols, timeframe)
+        latencies.append(time.perf_counter() - t0)
+        errors += len(errs)
+        for sym, p in preds.items():
+            rows.append((p.bar_time, sym, p.label, p.prob))
+    wall = time.perf_counter() - t_start
+
+    if not latencies:
+        sys.exit("No bars replayed")
+    lat_ms = np.array(latencies) * 1e3
+    bars = len(latencies)
+    print(f"[Replay] {bars} bars x {len(symbols)} symbols in {wall:.2f}s "
+          f"-> {bars / wall:,.0f} bars/s, {len(rows) / wall:,.0f} predictions/s, {errors} errors")
+    print(f"[Replay] latency ms  p50={np.percentile(lat_ms, 50):.3f}  p95={np.percentile(lat_ms, 95):.3f}  "
+          f"p99={np.percentile(lat_ms, 99):.3f}  max={lat_ms.max():.3f}")
+    print(f"[Replay] cache {server.prediction_cache.stats()}")
+
+    if args.out:
+        pd.DataFrame(rows, columns=["timestamp", "symbol", "prediction", "prob"]).to_csv(args.out, index=False)
+        print(f"[Replay] Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
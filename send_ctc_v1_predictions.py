@@ -1,44 +1,119 @@
 #Prediction server
 import zmq
+import os
 import signal
 import sys
+import json
+import threading
+import time
 import pickle
+import hashlib
 import numpy as np
 import pandas as pd
-import pandas_ta as ta
-import MetaTrader5 as mt5
-from tensorflow.keras.models import load_model
 from datetime import datetime
-from typing import Optional, Dict, Tuple
+from typing import Optional, Dict, List, NamedTuple, Tuple
+
+from features import StreamingFeatureEngine, CONSENSUS_FEATS, AUX_SYMBOLS, ENGINE_FEATS
+from prediction_cache import PredictionCache, BarCloseScheduler
+from market_data import MarketData, MT5Source, CsvReplaySource, TIMEFRAMES, PERIODS
+from zmq_server import RouterServer
+from numpy_model import NumpyMLP, from_keras
+from prediction_pub import PredictionPublisher
+from metrics import Metrics, MetricsServer
 
 
 # ===========================
 # Config
 # ===========================
-SYMBOL_MAIN   = "USDJPY"
-TIMEFRAME     = mt5.TIMEFRAME_H4
-N_BARS        = 600
+# "mt5" = live terminal, "replay" = MT5-exported CSVs in training/ + testing/ (no terminal needed)
+DATA_SOURCE   = os.getenv("CTC_DATA_SOURCE", "mt5")
+REPLAY_DIRS   = ("training", "testing")
+REPLAY_START  = os.getenv("CTC_REPLAY_START", "2022-01-03")
+REPLAY_SPEED  = float(os.getenv("CTC_REPLAY_SPEED", "0"))   # simulated secs per wall sec; 0 = stepped
 
-AUX_SYMBOLS = {
-    "gbpusd_close": "GBPUSD",
-    "nzdusd_close": "NZDUSD",
-    "eurusd_close": "EURUSD",
-    "gbpjpy_close": "GBPJPY",
-}
+if DATA_SOURCE == "mt5":
+    import MetaTrader5 as mt5
+else:
+    mt5 = None
 
-CONSENSUS_FEATS = [
-    'williams_%r','log_return','stoch_%k','gbpusd_close','slope_42','close',
-    'nzdusd_close','macd_signal','macd_hist','stoch_%d','ema_6','adx_10',
-    'rsi','low','eurusd_close','tickvol','std_dev','macd','gbpjpy_close','atr'
-]
+SYMBOL_MAIN   = "USDJPY"
+TIMEFRAME     = TIMEFRAMES["H4"]
+N_BARS        = 600
+STREAM_BARS   = 8      # bars fetched per request once a feature engine is warm
+
+AUX_FETCH_WORKERS    = 4 if DATA_SOURCE == "mt5" else 1   # concurrent aux-symbol fetches (replay is in-memory)
+PREDICTION_CACHE_MAX = 256   # cached (symbol, timeframe, bar) predictions
+PRECOMPUTE           = True  # compute predictions as soon as a bar closes
+PRECOMPUTE_POLL_SECS = 1.0
+
+ZMQ_ENDPOINT         = "tcp://127.0.0.1:5555"
+SERVER_MODE          = os.getenv("CTC_SERVER_MODE", "router")   # "router" (worker pool) | "rep" (single loop)
+SERVER_WORKERS       = int(os.getenv("CTC_SERVER_WORKERS", "4"))
+REQUEST_TIMEOUT_SECS = float(os.getenv("CTC_REQUEST_TIMEOUT_SECS", "10"))
+MAX_INFLIGHT         = 64
+LOG_PREDICTIONS      = True  # one line per computed prediction
+PUB_ENDPOINT         = os.getenv("CTC_PUB_ENDPOINT", "")  # e.g. "tcp://127.0.0.1:5556"; empty = no broadcast
+PUB_SYMBOLS          = [x for x in os.getenv("CTC_PUB_SYMBOLS", "").split(",") if x]  # precomputed + published from startup
+METRICS_HOST         = os.getenv("CTC_METRICS_HOST", "127.0.0.1")
+METRICS_PORT         = int(os.getenv("CTC_METRICS_PORT", "9105"))   # Prometheus /metrics + JSON /stats; 0 = off
+TRACE                = os.getenv("CTC_TRACE", "0") == "1"       # per-request stage timings (toggle: "trace|on")
+TRACE_PATH           = os.getenv("CTC_TRACE_PATH", "")          # JSON lines file; empty = stderr
+
+# Stage histograms, per-symbol counters and the optional request trace
+metrics = Metrics(trace=TRACE, trace_path=TRACE_PATH)
+
+# Column positions in X: streaming-engine features vs aux closes
+ENGINE_COLS  = [j for j, c in enumerate(CONSENSUS_FEATS) if c not in AUX_SYMBOLS]
+AUX_COLS     = [(j, c) for j, c in enumerate(CONSENSUS_FEATS) if c in AUX_SYMBOLS]
 
 
 # ===========================
 # Load model & scaler (once)
 # ===========================
-model_cons = load_model('code_to_cash_usdjpy_h4_02-08-25_model.keras')
-with open('code_to_cash_usdjpy_h4_02-08-25_scaler.pkl','rb') as f:
-    scaler_cons = pickle.load(f)
+MODEL_PATH    = 'code_to_cash_usdjpy_h4_02-08-25_model.keras'
+SCALER_PATH   = 'code_to_cash_usdjpy_h4_02-08-25_scaler.pkl'
+WEIGHTS_PATH  = os.getenv("CTC_WEIGHTS_PATH", 'code_to_cash_usdjpy_h4_02-08-25_weights.npz')   # python numpy_model.py MODEL SCALER WEIGHTS
+# "numpy" = fused scaler + forward pass without TensorFlow, "keras" = load_model,
+# "auto" = numpy when the exported weights file exists
+MODEL_BACKEND = os.getenv("CTC_MODEL_BACKEND", "auto")
+
+if MODEL_BACKEND == "numpy" or (MODEL_BACKEND == "auto" and os.path.exists(WEIGHTS_PATH)):
+    model_np = NumpyMLP.load(WEIGHTS_PATH)
+    try:    # a weights file exported with other (e.g. per-fold ranked) features must not be fed CONSENSUS_FEATS
+        model_np.check_features(CONSENSUS_FEATS)
+    except ValueError as e:
+        raise RuntimeError(f"{WEIGHTS_PATH}: {e}") from None
+    MODEL_KIND = "numpy"
+    MODEL_ID = model_np.model_id
+
+    def predict_proba(X: np.ndarray) -> np.ndarray:
+        """Unscaled feature rows -> P(up)."""
+        with metrics.timer("predict"):   # scaling is fused into the first layer
+            return model_np.predict_proba(X)
+else:
+    from tensorflow.keras.models import load_model
+    model_cons = load_model(MODEL_PATH)
+    with open(SCALER_PATH,'rb') as f:
+        scaler_cons = pickle.load(f)
+    if getattr(scaler_cons, "n_features_in_", len(CONSENSUS_FEATS)) != len(CONSENSUS_FEATS):
+        raise RuntimeError(f"{SCALER_PATH}: scaler takes {scaler_cons.n_features_in_} features, "
+                           f"CONSENSUS_FEATS has {len(CONSENSUS_FEATS)}")
+    MODEL_KIND = "keras"
+    try:    # the id the NumPy export of this model carries: sha1 of the scaler-folded weights
+        MODEL_ID = from_keras(model_cons, scaler_cons).model_id
+    except ValueError:      # layers or scaler the export does not handle: hash the files instead
+        digest = hashlib.sha1()
+        for path in (MODEL_PATH, SCALER_PATH):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        MODEL_ID = digest.hexdigest()[:12]
+
+    def predict_proba(X: np.ndarray) -> np.ndarray:
+        """Unscaled feature rows -> P(up)."""
+        with metrics.timer("scale"):
+            Xs = scaler_cons.transform(X)
+        with metrics.timer("predict"):
+            return model_cons.predict(Xs, verbose=0).ravel()
 
 # ===========================
 # Helpers
@@ -92,68 +167,28 @@ def timeframe_from_period(period_str: str) -> int:
     Accepts e.g.: M1,M5,M15,M30,H1,H4,D1,W1,MN1 (case-insensitive).
     """
     p = period_str.upper()
-    lut = {
-        "M1": mt5.TIMEFRAME_M1, "M5": mt5.TIMEFRAME_M5, "M15": mt5.TIMEFRAME_M15,
-        "M30": mt5.TIMEFRAME_M30, "H1": mt5.TIMEFRAME_H1, "H4": mt5.TIMEFRAME_H4,
-        "D1": mt5.TIMEFRAME_D1, "W1": mt5.TIMEFRAME_W1, "MN1": mt5.TIMEFRAME_MN1,
-    }
-    if p not in lut:
+    if p not in TIMEFRAMES:
         raise RuntimeError(f"Unsupported timeframe: {period_str}")
-    return lut[p]
+    return TIMEFRAMES[p]
+
+def period_from_timeframe(timeframe: int) -> str:
+    """Inverse of timeframe_from_period (e.g. TIMEFRAME_H4 -> 'H4')."""
+    return PERIODS.get(timeframe, str(timeframe))
 
 def fetch_rates(base_symbol: str, timeframe: int, count: int) -> Tuple[pd.DataFrame, str]:
     """
     base_symbol can be 'USDJPY'; resolves to actual (e.g., 'USDJPY.a').
+    Served from the rolling bar buffer; only new bars are pulled from MT5.
     Returns (df, resolved_symbol).
     """
-    sym = resolve_symbol(base_symbol)
-    rates = mt5.copy_rates_from_pos(sym, timeframe, 0, count)
-    if rates is None or len(rates) == 0:
-        raise RuntimeError(f"Failed to get OHLC for {sym}")
-    df = pd.DataFrame(rates)
-    df['time'] = pd.to_datetime(df['time'], unit='s')
-    return df, sym
-
-def compute_features_pandasta(df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
-    out = out.rename(columns={'tick_volume': 'tickvol'})
-    out = out[['time', 'open', 'high', 'low', 'close', 'tickvol']]
-    out.set_index('time', inplace=True)
-    out.sort_index(inplace=True)
-
-    out['log_return'] = np.log(out['close'] / out['close'].shift(1))
-    out['williams_%r'] = ta.willr(high=out['high'], low=out['low'], close=out['close'], length=14)
-
-    stoch = ta.stoch(high=out['high'], low=out['low'], close=out['close'], k=14, d=3)
-    out['stoch_%k'] = stoch['STOCHk_14_3_3']
-    out['stoch_%d'] = stoch['STOCHd_14_3_3']
-
-    out['rsi'] = ta.rsi(close=out['close'], length=14)
-
-    macd = ta.macd(close=out['close'], fast=12, slow=26, signal=9)
-    out['macd']        = macd['MACD_12_26_9']
-    out['macd_signal'] = macd['MACDs_12_26_9']
-    out['macd_hist']   = macd['MACDh_12_26_9']
-
-    adx = ta.adx(high=out['high'], low=out['low'], close=out['close'], length=10)
-    out['adx_10'] = adx['ADX_10']
-
-    out['ema_6'] = ta.ema(close=out['close'], length=6)
-    ema42 = ta.ema(close=out['close'], length=42)
-    out['slope_42'] = ema42.pct_change(1)
-
-    out['atr'] = ta.atr(high=out['high'], low=out['low'], close=out['close'], length=14)
-    out['std_dev'] = out['close'].rolling(20).std()
-
-    return out
+    return market_data.rates(base_symbol, timeframe, count)
 
 def attach_aux_closes(main_df: pd.DataFrame, aux_map: Dict[str, str], timeframe: int, n_bars: int) -> pd.DataFrame:
+    """Aux closes are fetched concurrently and aligned on main_df's time index in one pass."""
+    aux = market_data.aux_closes(main_df.index, aux_map, timeframe, n_bars)
     result = main_df.copy()
-    for col_name, base_sym in aux_map.items():
-        aux_df, aux_resolved = fetch_rates(base_sym, timeframe, n_bars)
-        aux_df = aux_df[['time', 'close']].rename(columns={'close': col_name})
-        aux_df.set_index('time', inplace=True)
-        result = result.join(aux_df[col_name], how='left')
+    for col in aux.columns:
+        result[col] = aux[col].to_numpy()   # positional: main_df may repeat a bar time (batches)
     return result
 
 def build_X(df_full: pd.DataFrame):
@@ -162,82 +197,357 @@ def build_X(df_full: pd.DataFrame):
     X = X[mask]
     return X, mask
 
-def make_prediction(base_symbol: str, timeframe: int) -> str:
+# One lock per (symbol, timeframe): its feature engine must not be advanced by two
+# threads at once, while other pairs (and cache hits) proceed in parallel.
+pair_locks: Dict[Tuple[str, int], threading.RLock] = {}
+_pair_locks_guard = threading.Lock()
+model_lock = threading.Lock()   # Keras models are not safe to call from several threads
+
+def pair_lock(base_symbol: str, timeframe: int) -> threading.RLock:
+    key = (base_symbol, timeframe)
+    with _pair_locks_guard:
+        lock = pair_locks.get(key)
+        if lock is None:
+            lock = pair_locks[key] = threading.RLock()
+        return lock
+
+class Prediction(NamedTuple):
+    label: str               # 'buy' / 'sell' / 'hold'
+    prob: float              # P(up); NaN for 'hold'
+    bar_time: pd.Timestamp   # open time of the closed bar the features were built on
+    latency_us: int          # feature + inference time of the computation that produced it
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_MAX)
+if DATA_SOURCE == "replay":
+    data_source = CsvReplaySource(REPLAY_DIRS, start=REPLAY_START, speed=REPLAY_SPEED)
+else:
+    data_source = MT5Source(mt5, resolve_symbol)
+market_data = MarketData(data_source, max_bars=N_BARS,
+                         incremental_bars=STREAM_BARS, workers=AUX_FETCH_WORKERS)
+
+# Warm streaming feature engines, one per (symbol, timeframe)
+feature_engines: Dict[Tuple[str, int], StreamingFeatureEngine] = {}
+
+def latest_features(base_symbol: str, timeframe: int) -> Tuple[StreamingFeatureEngine, str]:
     """
-    Computes features on the latest completed bar(s), scales, predicts, 'buy'/'sell'/'hold'.
+    Streaming engine advanced to the latest *closed* bar.
+    A cold (or gapped) engine is warmed on N_BARS of history; a warm one only
+    pulls STREAM_BARS and consumes the bars it has not seen yet. Works on the raw
+    MT5 arrays, so a warm request builds no DataFrames.
+    Returns (engine, resolved_symbol); engine.row / engine.last_time are the result.
     """
-    # Use all but the *current forming* bar
-    main_rates, resolved = fetch_rates(base_symbol, timeframe, N_BARS)
-    main_rates = main_rates.iloc[:-1].copy()
-    main_feats = compute_features_pandasta(main_rates)
-    feats_full = attach_aux_closes(main_feats, AUX_SYMBOLS, timeframe, N_BARS)
+    key = (base_symbol, timeframe)
+    engine = feature_engines.get(key)
+    count = STREAM_BARS if engine is not None else N_BARS
 
-    X_new, _ = build_X(feats_full)
-    if X_new.empty:
-        return "hold"
+    # Use all but the *current forming* bar
+    with metrics.timer("fetch_rates"):
+        rates, resolved = market_data.bars(base_symbol, timeframe, count)
+        rates = rates[:-1]
+        if engine is None or not engine.covers(rates):
+            if count != N_BARS:
+                rates, resolved = market_data.bars(base_symbol, timeframe, N_BARS)
+                rates = rates[:-1]
+            engine = StreamingFeatureEngine()
+            feature_engines[key] = engine
+    with metrics.timer("features"):
+        engine.extend(rates)
+    return engine, resolved
+
+def last_closed_bar_time(resolved: str, timeframe: int) -> pd.Timestamp:
+    """Open time of the most recent *closed* bar (one-bar MT5 call)."""
+    rates = data_source.copy_rates_from_pos(resolved, timeframe, 1, 1)
+    if rates is None or len(rates) == 0:
+        raise RuntimeError(f"Failed to get last closed bar for {resolved}")
+    return pd.Timestamp(int(rates[0]['time']), unit='s')
 
-    X_scaled = scaler_cons.transform(X_new.values)
-    y_prob = model_cons.predict(X_scaled, verbose=0).ravel()
-    y_lbl  = (y_prob > 0.5).astype(int)
-    pred   = "buy" if y_lbl[-1] == 1 else "sell"
+def compute_predictions(base_symbols: List[str], timeframe: int
+                        ) -> Tuple[Dict[str, Tuple[str, Prediction]], Dict[str, Exception]]:
+    """
+    Builds only the final feature row of each symbol, aligns the aux closes for all
+    rows in one pass and runs a single inference call over the stacked matrix.
+    A symbol whose final closed row has a NaN (e.g. an aux pair with no bar at that
+    time) gets 'hold'; it is not predicted from an older complete row.
+    Returns ({base: (resolved_symbol, Prediction)}, {base: exception}).
+    """
+    t0 = time.perf_counter()
+    rows: List[List[float]] = []
+    bar_times: List[int] = []
+    resolved_of: Dict[str, str] = {}
+    errors: Dict[str, Exception] = {}
+    for base in base_symbols:
+        try:
+            with pair_lock(base, timeframe):
+                engine, resolved_of[base] = latest_features(base, timeframe)
+                rows.append(engine.values(ENGINE_FEATS))
+                bar_times.append(engine.last_time)
+        except Exception as e:
+            errors[base] = e
+    done = [b for b in base_symbols if b not in errors]
+    if not done:
+        return {}, errors
+
+    with metrics.timer("aux_closes"):
+        aux = market_data.aux_close_values(np.array(bar_times, np.int64), AUX_SYMBOLS, timeframe, STREAM_BARS)
+    X = np.empty((len(done), len(CONSENSUS_FEATS)))
+    X[:, ENGINE_COLS] = rows
+    for j, col in AUX_COLS:
+        X[:, j] = aux[col]
+    ok = ~np.isnan(X).any(axis=1)
+
+    probs = np.full(len(X), np.nan)
+    if ok.any():
+        t_wait = time.perf_counter()
+        with model_lock:
+            metrics.observe("model_lock_wait", time.perf_counter() - t_wait)
+            probs[ok] = predict_proba(X[ok])
+
+    latency_us = int((time.perf_counter() - t0) * 1e6)
+    out: Dict[str, Tuple[str, Prediction]] = {}
+    for i, base in enumerate(done):
+        label = ("buy" if probs[i] > 0.5 else "sell") if ok[i] else "hold"
+        pred = Prediction(label, float(probs[i]), pd.Timestamp(bar_times[i], unit='s'), latency_us)
+        out[base] = (resolved_of[base], pred)
+        if LOG_PREDICTIONS:
+            print(f"[{pred.bar_time}] {resolved_of[base]}: Prediction={label}  p={pred.prob:.3f}")
+    return out, errors
+
+publisher: Optional[PredictionPublisher] = None
+
+def store_prediction(base_symbol: str, resolved: str, timeframe: int, pred: Prediction) -> None:
+    """Cache a freshly computed prediction and broadcast it on the PUB channel (if enabled)."""
+    prediction_cache.put((resolved, timeframe, pred.bar_time), pred)
+    if publisher is not None:
+        try:
+            with metrics.timer("publish"):
+                publisher.publish(base_symbol, period_from_timeframe(timeframe),
+                                  pred.bar_time.value // 10**9, pred.prob, pred.label, pred.latency_us)
+        except Exception as e:
+            print(f"[PUB] {base_symbol}: {type(e).__name__}: {e}", file=sys.stderr)
+
+def cached_prediction(base_symbol: str, timeframe: int) -> Tuple[Tuple[str, int, pd.Timestamp], Optional[Prediction]]:
+    """(cache key of the latest closed bar, cached prediction or None), each step timed."""
+    with metrics.timer("resolve_symbol"):
+        resolved = market_data.resolve(base_symbol)
+    with metrics.timer("probe_bar"):
+        key = (resolved, timeframe, last_closed_bar_time(resolved, timeframe))
+    with metrics.timer("cache"):
+        hit = prediction_cache.get(key)
+    return key, hit
+
+def make_predictions(base_symbols: List[str], timeframe: int) -> Tuple[Dict[str, Prediction], Dict[str, Exception]]:
+    """
+    Cached predictions for the latest closed bar of each symbol; the cache misses
+    are computed together with one inference call.
+    """
+    out: Dict[str, Prediction] = {}
+    errors: Dict[str, Exception] = {}
+    misses: List[str] = []
+    for base in base_symbols:
+        try:
+            _, hit = cached_prediction(base, timeframe)
+        except Exception as e:
+            errors[base] = e
+            continue
+        if hit is not None:
+            out[base] = hit
+        else:
+            misses.append(base)
+    if misses:
+        computed, failed = compute_predictions(misses, timeframe)
+        errors.update(failed)
+        for base, (resolved, pred) in computed.items():
+            store_prediction(base, resolved, timeframe, pred)
+            out[base] = pred
+    return out, errors
 
-    ts = X_new.index[-1]
-    print(f"[{ts}] {resolved}: Prediction={pred}  p={y_prob[-1]:.3f}")
-    return pred
+def make_prediction(base_symbol: str, timeframe: int) -> str:
+    """
+    Cached prediction for the latest closed bar. The answer cannot change until
+    the next bar closes, so repeat polls within a bar skip fetch/features/inference.
+    """
+    key, hit = cached_prediction(base_symbol, timeframe)
+    if hit is not None:
+        return hit.label
+    t_wait = time.perf_counter()
+    with pair_lock(base_symbol, timeframe):
+        metrics.observe("pair_lock_wait", time.perf_counter() - t_wait)
+        # another thread may have filled it while we waited
+        hit = prediction_cache.get(key)
+        if hit is not None:
+            return hit.label
+        computed, errors = compute_predictions([base_symbol], timeframe)
+        if base_symbol in errors:
+            raise errors[base_symbol]
+        resolved, pred = computed[base_symbol]
+        store_prediction(base_symbol, resolved, timeframe, pred)
+        return pred.label
+
+def probe_last_bar(base_symbol: str, timeframe: int) -> pd.Timestamp:
+    return last_closed_bar_time(market_data.resolve(base_symbol), timeframe)
 
 # ===========================
-# ZMQ REP loop
+# Request handling
 # ===========================
-def main():
-    mt5_init_once()
-
-    ctx = zmq.Context(io_threads=1)
-    sock = ctx.socket(zmq.REP)
-    sock.bind("tcp://127.0.0.1:5555")
-    print("[ZMQ] Prediction server listening on tcp://127.0.0.1:5555")
+scheduler: Optional[BarCloseScheduler] = None
+router_server: Optional[RouterServer] = None
 
-    def shutdown(*_):
-        print("\n[ZMQ] Shutting down...")
-        try: sock.close(0)
-        except: pass
-        try: ctx.term()
-        except: pass
-        try: mt5.shutdown()
-        except: pass
-        sys.exit(0)
+def parse_request(msg: str) -> Optional[Tuple[str, int]]:
+    """
+    (base_symbol, timeframe) for a prediction request, None for anything else.
+    Supported:
+    1) "request_prediction"
+    2) "request_prediction|<SYMBOL>|<TF>" e.g., "request_prediction|USDJPY|H4"
+    """
+    if not msg.startswith("request_prediction") or msg.startswith("request_prediction_batch"):
+        return None
+    base_symbol = SYMBOL_MAIN
+    timeframe   = TIMEFRAME
+    parts = msg.split("|")
+    if len(parts) >= 2 and parts[1]:
+        base_symbol = parts[1]
+    if len(parts) >= 3 and parts[2]:
+        timeframe = timeframe_from_period(parts[2])
+    return base_symbol, timeframe
+
+def parse_batch_request(msg: str) -> Optional[Tuple[List[str], int]]:
+    """
+    ([base_symbols], timeframe) for "request_prediction_batch|<SYM1,SYM2,...>|<TF>",
+    None for anything else. TF defaults to the server timeframe.
+    """
+    if not msg.startswith("request_prediction_batch"):
+        return None
+    parts = msg.split("|")
+    symbols = [p.strip() for p in parts[1].split(",") if p.strip()] if len(parts) >= 2 else []
+    if not symbols:
+        raise RuntimeError("request_prediction_batch needs at least one symbol")
+    timeframe = timeframe_from_period(parts[2]) if len(parts) >= 3 and parts[2] else TIMEFRAME
+    return list(dict.fromkeys(symbols)), timeframe
+
+def format_batch_reply(symbols: List[str], preds: Dict[str, Prediction], errors: Dict[str, Exception]) -> str:
+    """
+    One record per symbol, ';'-separated: "SYMBOL|label|prob|YYYY.MM.DD HH:MM:SS"
+    (prob is empty for 'hold'), or "SYMBOL|ERROR:<Type>:<message>".
+    """
+    records = []
+    for sym in symbols:
+        if sym in preds:
+            p = preds[sym]
+            prob = "" if p.prob != p.prob else f"{p.prob:.6f}"
+            records.append(f"{sym}|{p.label}|{prob}|{p.bar_time.strftime('%Y.%m.%d %H:%M:%S')}")
+        else:
+            e = errors.get(sym)
+            detail = str(e).replace("|", "/").replace(";", ",")
+            records.append(f"{sym}|ERROR:{type(e).__name__}:{detail}")
+    return ";".join(records)
+
+def coalesce_key(msg: str) -> Optional[Tuple]:
+    """Identical in-flight prediction requests share one computation."""
+    try:
+        batch = parse_batch_request(msg)
+        if batch is not None:
+            return ("batch", tuple(batch[0]), batch[1])
+        return parse_request(msg)
+    except Exception:
+        return None
+
+def server_stats() -> Dict:
+    """Prediction cache, scheduler, front-end and publisher counters."""
+    stats = prediction_cache.stats()
+    if scheduler is not None:
+        stats.update({"precomputed": scheduler.precomputed, "precompute_errors": scheduler.errors})
+    if router_server is not None:
+        stats.update(router_server.stats())
+    if publisher is not None:
+        stats["published"] = publisher.published
+    return stats
+
+# Symbols used as metric labels: the configured ones plus any that produced a prediction.
+# Anything else a client sends is counted as "other", so junk requests cannot add series.
+label_symbols = {SYMBOL_MAIN, *PUB_SYMBOLS, *AUX_SYMBOLS.values()}
+
+def symbol_label(base_symbol: str, ok: bool = False) -> str:
+    if ok:
+        label_symbols.add(base_symbol)
+    return base_symbol if base_symbol in label_symbols else "other"
+
+def handle_message(msg: str) -> str:
+    """One request string in, one reply string out (shared by the REP and ROUTER modes)."""
+    # "cache_stats" -> JSON with prediction cache hit/miss counters
+    if msg == "cache_stats":
+        return json.dumps(server_stats())
+    # "stats" -> JSON with per-stage latency percentiles, request/error counters and the above
+    if msg == "stats":
+        snap = metrics.snapshot()
+        snap["server"] = server_stats()
+        return json.dumps(snap)
+    # "trace|on" / "trace|off" -> per-request stage timings to CTC_TRACE_PATH (or stderr)
+    if msg.startswith("trace|"):
+        metrics.set_tracing(msg.split("|", 1)[1].strip().lower() in ("on", "1", "true"))
+        return "trace:" + ("on" if metrics.tracing else "off")
+
+    metrics.begin_trace(request=msg)
+    t0 = time.perf_counter()
+    kind = "request"
+    try:
+        batch = parse_batch_request(msg)
+        if batch is not None:
+            kind = "batch"
+            symbols, timeframe = batch
+            preds, errors = make_predictions(symbols, timeframe)
+            for sym in symbols:
+                metrics.inc("requests", symbol=symbol_label(sym, sym in preds), kind=kind)
+            for sym, e in errors.items():
+                metrics.inc("errors", symbol=symbol_label(sym), type=type(e).__name__)
+            if scheduler is not None:
+                for sym in preds:
+                    scheduler.watch(sym, timeframe)
+            reply = format_batch_reply(symbols, preds, errors)
+            metrics.end_trace(reply=reply)
+            return reply
+
+        req = parse_request(msg)
+        if req is None:
+            kind = "unknown"
+            metrics.inc("requests", kind=kind)
+            metrics.end_trace(reply="unknown_request")
+            return "unknown_request"
+        base_symbol, timeframe = req
+        try:
+            pred = make_prediction(base_symbol, timeframe)
+        except Exception as e:
+            label = symbol_label(base_symbol)
+            metrics.inc("requests", symbol=label, kind=kind)
+            metrics.inc("errors", symbol=label, type=type(e).__name__)
+            raise
+        metrics.inc("requests", symbol=symbol_label(base_symbol, True), kind=kind)
+        if scheduler is not None:
+            scheduler.watch(base_symbol, timeframe)
+        metrics.end_trace(reply=pred)
+        return pred
+    except Exception as e:
+        err = f"ERROR:{type(e).__name__}:{e}"
+        print("[Predict] ", err)
+        metrics.end_trace(reply=err)
+        return err
+    finally:
+        metrics.observe("handle", time.perf_counter() - t0, kind=kind)
 
-    signal.signal(signal.SIGINT, shutdown)
-    signal.signal(signal.SIGTERM, shutdown)
+# ===========================
+# ZMQ loops
+# ===========================
+def serve_rep(ctx: zmq.Context) -> None:
+    """Original single-threaded REP loop: one request at a time."""
+    sock = ctx.socket(zmq.REP)
+    sock.bind(ZMQ_ENDPOINT)
+    print(f"[ZMQ] Prediction server listening on {ZMQ_ENDPOINT}")
 
     while True:
         try:
             msg = sock.recv_string()  # blocks
-
-            # Supported:
-            # 1) "request_prediction"
-            # 2) "request_prediction|<SYMBOL>|<TF>" e.g., "request_prediction|USDJPY|H4"
-            base_symbol = SYMBOL_MAIN
-            timeframe   = TIMEFRAME
-
-            if msg.startswith("request_prediction"):
-                parts = msg.split("|")
-                if len(parts) >= 2 and parts[1]:
-                    base_symbol = parts[1]
-                if len(parts) >= 3 and parts[2]:
-                    timeframe = timeframe_from_period(parts[2])
-
-                try:
-                    pred = make_prediction(base_symbol, timeframe)
-                    sock.send_string(pred)
-                    continue
-                except Exception as e:
-                    err = f"ERROR:{type(e).__name__}:{e}"
-                    print("[Predict] ", err)
-                    sock.send_string(err)
-                    continue
-
-            sock.send_string("unknown_request")
-
+            reply = handle_message(msg)
+            with metrics.timer("zmq.send"):
+                sock.send_string(reply)
         except zmq.ContextTerminated:
             break
         except Exception as e:
@@ -247,5 +557,72 @@ def main():
                 pass
             print(f"[ZMQ] Loop error: {e}", file=sys.stderr)
 
+def serve_router(ctx: zmq.Context) -> None:
+    """ROUTER front end with a bounded worker pool; same wire protocol as serve_rep."""
+    global router_server
+    router_server = RouterServer(ctx, ZMQ_ENDPOINT, handle_message, coalesce_key,
+                                 workers=SERVER_WORKERS, timeout_secs=REQUEST_TIMEOUT_SECS,
+                                 max_inflight=MAX_INFLIGHT, metrics=metrics)
+    print(f"[ZMQ] Prediction server listening on {ZMQ_ENDPOINT} "
+          f"(router, {SERVER_WORKERS} workers, timeout {REQUEST_TIMEOUT_SECS:g}s)")
+    router_server.serve_forever()
+
+def main():
+    global scheduler, publisher
+    if DATA_SOURCE == "mt5":
+        mt5_init_once()
+    else:
+        print(f"[Data] Replaying {', '.join(REPLAY_DIRS)} from {REPLAY_START} (speed={REPLAY_SPEED:g})")
+    print(f"[Model] {MODEL_KIND} backend, model id {MODEL_ID}")
+
+    ctx = zmq.Context(io_threads=1)
+
+    metrics.gauge("queue_depth", lambda: router_server.queued if router_server is not None else 0)
+    metrics.gauge("workers_busy", lambda: router_server.running if router_server is not None else 0)
+    metrics.gauge("inflight", lambda: router_server.stats()["inflight"] if router_server is not None else 0)
+    metrics.gauge("cache_entries", lambda: prediction_cache.stats()["entries"])
+    metrics.gauge("cache_hits", lambda: prediction_cache.stats()["hits"])
+    metrics.gauge("cache_misses", lambda: prediction_cache.stats()["misses"])
+    metrics_server = None
+    if METRICS_PORT:
+        metrics_server = MetricsServer(metrics, METRICS_HOST, METRICS_PORT)
+        metrics_server.start()
+        print(f"[Metrics] http://{METRICS_HOST}:{METRICS_PORT}/metrics (Prometheus), /stats (JSON)")
+
+    if PUB_ENDPOINT:
+        publisher = PredictionPublisher(ctx, PUB_ENDPOINT, MODEL_ID)
+        print(f"[ZMQ] Publishing closed-bar predictions on {PUB_ENDPOINT}")
+
+    if PRECOMPUTE:
+        scheduler = BarCloseScheduler(probe_last_bar, make_prediction, poll_secs=PRECOMPUTE_POLL_SECS)
+        scheduler.watch(SYMBOL_MAIN, TIMEFRAME)
+        for sym in PUB_SYMBOLS:
+            scheduler.watch(sym, TIMEFRAME)
+        scheduler.start()
+
+    def shutdown(*_):
+        print("\n[ZMQ] Shutting down...")
+        if scheduler is not None:
+            scheduler.stop()
+        if router_server is not None:
+            router_server.stop()
+        if metrics_server is not None:
+            metrics_server.stop()
+        try: ctx.destroy(linger=0)
+        except: pass
+        market_data.close()
+        if mt5 is not None:
+            try: mt5.shutdown()
+            except: pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    if SERVER_MODE == "rep":
+        serve_rep(ctx)
+    else:
+        serve_router(ctx)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
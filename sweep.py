@@ -0,0 +1,320 @@
+# Parallel parameter sweep / walk-forward optimizer for the breakout backtest
+#   python sweep.py --out sweep.csv
+#   python sweep.py --grid high_low_bars=4,8,12 risk_to_reward=2,3 --workers 8
+#   python sweep.py --walk-forward --train-months 12 --test-months 3 --out wf_is.csv --wf-out wf_oos.csv
+import argparse
+import glob
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backtest import Settings, load_predictions, metrics, simulate
+from bar_store import find_csvs, load_columns
+
+
+# EA inputs swept by default (break_even_ratio 0 = break-even off, lock_profit then ignored)
+DEFAULT_GRID: Dict[str, List[Any]] = {
+    'high_low_bars':    [4, 6, 8, 10, 12],
+    'risk_to_reward':   [1.0, 1.5, 2.0, 3.0],
+    'break_even_ratio': [0, 1, 2],
+    'lock_profit':      [0, 50],
+    'start_hour':       [0, 4, 8],
+    'end_hour':         [16, 20],
+}
+METRICS = ['trades', 'win_rate', 'net_profit', 'profit_factor', 'max_drawdown_pct']
+RANK_BY = ('score', 'net_profit', 'profit_factor', 'max_drawdown_pct')
+BAR_FIELDS = ('time', 'open', 'high', 'low', 'close', 'spread')
+
+
+# ===========================
+# Shared memory
+# ===========================
+class SharedArrays:
+    """Named NumPy arrays packed into one shared-memory block; workers attach views, never copies."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.spec: Dict[str, Tuple[int, Tuple[int, ...], str]] = {}
+        offset = 0
+        for name, arr in arrays.items():
+            offset = (offset + 63) // 64 * 64          # keep every array cache-line aligned
+            self.spec[name] = (offset, arr.shape, arr.dtype.str)
+            offset += arr.nbytes
+        self.shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        for name, arr in arrays.items():
+            self.view(name)[...] = arr
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def view(self, key: str) -> np.ndarray:
+        return _view(self.shm, self.spec[key])
+
+    def close(self) -> None:
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _view(shm: shared_memory.SharedMemory, entry: Tuple[int, Tuple[int, ...], str]) -> np.ndarray:
+    offset, shape, dtype = entry
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    # Pool workers share the parent's resource tracker, which unlinks the block once
+    # when the parent closes it; on 3.13+ skip tracking in the workers altogether.
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+# Worker-side state, set once per process by _init_worker
+_SHM: Optional[shared_memory.SharedMemory] = None
+_ARRAYS: Dict[str, np.ndarray] = {}
+
+def _init_worker(shm_name: str, spec: Dict[str, Tuple[int, Tuple[int, ...], str]]) -> None:
+    global _SHM, _ARRAYS
+    _SHM = _attach(shm_name)
+    _ARRAYS = {key: _view(_SHM, entry) for key, entry in spec.items()}
+
+
+# ===========================
+# Pairs
+# ===========================
+def symbol_settings(symbol: str) -> Dict[str, Any]:
+    """
+    Tester symbol properties for a USD account. Pairs quoted in USD book P&L as is;
+    every other pair divides its quote-currency P&L by the price, which is exact for
+    USDxxx and an approximation (base-currency units) for crosses.
+    """
+    if symbol.startswith("XAU"):
+        point, contract = 0.01, 100.0
+    else:
+        point, contract = (0.001 if symbol.endswith("JPY") else 0.00001), 100_000.0
+    return {'point': point, 'contract_size': contract, 'account_is_base': not symbol.endswith("USD")}
+
+def find_predictions(symbol: str, root: str = ".") -> Optional[str]:
+    """code_to_cash_<symbol>_*predictions.csv in the repo root, if the pair has one."""
+    found = sorted(glob.glob(os.path.join(root, f"code_to_cash_{symbol.lower()}_*predictions.csv")))
+    return found[-1] if found else None
+
+def load_pairs(symbols: List[str], period: str, split: str,
+               predictions: Dict[str, str]) -> Dict[str, np.ndarray]:
+    """Bars + predictions of every pair as flat '<SYMBOL>/<field>' arrays for SharedArrays."""
+    arrays: Dict[str, np.ndarray] = {}
+    for sym in symbols:
+        paths = find_csvs(sym, period, [split])
+        pred_path = predictions.get(sym) or find_predictions(sym)
+        if not paths or not pred_path:
+            print(f"[Sweep] Skipping {sym}: {'no ' + split + ' CSV' if not paths else 'no predictions file'}")
+            continue
+        cols = load_columns(paths[-1], BAR_FIELDS)
+        for field in BAR_FIELDS:
+            arrays[f"{sym}/{field}"] = np.asarray(cols[field])
+        arrays[f"{sym}/pred_time"], arrays[f"{sym}/pred_dir"] = load_predictions(pred_path)
+    return arrays
+
+
+# ===========================
+# Grid + windows
+# ===========================
+def expand_grid(grid: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Cartesian product of the grid, minus combinations that only differ in ignored inputs."""
+    keys = list(grid)
+    seen, combos = set(), []
+    for values in itertools.product(*(grid[k] for k in keys)):
+        combo = dict(zip(keys, values))
+        if combo.get('break_even_ratio', 0) == 0 and 'lock_profit' in combo:
+            combo['lock_profit'] = 0
+        if combo.get('start_hour', 0) >= combo.get('end_hour', 24):
+            continue
+        key = tuple(combo.items())
+        if key not in seen:
+            seen.add(key)
+            combos.append(combo)
+    return combos
+
+def parse_grid(items: List[str]) -> Dict[str, List[Any]]:
+    """['high_low_bars=4,8', 'risk_to_reward=2,3'] -> DEFAULT_GRID with those axes replaced."""
+    grid = dict(DEFAULT_GRID)
+    types = Settings.__annotations__
+    for item in items:
+        key, _, values = item.partition("=")
+        if key not in types:
+            raise RuntimeError(f"Unknown EA input: {key}")
+        cast = types[key]
+        if cast is bool:
+            grid[key] = [v.lower() in ("1", "true") for v in values.split(",") if v]
+        else:
+            grid[key] = [cast(float(v)) if cast is int else cast(v) for v in values.split(",") if v]
+    return grid
+
+def walk_forward_windows(times: np.ndarray, start: int, train_months: int,
+                         test_months: int) -> List[Tuple[int, int, int, int]]:
+    """Rolling (train_start, train_end, test_start, test_end) epoch-second windows, stepping by test_months."""
+    out = []
+    a = pd.Timestamp(start, unit='s')
+    last = pd.Timestamp(int(times[-1]), unit='s')
+    while True:
+        b = a + pd.DateOffset(months=train_months)
+        c = b + pd.DateOffset(months=test_months)
+        if b >= last:
+            break
+        out.append((int(a.value // 10**9), int(b.value // 10**9), int(b.value // 10**9),
+                    int(min(c, last + pd.Timedelta(seconds=1)).value // 10**9)))
+        a = a + pd.DateOffset(months=test_months)
+    return out
+
+
+# ===========================
+# Worker
+# ===========================
+def _run_chunk(symbol: str, start: int, end: int, combos: List[Dict[str, Any]],
+               initial_balance: float) -> List[Dict[str, Any]]:
+    """Backtest ``combos`` on bars of ``symbol`` whose sessions open in [start, end)."""
+    t = _ARRAYS[f"{symbol}/time"]
+    warmup = max(c.get('high_low_bars', Settings().high_low_bars) for c in combos)
+    i0 = int(np.searchsorted(t, start))
+    i1 = int(np.searchsorted(t, end))
+    lo = max(0, i0 - warmup)
+    bars = {field: _ARRAYS[f"{symbol}/{field}"][lo:i1] for field in BAR_FIELDS}
+    pred_t, pred_d = _ARRAYS[f"{symbol}/pred_time"], _ARRAYS[f"{symbol}/pred_dir"]
+    base = dict(symbol_settings(symbol), initial_balance=initial_balance)
+    rows = []
+    for combo in combos:
+        s = Settings(**base, **combo, use_break_even=combo.get('break_even_ratio', 0) > 0)
+        if i1 - lo < 2:
+            stats = metrics(np.empty(0), np.empty(0), initial_balance)
+        else:
+            sim = simulate(bars, pred_t, pred_d, s, start_time=start)
+            stats = metrics(sim.profit, sim.equity, initial_balance)
+        rows.append(dict(combo, **{k: stats[k] for k in METRICS}))
+    return rows
+
+
+def rank(df: pd.DataFrame, by: str = 'score', min_trades: int = 1) -> pd.DataFrame:
+    """
+    Sort results best-first within each (symbol, window). ``score`` is the mean of the
+    per-group ranks of net profit (high), profit factor (high) and max drawdown (low).
+    """
+    df = df[df['trades'] >= min_trades].copy()
+    g = df.groupby(['symbol', 'window'])
+    df['score'] = (g['net_profit'].rank(ascending=False) + g['profit_factor'].rank(ascending=False)
+                   + g['max_drawdown_pct'].rank(ascending=True)) / 3
+    ascending = by in ('score', 'max_drawdown_pct')
+    return df.sort_values(['symbol', 'window', by], ascending=[True, True, ascending])
+
+
+class Sweep:
+    """Owns the shared block and the process pool for one optimisation run."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], workers: int, chunk: int, initial_balance: float):
+        self.shared = SharedArrays(arrays)
+        self.symbols = sorted({k.split("/")[0] for k in arrays})
+        self.chunk = chunk
+        self.initial_balance = initial_balance
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                        initargs=(self.shared.name, self.shared.spec))
+
+    def evaluate(self, jobs: List[Tuple[str, int, int, int, List[Dict[str, Any]]]]) -> pd.DataFrame:
+        """jobs: (symbol, window, start, end, combos). One row per (job, combo)."""
+        futures = []
+        for sym, window, start, end, combos in jobs:
+            for i in range(0, len(combos), self.chunk):
+                fut = self.pool.submit(_run_chunk, sym, start, end, combos[i:i + self.chunk], self.initial_balance)
+                futures.append((sym, window, start, end, fut))
+        rows = []
+        for sym, window, start, end, fut in futures:
+            for row in fut.result():
+                rows.append(dict(symbol=sym, window=window, start=pd.Timestamp(start, unit='s'),
+                                 end=pd.Timestamp(end, unit='s'), **row))
+        return pd.DataFrame(rows)
+
+    def close(self) -> None:
+        self.pool.shutdown()
+        self.shared.close()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Parallel parameter sweep / walk-forward for backtest.py")
+    ap.add_argument("--symbols", default=None, help="comma-separated (default: every pair in --split)")
+    ap.add_argument("--period", default="H4")
+    ap.add_argument("--split", default="testing")
+    ap.add_argument("--predictions", nargs="*", default=[], metavar="SYMBOL=CSV",
+                    help="predictions file per pair (default: code_to_cash_<symbol>_*predictions.csv)")
+    ap.add_argument("--grid", nargs="*", default=[], metavar="INPUT=V1,V2",
+                    help=f"override grid axes; default {DEFAULT_GRID}")
+    ap.add_argument("--walk-forward", action="store_true")
+    ap.add_argument("--train-months", type=int, default=12)
+    ap.add_argument("--test-months", type=int, default=3)
+    ap.add_argument("--rank-by", choices=RANK_BY, default="score")
+    ap.add_argument("--min-trades", type=int, default=10)
+    ap.add_argument("--balance", type=float, default=Settings().initial_balance)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk", type=int, default=32, help="combinations per task")
+    ap.add_argument("--top", type=int, default=5)
+    ap.add_argument("--out", default="sweep_results.csv", help="in-sample results table")
+    ap.add_argument("--wf-out", default="walk_forward.csv", help="out-of-sample table (--walk-forward)")
+    args = ap.parse_args()
+
+    if args.symbols:
+        symbols = [s for s in args.symbols.split(",") if s]
+    else:
+        symbols = sorted({os.path.basename(p).split("_")[0]
+                          for p in glob.glob(os.path.join(args.split, f"*_{args.period}_*.csv"))})
+    predictions = dict(item.split("=", 1) for item in args.predictions)
+    arrays = load_pairs(symbols, args.period, args.split, predictions)
+    if not arrays:
+        sys.exit("Nothing to sweep: no pair has both bars and predictions")
+    combos = expand_grid(parse_grid(args.grid))
+
+    sweep = Sweep(arrays, args.workers, args.chunk, args.balance)
+    t0 = time.perf_counter()
+    try:
+        windows: Dict[str, List[Tuple[int, int, int, int]]] = {}
+        for sym in sweep.symbols:
+            times = arrays[f"{sym}/time"]
+            first = max(int(times[0]), int(arrays[f"{sym}/pred_time"][0]))
+            if args.walk_forward:
+                windows[sym] = walk_forward_windows(times, first, args.train_months, args.test_months)
+            else:
+                windows[sym] = [(first, int(times[-1]) + 1, 0, 0)]
+        jobs = [(sym, w, a, b, combos) for sym, wins in windows.items() for w, (a, b, _, _) in enumerate(wins)]
+        n_runs = sum(len(j[4]) for j in jobs)
+        print(f"[Sweep] {len(sweep.symbols)} pairs x {len(combos)} combinations x "
+              f"{sum(map(len, windows.values()))} windows = {n_runs} backtests on {args.workers} workers")
+
+        results = rank(sweep.evaluate(jobs), args.rank_by, args.min_trades)
+        results.to_csv(args.out, index=False, float_format="%.6g")
+        print(f"[Sweep] {n_runs} backtests in {time.perf_counter() - t0:.1f}s -> {args.out}")
+
+        if args.walk_forward:
+            best = results.groupby(['symbol', 'window'], sort=False).head(1)
+            keys = list(combos[0])
+            oos_jobs = []
+            for row in best.itertuples(index=False):
+                _, _, c, d = windows[row.symbol][row.window]
+                oos_jobs.append((row.symbol, row.window, c, d, [{k: getattr(row, k) for k in keys}]))
+            oos = sweep.evaluate(oos_jobs)
+            oos.to_csv(args.wf_out, index=False, float_format="%.6g")
+            print(f"[Walk-forward] out-of-sample -> {args.wf_out}")
+            summary = oos.groupby('symbol').agg(windows=('window', 'size'), trades=('trades', 'sum'),
+                                                net_profit=('net_profit', 'sum'),
+                                                worst_dd_pct=('max_drawdown_pct', 'max'))
+            print(summary.to_string(float_format=lambda v: f"{v:,.2f}"))
+        else:
+            cols = ['symbol', *combos[0].keys(), *METRICS, 'score']
+            print(results.groupby('symbol').head(args.top)[cols].to_string(index=False, float_format=lambda v: f"{v:,.2f}"))
+    finally:
+        sweep.close()
+
+
+if __name__ == "__main__":
+    main()
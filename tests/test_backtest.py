@@ -0,0 +1,70 @@
+"""
+Hand-computed reference trades for backtest.run_backtest.
+
+Two days of hand-built H4 bars, point = 0.01, contract = 1, fixed 1.0 lot,
+RR = 2, HighLowBars = 3, window 08:00-20:00, no spread, quote-currency account.
+
+Day 1, buy at 08:00: prev highs 100.6/100.8, open 100.5 -> HH 100.8, LL = min(100.0, 100.2, 100.5) = 100.0
+    BuyStop 100.80, SL 100.00, TP 100.80 + 0.80*2 = 102.40
+    08:00 bar high 100.9 -> filled at 100.80; 12:00 bar high 102.5 -> TP 102.40, profit +1.60
+Day 2, sell at 08:00: HH = max(101.9, 101.7, 101.5) = 101.9, LL = min(101.2, 101.1, 101.5) = 101.1
+    SellStop 101.10, SL 101.90, TP 101.10 - 0.80*2 = 99.50
+    08:00 bar low 101.0 -> filled at 101.10; never reaches SL/TP, closed at 20:00 open 100.70, profit +0.40
+Day 2 again with break-even (ratio 1, lock 5): profit 0.80 needed -> low 100.20 in the 12:00 bar
+    moves SL to 101.05 from the 16:00 bar, whose high 101.2 stops it out: profit +0.05
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import Settings, run_backtest
+
+ROWS = [
+    # time                open    high    low     close
+    ("2024-01-01 00:00", 100.3, 100.6, 100.0, 100.4),
+    ("2024-01-01 04:00", 100.4, 100.8, 100.2, 100.5),
+    ("2024-01-01 08:00", 100.5, 100.9, 100.4, 100.8),
+    ("2024-01-01 12:00", 100.8, 102.5, 100.7, 102.0),
+    ("2024-01-01 16:00", 102.0, 102.1, 101.5, 101.6),
+    ("2024-01-01 20:00", 101.6, 101.8, 101.4, 101.7),
+    ("2024-01-02 00:00", 101.7, 101.9, 101.2, 101.3),
+    ("2024-01-02 04:00", 101.3, 101.7, 101.1, 101.5),
+    ("2024-01-02 08:00", 101.5, 101.6, 101.0, 101.2),
+    ("2024-01-02 12:00", 101.2, 101.3, 100.2, 100.6),
+    ("2024-01-02 16:00", 100.6, 101.2, 100.5, 100.8),
+    ("2024-01-02 20:00", 100.7, 100.9, 100.6, 100.8),
+]
+BASE = Settings(use_money_management=False, fixed_volume=1.0, high_low_bars=3, risk_to_reward=2.0,
+                point=0.01, contract_size=1.0, adjust_points=0, use_spread=False,
+                account_is_base=False, initial_balance=1000.0)
+
+# (settings, [(direction, entry, exit, reason, profit)])
+CASES = {
+    "plain": (BASE, [("buy", 100.80, 102.40, "tp", 1.60),
+                     ("sell", 101.10, 100.70, "session_end", 0.40)]),
+    "break_even": (BASE._replace(use_break_even=True, break_even_ratio=1, lock_profit=5),
+                   [("buy", 100.80, 102.40, "tp", 1.60),
+                    ("sell", 101.10, 101.05, "break_even", 0.05)]),
+}
+
+
+def _bars():
+    times = pd.to_datetime([r[0] for r in ROWS]).values.astype('datetime64[s]').astype(np.int64)
+    bars = {'time': times, 'spread': np.zeros(len(ROWS))}
+    for j, name in enumerate(('open', 'high', 'low', 'close'), start=1):
+        bars[name] = np.array([r[j] for r in ROWS])
+    return bars
+
+
+@pytest.mark.parametrize("case", list(CASES))
+def test_hand_computed_trades(case):
+    settings, want = CASES[case]
+    bars = _bars()
+    pred_t = bars['time'][[2, 8]]
+    pred_d = np.array([1, -1], np.int8)
+    tr = run_backtest(bars, pred_t, pred_d, settings).trades
+    assert list(tr['direction']) == [w[0] for w in want]
+    assert list(tr['exit_reason']) == [w[3] for w in want]
+    np.testing.assert_allclose(tr['entry_price'], [w[1] for w in want], atol=1e-9)
+    np.testing.assert_allclose(tr['exit_price'], [w[2] for w in want], atol=1e-9)
+    np.testing.assert_allclose(tr['profit'], [w[4] for w in want], atol=1e-9)
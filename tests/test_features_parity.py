@@ -0,0 +1,24 @@
+import glob
+import os
+
+import pytest
+
+from features import ENGINE_FEATS, check_parity, read_rates_csv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSVS = sorted(glob.glob(os.path.join(ROOT, "testing", "*_H4_*.csv")))
+WARMUP = 200
+
+
+@pytest.fixture(scope="module", params=CSVS, ids=lambda p: os.path.basename(p).split("_")[0])
+def stream_diff(request):
+    pytest.importorskip("pandas_ta")
+    return check_parity(read_rates_csv(request.param), ENGINE_FEATS, warmup=WARMUP)
+
+
+def test_csvs_bundled():
+    assert CSVS, "no testing/*_H4_*.csv"
+
+@pytest.mark.parametrize("column", ENGINE_FEATS)
+def test_streaming_engine_matches_pandas_ta(stream_diff, column):
+    assert stream_diff[column] < 1e-8
@@ -0,0 +1,93 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators as ind
+from features import AUX_SYMBOLS, CONSENSUS_FEATS, ENGINE_FEATS, check_kernel_parity, check_pairs_parity, read_rates_csv
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USDJPY = os.path.join(ROOT, "testing", "USDJPY_H4_202201030000_202505270800.csv")
+WARMUP = 200
+SMOOTHERS = ["ema(6)", "ema(12)", "ema(26)", "ema(42)", "rma(14)"]
+
+
+def _paths(close: np.ndarray):
+    """Closes as a stacked block sees them: clean, NaN-padded at the end, with gaps mid-series, both."""
+    T = len(close)
+    pad, gaps = slice(T - min(50, T // 4), T), [*range(T // 3, T // 3 + 5), T // 2, T // 2 + 60]
+    padded, gapped = close.copy(), close.copy()
+    padded[pad] = np.nan
+    gapped[gaps] = np.nan
+    both = gapped.copy()
+    both[pad] = np.nan
+    return {"clean": close, "padded": padded, "gapped": gapped, "padded_gapped": both}
+
+PATHS = _paths(read_rates_csv(USDJPY).sort_values("time")["close"].to_numpy(float))
+
+
+# ---- SciPy filters vs loops (Numba when installed): no pandas_ta needed
+@pytest.fixture(scope="module", params=list(PATHS))
+def path_diff(request):
+    return ind.path_parity(PATHS[request.param])
+
+@pytest.mark.parametrize("smoother", SMOOTHERS)
+def test_filter_matches_loop(path_diff, smoother):
+    assert path_diff[smoother] < 1e-8
+
+def _pandas_ema(x: np.ndarray, n: int) -> np.ndarray:
+    """pandas_ta.ema spelled out in pandas (first n values valid): SMA seed, then ewm(span=n, adjust=False)."""
+    s = pd.Series(x)
+    seeded = s.copy()
+    seeded.iloc[:n - 1] = np.nan
+    seeded.iloc[n - 1] = s.iloc[:n].mean()
+    return seeded.ewm(span=n, adjust=False).mean().to_numpy()
+
+@pytest.mark.parametrize("path", list(PATHS))
+@pytest.mark.parametrize("n", [6, 12, 26, 42])
+def test_ema_carries_over_nan_like_pandas(path, n):
+    x = PATHS[path]
+    ref = _pandas_ema(x, n)
+    for fn in (ind._ema_filter, ind._ema_loop):
+        got = np.empty((1, len(x)))
+        fn(x[None, :], n, got)
+        np.testing.assert_allclose(got[0], ref, rtol=0, atol=1e-8, equal_nan=True, err_msg=fn.__name__)
+
+@pytest.mark.parametrize("path", list(PATHS))
+def test_rma_carries_over_nan_like_pandas(path):
+    x = PATHS[path]
+    ref = pd.Series(x).ewm(alpha=1 / 14, min_periods=14).mean().to_numpy()
+    np.testing.assert_allclose(ind.rma(x, 14), ref, rtol=0, atol=1e-8, equal_nan=True)
+
+@pytest.mark.parametrize("path", list(PATHS))
+def test_numba_loops_match_python(path):
+    pytest.importorskip("numba")
+    if not ind.USE_NUMBA:
+        pytest.skip("CTC_NUMBA=0")
+    x = PATHS[path][None, :]
+    a, b = np.empty_like(x), np.empty_like(x)
+    ind._ema_loop(x, 26, a)
+    ind._ema_loop.py_func(x, 26, b)
+    np.testing.assert_allclose(a, b, rtol=0, atol=1e-10, equal_nan=True)
+    ind._ewm_loop(x, 1 / 14, True, 14, a)
+    ind._ewm_loop.py_func(x, 1 / 14, True, 14, b)
+    np.testing.assert_allclose(a, b, rtol=0, atol=1e-10, equal_nan=True)
+
+
+# ---- NumPy kernels vs pandas_ta, one case per model input
+@pytest.fixture(scope="module")
+def kernel_diff():
+    pytest.importorskip("pandas_ta")
+    return check_kernel_parity(read_rates_csv(USDJPY), ENGINE_FEATS, warmup=WARMUP)
+
+@pytest.fixture(scope="module")
+def pairs_diff():
+    pytest.importorskip("pandas_ta")
+    return check_pairs_parity("testing", "USDJPY", warmup=WARMUP)
+
+@pytest.mark.parametrize("column", CONSENSUS_FEATS)
+def test_kernels_match_pandas_ta(kernel_diff, pairs_diff, column):
+    if column not in AUX_SYMBOLS:
+        assert kernel_diff[column] < 1e-8      # compute_features on one pair
+    assert pairs_diff[column] < 1e-8           # compute_feature_block over every pair, or the aligned aux close
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from sklearn.preprocessing import MinMaxScaler, StandardScaler
+
+from numpy_model import NumpyMLP, from_keras, from_layers
+
+N_FEATURES = 20
+
+
+def _data(rows=500, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.normal(0, 1, (rows, N_FEATURES)) * rng.uniform(0.01, 100, N_FEATURES) + rng.normal(0, 50, N_FEATURES)
+
+def _keras_model():
+    tf = pytest.importorskip("tensorflow")
+    tf.keras.utils.set_random_seed(0)
+    model = tf.keras.Sequential([
+        tf.keras.Input(shape=(N_FEATURES,)),
+        tf.keras.layers.Dense(32, activation="relu"),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(16, activation="tanh"),
+        tf.keras.layers.Dropout(0.2),
+        tf.keras.layers.Dense(1, activation="sigmoid"),
+    ])
+    return model
+
+
+@pytest.mark.parametrize("scaler_cls", [MinMaxScaler, StandardScaler])
+def test_from_keras_matches_keras(scaler_cls, tmp_path):
+    model = _keras_model()
+    X = _data()
+    scaler = scaler_cls().fit(X)
+    mlp = from_keras(model, scaler)
+    mlp.save(str(tmp_path / "w.npz"))
+    ref = model.predict(scaler.transform(X), verbose=0).ravel()
+    got = NumpyMLP.load(str(tmp_path / "w.npz")).predict_proba(X)
+    assert np.max(np.abs(ref - got)) < 1e-5
+
+def test_from_keras_rejects_clipping_scaler():
+    model = _keras_model()
+    with pytest.raises(ValueError, match="clip"):
+        from_keras(model, MinMaxScaler(clip=True).fit(_data()))
+
+def test_from_layers_rejects_clipping_scaler():
+    rng = np.random.default_rng(1)
+    with pytest.raises(ValueError, match="clip"):
+        from_layers([rng.normal(size=(N_FEATURES, 1))], [np.zeros(1)], ["sigmoid"],
+                    MinMaxScaler(clip=True).fit(_data()))
+
+def test_folded_scaler_and_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    W = [rng.normal(size=(N_FEATURES, 8)), rng.normal(size=(8, 1))]
+    b = [rng.normal(size=8), rng.normal(size=1)]
+    X = _data()
+    scaler = StandardScaler().fit(X)
+    mlp = from_layers([w.copy() for w in W], [v.copy() for v in b], ["relu", "sigmoid"], scaler)
+    h = np.maximum(scaler.transform(X) @ W[0] + b[0], 0.0) @ W[1] + b[1]
+    ref = 1.0 / (1.0 + np.exp(-h.ravel()))
+    mlp.save(str(tmp_path / "w.npz"))
+    loaded = NumpyMLP.load(str(tmp_path / "w.npz"))
+    assert np.max(np.abs(loaded.predict_proba(X) - ref)) < 1e-9
+    assert loaded.model_id == mlp.model_id and len(loaded.model_id) == 12
+
+def test_check_features():
+    rng = np.random.default_rng(3)
+    cols = [f"f{i}" for i in range(N_FEATURES)]
+    mlp = from_layers([rng.normal(size=(N_FEATURES, 1))], [np.zeros(1)], ["sigmoid"], feature_names=cols)
+    mlp.check_features(cols)
+    with pytest.raises(ValueError, match="trained on"):
+        mlp.check_features(cols[::-1])
+    with pytest.raises(ValueError, match="features"):
+        mlp.check_features(cols[:-1])
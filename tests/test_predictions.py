@@ -0,0 +1,52 @@
+import os
+
+import numpy as np
+import pytest
+
+from features import AUX_SYMBOLS, CONSENSUS_FEATS
+from numpy_model import from_layers
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """The prediction server over the CSV replay, with a random NumPy model for CONSENSUS_FEATS."""
+    weights = str(tmp_path_factory.mktemp("model") / "weights.npz")
+    rng = np.random.default_rng(0)
+    from_layers([rng.normal(0, 0.1, (len(CONSENSUS_FEATS), 8)), rng.normal(0, 0.1, (8, 1))],
+                [np.zeros(8), np.zeros(1)], ["relu", "sigmoid"], feature_names=CONSENSUS_FEATS).save(weights)
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(REPO)          # the replay reads training/ and testing/ relative to the working directory
+        for key, value in {"CTC_DATA_SOURCE": "replay", "CTC_REPLAY_START": "2023-01-02", "CTC_METRICS_PORT": "0",
+                           "CTC_MODEL_BACKEND": "numpy", "CTC_WEIGHTS_PATH": weights}.items():
+            mp.setenv(key, value)
+        import send_ctc_v1_predictions as server
+        server.LOG_PREDICTIONS = False
+        yield server
+        server.market_data.close()
+
+
+def test_prediction_from_complete_row(server):
+    out, errors = server.compute_predictions(["USDJPY"], server.TIMEFRAME)
+    assert not errors
+    _, pred = out["USDJPY"]
+    assert pred.label in ("buy", "sell") and 0.0 <= pred.prob <= 1.0
+
+@pytest.mark.parametrize("missing", sorted(AUX_SYMBOLS))
+def test_missing_aux_close_holds(server, missing, monkeypatch):
+    # no fallback to the last complete row (the old build_X path): that would be a stale signal for a new bar
+    aux_close_values = server.market_data.aux_close_values
+
+    def first_row_without(*args):       # no `missing` bar at USDJPY's last closed bar time
+        aux = aux_close_values(*args)
+        aux[missing] = aux[missing].copy()
+        aux[missing][0] = np.nan
+        return aux
+
+    monkeypatch.setattr(server.market_data, "aux_close_values", first_row_without)
+    out, errors = server.compute_predictions(["USDJPY", "EURJPY"], server.TIMEFRAME)
+    assert not errors
+    held, other = out["USDJPY"][1], out["EURJPY"][1]
+    assert held.label == "hold" and np.isnan(held.prob)
+    assert other.label in ("buy", "sell")
@@ -0,0 +1,384 @@
+# Staged, cached walk-forward training pipeline (the notebook's training cells as a script)
+#   load -> features -> label -> select -> scale -> fit -> evaluate -> export
+#   python train_pipeline.py --symbols USDJPY --train-months 48 --test-months 12
+#   python train_pipeline.py --symbols USDJPY,EURJPY --final --export --workers 4
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MinMaxScaler
+
+from bar_store import CACHE_DIR
+from feature_matrix import build_feature_matrix
+from feature_ranking import combine, consensus_feats, pair_dataset, rf_importance, submit_mi
+from numpy_model import NumpyMLP, from_layers, keras_layers
+from sweep import walk_forward_windows
+
+
+PIPELINE_DIR = os.path.join(CACHE_DIR, "pipeline")
+STAGES = ['load', 'features', 'label', 'select', 'scale', 'fit', 'evaluate', 'export']
+
+
+class Params(NamedTuple):
+    """Everything below ``top`` only feeds the fit stage (the notebook's build_best + EarlyStopping)."""
+    horizon: int = 1                 # label: close higher after N bars
+    features: Tuple[str, ...] = ()   # fixed feature list; empty = rank per fold (MI + RF consensus)
+    top: int = 20
+    rank_sample: Optional[int] = None
+    hidden: Tuple[int, ...] = (64, 64)
+    dropout: float = 0.0
+    l2: float = 0.0
+    lr: float = 1e-3
+    epochs: int = 100
+    batch: int = 64
+    patience: int = 10
+    val_fraction: float = 0.2        # chronological tail of the training window
+    seed: int = 42
+    backend: str = "auto"            # "keras", "sklearn" or "auto" (keras when TensorFlow imports)
+
+FIT_FIELDS = ('hidden', 'dropout', 'l2', 'lr', 'epochs', 'batch', 'patience', 'val_fraction', 'seed', 'backend')
+
+
+# ===========================
+# Stage cache
+# ===========================
+def stage_key(stage: str, *parts: Any) -> str:
+    """Content key of a stage: its name, its parameters and the keys of its inputs."""
+    return hashlib.sha1(json.dumps([stage, *parts], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def load_stage(stage: str, key: str) -> Any:
+    with open(os.path.join(PIPELINE_DIR, stage, f"{key}.pkl"), 'rb') as f:
+        return pickle.load(f)
+
+def cached(stage: str, key: str, compute: Callable[[], Any], log: Optional[List[str]] = None) -> Any:
+    """Return the pickled result of ``stage`` for ``key``, computing and storing it on a miss."""
+    path = os.path.join(PIPELINE_DIR, stage, f"{key}.pkl")
+    if os.path.exists(path):
+        return load_stage(stage, key)
+    value = compute()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    if log is not None:
+        log.append(stage)
+    return value
+
+
+# ===========================
+# Stages
+# ===========================
+def stage_features(symbols: List[str], period: str, root: str) -> Dict[str, Any]:
+    """load + features: bar_store / feature_matrix already cache both by content hash."""
+    return {split: build_feature_matrix(symbols, split=split, period=period, root=root)
+            for split in ("training", "testing")}
+
+def stage_label(fms: Dict[str, Any], symbol: str, horizon: int) -> Tuple[str, Dict[str, Any]]:
+    """X / y / bar times of one pair over training/ then testing/ (rows in time order)."""
+    key = stage_key('label', [fm.key for fm in fms.values()], symbol, horizon)
+
+    def compute():
+        parts, ys = [], []
+        for fm in fms.values():
+            X, y = pair_dataset(fm, symbol, horizon)
+            if parts:
+                newer = np.asarray(X.index > parts[-1].index[-1])
+                X, y = X[newer], y[newer]
+            parts.append(X)
+            ys.append(y)
+        X = pd.concat(parts)
+        return {"X": X.to_numpy(float), "y": np.concatenate(ys), "columns": list(X.columns),
+                "times": X.index.values.astype('datetime64[s]').astype(np.int64)}
+    return key, cached('label', key, compute)
+
+def _window(times: np.ndarray, lo: int, hi: int, trim: int = 0) -> np.ndarray:
+    i0, i1 = np.searchsorted(times, [lo, hi])
+    return np.arange(i0, max(i0, i1 - trim))
+
+def stage_select(label_key: str, data: Dict[str, Any], train: np.ndarray, p: Params,
+                 threads: int, log: List[str]) -> Tuple[str, List[str]]:
+    if p.features:
+        return stage_key('select', list(p.features)), list(p.features)
+    key = stage_key('select', label_key, int(train[0]), int(train[-1]), p.horizon, p.top, p.rank_sample, p.seed)
+
+    def compute():
+        X, y = data["X"][train], data["y"][train]
+        with ThreadPoolExecutor(threads) as pool:
+            collect = submit_mi(pool, X, y, p.rank_sample, 1, p.seed, chunk=8)
+            rf = rf_importance(X, y, 200, p.rank_sample, p.seed, threads)
+            mi, mi_std = collect()
+        return consensus_feats(combine(data["columns"], mi, mi_std, rf, 1), p.top)
+    return key, cached('select', key, compute, log)
+
+def stage_scale(label_key: str, select_key: str, data: Dict[str, Any], train: np.ndarray,
+                cols: List[int], log: List[str]) -> Tuple[str, MinMaxScaler]:
+    key = stage_key('scale', label_key, select_key, int(train[0]), int(train[-1]))
+    return key, cached('scale', key, lambda: MinMaxScaler().fit(data["X"][np.ix_(train, cols)]), log)
+
+def _fit_keras(Xs: np.ndarray, y: np.ndarray, p: Params, threads: int):
+    import tensorflow as tf
+    from tensorflow.keras import Input, Sequential
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.layers import Dense, Dropout
+    from tensorflow.keras.optimizers import Adam
+    from tensorflow.keras.regularizers import l2
+
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    except RuntimeError:                # already initialised in this worker
+        pass
+    tf.keras.utils.set_random_seed(p.seed)
+    reg = l2(p.l2) if p.l2 else None
+    layers: List[Any] = [Input(shape=(Xs.shape[1],))]
+    for units in p.hidden:
+        layers += [Dense(units, activation='relu', kernel_regularizer=reg), Dropout(p.dropout)]
+    layers.append(Dense(1, activation='sigmoid', kernel_regularizer=reg))
+    model = Sequential(layers)
+    model.compile(optimizer=Adam(p.lr), loss='binary_crossentropy', metrics=['accuracy'])
+
+    n_val = int(len(y) * p.val_fraction)
+    es = EarlyStopping('val_loss', patience=p.patience, restore_best_weights=True)
+    hist = model.fit(Xs[:-n_val], y[:-n_val], validation_data=(Xs[-n_val:], y[-n_val:]),
+                     epochs=p.epochs, batch_size=p.batch, callbacks=[es], verbose=0)
+    return model, keras_layers(model), len(hist.history['loss'])
+
+def _fit_sklearn(Xs: np.ndarray, y: np.ndarray, p: Params):
+    # sklearn's MLP has no dropout, and its early-stopping split is random rather than chronological
+    from sklearn.neural_network import MLPClassifier
+    mlp = MLPClassifier(hidden_layer_sizes=p.hidden, activation='relu', solver='adam', alpha=p.l2,
+                        learning_rate_init=p.lr, batch_size=p.batch, max_iter=p.epochs,
+                        early_stopping=True, validation_fraction=p.val_fraction,
+                        n_iter_no_change=p.patience, random_state=p.seed)
+    mlp.fit(Xs, y)
+    acts = ['relu'] * len(p.hidden) + ['sigmoid']
+    return (list(mlp.coefs_), list(mlp.intercepts_), acts), mlp.n_iter_
+
+def resolve_backend(backend: str) -> str:
+    if backend != "auto":
+        return backend
+    try:
+        import tensorflow  # noqa: F401
+        return "keras"
+    except ImportError:
+        return "sklearn"
+
+def stage_fit(scale_key: str, data: Dict[str, Any], train: np.ndarray, cols: List[int], scaler: MinMaxScaler,
+              p: Params, threads: int, log: List[str]) -> Tuple[str, Dict[str, Any]]:
+    backend = resolve_backend(p.backend)
+    key = stage_key('fit', scale_key, {f: getattr(p, f) for f in FIT_FIELDS}, backend)
+
+    def compute():
+        Xs = scaler.transform(data["X"][np.ix_(train, cols)])
+        y = data["y"][train]
+        t0 = time.perf_counter()
+        if backend == "keras":
+            model, layers, epochs = _fit_keras(Xs, y, p, threads)
+            model.save(os.path.join(PIPELINE_DIR, "fit", f"{key}.keras"))
+        else:
+            layers, epochs = _fit_sklearn(Xs, y, p)
+        return {"layers": layers, "backend": backend, "epochs": int(epochs),
+                "seconds": time.perf_counter() - t0}
+    os.makedirs(os.path.join(PIPELINE_DIR, "fit"), exist_ok=True)
+    return key, cached('fit', key, compute, log)
+
+def fold_metrics(prob: np.ndarray, y: np.ndarray) -> Dict[str, float]:
+    pred = (prob > 0.5).astype(int)
+    pc = np.clip(prob, 1e-7, 1 - 1e-7)
+    tp = int(((pred == 1) & (y == 1)).sum())
+    return {"rows": int(len(y)),
+            "accuracy": float((pred == y).mean()) if len(y) else np.nan,
+            "loss": float(-np.mean(y * np.log(pc) + (1 - y) * np.log(1 - pc))) if len(y) else np.nan,
+            "precision": tp / max(int(pred.sum()), 1),
+            "recall": tp / max(int(y.sum()), 1),
+            "buy_share": float(pred.mean()) if len(y) else np.nan}
+
+def stage_evaluate(fit_key: str, data: Dict[str, Any], test: np.ndarray, cols: List[int], mlp: NumpyMLP,
+                   log: List[str]) -> Dict[str, Any]:
+    key = stage_key('evaluate', fit_key, int(test[0]), int(test[-1]))
+
+    def compute():
+        prob = mlp.predict_proba(data["X"][np.ix_(test, cols)])
+        return {"metrics": fold_metrics(prob, data["y"][test]), "times": data["times"][test],
+                "prob": prob, "y": data["y"][test]}
+    return cached('evaluate', key, compute, log)
+
+
+# ===========================
+# Fold worker
+# ===========================
+_THREADS = 1
+
+def _init_worker(threads: int) -> None:
+    """Cap BLAS / OpenMP pools so that workers x threads stays within the machine."""
+    global _THREADS
+    _THREADS = threads
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+
+def run_fold(symbol: str, fold: str, window: Tuple[int, int, int, int], label_key: str,
+             p: Params) -> Dict[str, Any]:
+    """select -> scale -> fit -> evaluate for one (pair, fold); every stage hits the cache when it can."""
+    t0 = time.perf_counter()
+    log: List[str] = []
+    data = load_stage('label', label_key)          # written by the parent before the folds start
+    train = _window(data["times"], window[0], window[1], trim=p.horizon)
+    test = _window(data["times"], window[2], window[3])
+    if len(train) < 100 or len(test) == 0:
+        raise RuntimeError(f"{symbol} {fold}: {len(train)} train / {len(test)} test rows")
+
+    select_key, feats = stage_select(label_key, data, train, p, _THREADS, log)
+    missing = [f for f in feats if f not in data["columns"]]
+    if missing:
+        raise RuntimeError(f"Unknown features for {symbol}: {missing}")
+    cols = [data["columns"].index(f) for f in feats]
+    scale_key, scaler = stage_scale(label_key, select_key, data, train, cols, log)
+    fit_key, fit = stage_fit(scale_key, data, train, cols, scaler, p, _THREADS, log)
+    mlp = from_layers(*fit["layers"], scaler, feats)
+    ev = stage_evaluate(fit_key, data, test, cols, mlp, log)
+    return {"symbol": symbol, "fold": fold, "window": window, "features": feats, "fit_key": fit_key,
+            "backend": fit["backend"], "epochs": fit["epochs"], "scaler": scaler, "mlp": mlp,
+            "evaluation": ev, "computed": log, "seconds": time.perf_counter() - t0}
+
+
+# ===========================
+# Export
+# ===========================
+def export(result: Dict[str, Any], prefix: str) -> List[str]:
+    """The notebook's artifacts: _model.keras (keras backend), _scaler.pkl, _weights.npz, _predictions.csv/.txt."""
+    written = []
+    keras_path = os.path.join(PIPELINE_DIR, "fit", f"{result['fit_key']}.keras")
+    if result["backend"] == "keras" and os.path.exists(keras_path):
+        shutil.copyfile(keras_path, f"{prefix}_model.keras")
+        written.append(f"{prefix}_model.keras")
+    with open(f"{prefix}_scaler.pkl", 'wb') as f:
+        pickle.dump(result["scaler"], f)
+    result["mlp"].save(f"{prefix}_weights.npz")
+    written += [f"{prefix}_scaler.pkl", f"{prefix}_weights.npz"]
+
+    ev = result["evaluation"]
+    df = pd.DataFrame({"timestamp": pd.to_datetime(ev["times"], unit='s'),
+                       "prediction": np.where(ev["prob"] > 0.5, 'buy', 'sell'),
+                       "true_label": np.where(ev["y"] == 1, 'buy', 'sell')})
+    # as in the notebook: the prediction made on bar t is traded on bar t+1
+    df['prediction'] = df['prediction'].shift(1)
+    df = df.dropna(subset=['prediction']).reset_index(drop=True)
+    df.to_csv(f"{prefix}_predictions.csv", index=False)
+    with open(f"{prefix}_predictions.txt", 'w') as f:
+        f.write("datetime times[] = { " + ", ".join(
+            f"D'{ts.strftime('%Y.%m.%d %H:%M:%S')}'" for ts in df['timestamp']) + " };\n\n")
+        f.write("string predictions[] = { " + ", ".join(f'"{v}"' for v in df['prediction']) + " };\n\n")
+        f.write("string true_labels[] = { " + ", ".join(f'"{v}"' for v in df['true_label']) + " };\n")
+    return written + [f"{prefix}_predictions.csv", f"{prefix}_predictions.txt"]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Walk-forward training pipeline with cached stages")
+    ap.add_argument("--symbols", default="USDJPY")
+    ap.add_argument("--period", default="H4")
+    ap.add_argument("--root", default=".")
+    ap.add_argument("--train-months", type=int, default=48)
+    ap.add_argument("--test-months", type=int, default=12)
+    ap.add_argument("--final", action="store_true", help="also train on all of training/ and test on testing/")
+    ap.add_argument("--export", action="store_true", help="write the final fold's model artifacts")
+    ap.add_argument("--prefix", default="code_to_cash_{pair}_{period}_{date}",
+                    help="artifact prefix ({pair}, {period}, {date} = dd-mm-yy)")
+    ap.add_argument("--features", default="", help="comma-separated fixed features (default: rank per fold)")
+    defaults = Params()
+    ap.add_argument("--top", type=int, default=defaults.top)
+    ap.add_argument("--rank-sample", type=int, default=defaults.rank_sample)
+    ap.add_argument("--horizon", type=int, default=defaults.horizon)
+    ap.add_argument("--hidden", default=",".join(map(str, defaults.hidden)))
+    ap.add_argument("--dropout", type=float, default=defaults.dropout)
+    ap.add_argument("--l2", type=float, default=defaults.l2)
+    ap.add_argument("--lr", type=float, default=defaults.lr)
+    ap.add_argument("--epochs", type=int, default=defaults.epochs)
+    ap.add_argument("--batch", type=int, default=defaults.batch)
+    ap.add_argument("--patience", type=int, default=defaults.patience)
+    ap.add_argument("--val-fraction", type=float, default=defaults.val_fraction)
+    ap.add_argument("--seed", type=int, default=defaults.seed)
+    ap.add_argument("--backend", default=defaults.backend, choices=["auto", "keras", "sklearn"])
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--threads", type=int, default=None, help="BLAS/TF threads per worker (default cores / workers)")
+    ap.add_argument("--out", default=None, help="CSV of per-fold metrics")
+    args = ap.parse_args()
+    if args.export and not args.final:
+        sys.exit("--export needs --final")
+
+    p = Params(horizon=args.horizon, features=tuple(f for f in args.features.split(",") if f), top=args.top,
+               rank_sample=args.rank_sample, hidden=tuple(int(h) for h in args.hidden.split(",") if h),
+               dropout=args.dropout, l2=args.l2, lr=args.lr, epochs=args.epochs, batch=args.batch,
+               patience=args.patience, val_fraction=args.val_fraction, seed=args.seed, backend=args.backend)
+    symbols = [s for s in args.symbols.split(",") if s]
+    workers = max(args.workers, 1)
+    threads = args.threads or max((os.cpu_count() or 1) // workers, 1)
+
+    t0 = time.perf_counter()
+    fms = stage_features(symbols, args.period, args.root)
+    jobs = []
+    for sym in symbols:
+        if sym not in fms["training"].symbols or sym not in fms["testing"].symbols:
+            sys.exit(f"No training/testing {args.period} CSVs for {sym}")
+        label_key, data = stage_label(fms, sym, p.horizon)
+        times = data["times"]
+        test_start = int(fms["testing"].pair(sym)[0][0])
+        in_training = times[times < test_start]
+        for i, w in enumerate(walk_forward_windows(in_training, int(in_training[0]),
+                                                   args.train_months, args.test_months)):
+            jobs.append((sym, f"wf{i:02d}", w, label_key))
+        if args.final:
+            jobs.append((sym, "final", (int(times[0]), test_start, test_start, int(times[-1]) + 1), label_key))
+    print(f"[Pipeline] load+features+label for {len(symbols)} pairs in {time.perf_counter() - t0:.2f}s; "
+          f"{len(jobs)} folds on {workers} workers x {threads} threads ({resolve_backend(p.backend)} backend)")
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        futures = [pool.submit(run_fold, sym, fold, w, key, p) for sym, fold, w, key in jobs]
+        results = [f.result() for f in futures]
+
+    rows = []
+    for r in results:
+        w = r["window"]
+        rows.append({"symbol": r["symbol"], "fold": r["fold"],
+                     "train_start": pd.Timestamp(w[0], unit='s'), "test_start": pd.Timestamp(w[2], unit='s'),
+                     "test_end": pd.Timestamp(w[3], unit='s'), **r["evaluation"]["metrics"],
+                     "epochs": r["epochs"], "recomputed": "+".join(r["computed"]) or "-",
+                     "seconds": round(r["seconds"], 2), "features": ",".join(r["features"])})
+    table = pd.DataFrame(rows)
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(table.drop(columns=["features", "train_start"]).to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    wf = table[table["fold"] != "final"]
+    if len(wf):
+        print("\n[Pipeline] walk-forward mean accuracy: " + ", ".join(
+            f"{s} {g['accuracy'].mean():.4f}" for s, g in wf.groupby("symbol")))
+    if args.out:
+        table.to_csv(args.out, index=False)
+        print(f"[Pipeline] Wrote {args.out}")
+
+    if args.export:
+        for r in results:
+            if r["fold"] != "final":
+                continue
+            prefix = args.prefix.format(pair=r["symbol"].lower(), period=args.period.lower(),
+                                        date=pd.Timestamp.now().strftime('%d-%m-%y'))
+            for path in export(r, prefix):
+                print(f"[Pipeline] Wrote {path}")
+    print(f"[Pipeline] done in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# ROUTER + worker-pool front end for the prediction server
+import sys
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import zmq
+
+
+class RouterServer:
+    """
+    Multi-client replacement for a single REP loop.
+
+    Speaks the same wire protocol to REQ clients (one string in, one string out):
+    a ROUTER socket keeps each client's envelope, requests run on a bounded
+    thread pool, identical in-flight requests (same ``coalesce_key``) share one
+    computation, and a waiter that is not answered within ``timeout_secs`` gets
+    an ``ERROR:TimeoutError:...`` reply so its REQ socket stays usable.
+
+    With a ``metrics`` object (anything with ``observe(stage, secs)``) it also
+    times the front end: ``zmq.recv`` (decode + dispatch), ``zmq.queue`` (wait
+    for a free worker), ``zmq.send`` and ``zmq.request`` (receive to last reply).
+    """
+
+    def __init__(self,
+                 ctx: zmq.Context,
+                 endpoint: str,
+                 handle: Callable[[str], str],
+                 coalesce_key: Callable[[str], Optional[Hashable]],
+                 workers: int = 4,
+                 timeout_secs: float = 10.0,
+                 max_inflight: int = 64,
+                 metrics: Optional[Any] = None):
+        self.ctx = ctx
+        self.endpoint = endpoint
+        self.handle = handle
+        self.coalesce_key = coalesce_key
+        self.timeout_secs = timeout_secs
+        self.max_inflight = max_inflight
+        self.metrics = metrics
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="predict-worker")
+        self._done_endpoint = f"inproc://ctc-done-{id(self)}"
+        self._local = threading.local()
+        self._stopped = threading.Event()
+        # key -> list of (envelope, deadline, received_at)
+        self._inflight: Dict[Hashable, List[Tuple[List[bytes], float, float]]] = {}
+        self._seq = itertools.count()
+        self._queue_lock = threading.Lock()
+        self.queued = 0     # submitted to the pool, not yet picked up by a worker
+        self.running = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.rejected = 0
+
+    # ---- worker side ----
+    def _observe(self, stage: str, secs: float) -> None:
+        if self.metrics is not None:
+            self.metrics.observe(stage, secs)
+
+    def _run(self, key: Hashable, msg: str, submitted: float) -> None:
+        with self._queue_lock:
+            self.queued -= 1
+            self.running += 1
+        self._observe("zmq.queue", time.perf_counter() - submitted)
+        try:
+            reply = self.handle(msg)
+        except Exception as e:
+            reply = f"ERROR:{type(e).__name__}:{e}"
+        finally:
+            with self._queue_lock:
+                self.running -= 1
+        push = getattr(self._local, "push", None)
+        if push is None:
+            push = self.ctx.socket(zmq.PUSH)
+            push.setsockopt(zmq.LINGER, 0)
+            push.connect(self._done_endpoint)
+            self._local.push = push
+        push.send_pyobj((key, reply))
+
+    # ---- front end ----
+    def _reply(self, router: zmq.Socket, envelope: List[bytes], reply: str,
+               received: Optional[float] = None) -> None:
+        t0 = time.perf_counter()
+        router.send_multipart(envelope + [reply.encode("utf-8")])
+        if self.metrics is not None:
+            t1 = time.perf_counter()
+            self.metrics.observe("zmq.send", t1 - t0)
+            if received is not None:
+                self.metrics.observe("zmq.request", t1 - received)
+
+    def _accept(self, router: zmq.Socket, frames: List[bytes]) -> None:
+        received = time.perf_counter()
+        envelope, body = frames[:-1], frames[-1]
+        msg = body.decode("utf-8", errors="ignore")
+        key = self.coalesce_key(msg)
+        if key is None:
+            key = ("_uncoalesced", next(self._seq))
+        waiter = (envelope, time.monotonic() + self.timeout_secs, received)
+
+        waiters = self._inflight.get(key)
+        if waiters is not None:
+            waiters.append(waiter)
+            self.coalesced += 1
+            return
+        if len(self._inflight) >= self.max_inflight:
+            self.rejected += 1
+            self._reply(router, envelope, "ERROR:Busy:too many requests in flight", received)
+            return
+        self._inflight[key] = [waiter]
+        with self._queue_lock:
+            self.queued += 1
+        self._pool.submit(self._run, key, msg, time.perf_counter())
+        self._observe("zmq.recv", time.perf_counter() - received)
+
+    def _expire(self, router: zmq.Socket) -> None:
+        now = time.monotonic()
+        for key, waiters in self._inflight.items():
+            if all(d > now for _, d, _ in waiters):
+                continue
+            alive = []
+            for envelope, deadline, received in waiters:
+                if deadline <= now:
+                    self.timeouts += 1
+                    self._reply(router, envelope,
+                                f"ERROR:TimeoutError:no result within {self.timeout_secs:g}s", received)
+                else:
+                    alive.append((envelope, deadline, received))
+            # keep the key (possibly with no waiters) so late duplicates still join the running job
+            self._inflight[key] = alive
+
+    def _next_timeout_ms(self) -> int:
+        deadlines = [d for waiters in self._inflight.values() for _, d, _ in waiters]
+        if not deadlines:
+            return 1000
+        return max(0, min(1000, int((min(deadlines) - time.monotonic()) * 1000) + 1))
+
+    def serve_forever(self) -> None:
+        router = self.ctx.socket(zmq.ROUTER)
+        router.setsockopt(zmq.LINGER, 0)
+        router.bind(self.endpoint)
+        done = self.ctx.socket(zmq.PULL)
+        done.setsockopt(zmq.LINGER, 0)
+        done.bind(self._done_endpoint)
+
+        poller = zmq.Poller()
+        poller.register(router, zmq.POLLIN)
+        poller.register(done, zmq.POLLIN)
+
+        try:
+            while not self._stopped.is_set():
+                events = dict(poller.poll(self._next_timeout_ms()))
+
+                if done in events:
+                    while True:
+                        try:
+                            key, reply = done.recv_pyobj(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        for envelope, _, received in self._inflight.pop(key, []):
+                            self._reply(router, envelope, reply, received)
+
+                if router in events:
+                    while True:
+                        try:
+                            frames = router.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        try:
+                            self._accept(router, frames)
+                        except Exception as e:
+                            print(f"[ZMQ] Accept error: {e}", file=sys.stderr)
+
+                self._expire(router)
+        except zmq.ContextTerminated:
+            pass
+        finally:
+            self._pool.shutdown(wait=False)
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "inflight": len(self._inflight),
+            "queued": self.queued,
+            "running": self.running,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+        }